@@ -0,0 +1,81 @@
+"""
+Compare the size and the compression/decompression time of the bodies of representative large messages sent by
+the transports (see the compression_threshold and compression keys of the STOMP transports): a RAG response
+with its sources, a chain of verification transcript and a merged chat history. zstd is measured only if the
+zstandard package is installed.
+
+Usage:
+    python benchmarks/compression_benchmark.py [--iterations 200]
+"""
+import argparse
+import json
+import random
+import timeit
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+from wiseagents.transports.wire_format import (ZLIB_COMPRESSION, ZSTD_COMPRESSION, compress_body, decompress_body,
+                                               encode_message)
+
+WORDS = ("the agent retrieves documents from the vector database and answers the question using the context "
+         "provided by the sources weather forecast Rome sunny temperature humidity wind pressure model "
+         "verification plan baseline response revised answer chunk similarity score metadata").split()
+
+
+def _paragraph(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def rag_response(rnd: random.Random) -> str:
+    '''An answer followed by the 20 chunks retrieved, as sent by a RAG agent with include_sources.'''
+    sources = "\n".join(f"Source {i} (score {rnd.random():.4f}, doc-{rnd.randint(0, 9999)}.pdf): "
+                        f"{_paragraph(rnd, 150)}" for i in range(20))
+    return f"Answer: {_paragraph(rnd, 120)}\n\nSources:\n{sources}"
+
+
+def cove_transcript(rnd: random.Random) -> str:
+    '''A chain of verification transcript: baseline response, verification questions and answers, final answer.'''
+    steps = [f"Baseline response: {_paragraph(rnd, 200)}"]
+    for i in range(15):
+        steps.append(f"Verification question {i}: {_paragraph(rnd, 20)}")
+        steps.append(f"Verification answer {i}: {_paragraph(rnd, 120)}")
+    steps.append(f"Revised response: {_paragraph(rnd, 200)}")
+    return "\n".join(steps)
+
+
+def chat_history(rnd: random.Random) -> str:
+    '''A chat history of 60 messages merged from a sub context, as JSON.'''
+    return json.dumps([{"role": "user" if i % 2 == 0 else "assistant", "content": _paragraph(rnd, 80)}
+                       for i in range(60)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compression of the bodies of large messages")
+    parser.add_argument("--iterations", type=int, default=200, help="number of iterations for each measure")
+    args = parser.parse_args()
+    compressions = [ZLIB_COMPRESSION]
+    try:
+        import zstandard  # noqa: F401
+        compressions.append(ZSTD_COMPRESSION)
+    except ImportError:
+        print("zstandard is not installed, skipping zstd")
+    rnd = random.Random(42)
+    payloads = {"rag response": rag_response(rnd), "cove transcript": cove_transcript(rnd),
+                "chat history": chat_history(rnd)}
+    print(f"{'payload':<18}{'compression':<14}{'bytes':>10}{'ratio':>8}{'compress us':>14}{'decompress us':>16}")
+    for name, text in payloads.items():
+        message = WiseAgentMessage(message=text, context_name="Rag_1234", sender="RAGAgent",
+                                   message_type=WiseAgentMessageType.RESPONSE, route_response_to="Client")
+        body, _ = encode_message(message)
+        size = len(body.encode("utf-8"))
+        print(f"{name:<18}{'none':<14}{size:>10}{1:>8.1f}{0:>14.1f}{0:>16.1f}")
+        for compression in compressions:
+            compressed, content_encoding = compress_body(body, 0, compression)
+            compress_time = timeit.timeit(lambda: compress_body(body, 0, compression), number=args.iterations)
+            decompress_time = timeit.timeit(lambda: decompress_body(compressed, content_encoding),
+                                            number=args.iterations)
+            print(f"{name:<18}{compression:<14}{len(compressed):>10}{size / len(compressed):>8.1f}"
+                  f"{compress_time / args.iterations * 1e6:>14.1f}{decompress_time / args.iterations * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare the context stores (see the context_store key of registry_config.yaml) on the operations made by the
+agents at every hop: appending a chat completion message, reading the chat history and moving a phased
+coordinator to the next phase once all the agents of the current phase have responded.
+
+The memory and sqlite stores are always measured, the sqlite database being created in a temporary directory.
+The redis store is measured only if --redis-host is given.
+
+Usage:
+    python benchmarks/context_store_benchmark.py [--messages 200] [--phases 50] [--agents 5] [--redis-host localhost] [--redis-port 6379]
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from wiseagents import WiseAgentRegistry
+
+
+def use_store(config: dict):
+    """Make the registry use a new store created with the given configuration."""
+    if WiseAgentRegistry.context_store is not None:
+        WiseAgentRegistry.context_store.close()
+    WiseAgentRegistry.config = config
+    WiseAgentRegistry.context_store = None
+    WiseAgentRegistry.get_config()
+
+
+def benchmark_append(messages: int) -> float:
+    context = WiseAgentRegistry.create_context(f"benchmark-{uuid.uuid4()}")
+    started = time.perf_counter()
+    for i in range(messages):
+        context.append_chat_completion({"role": "user", "content": f"What is the weather like in city number {i}?"})
+    elapsed = time.perf_counter() - started
+    WiseAgentRegistry.remove_context(context.name)
+    return elapsed / messages
+
+
+def benchmark_read(messages: int, reads: int) -> float:
+    context = WiseAgentRegistry.create_context(f"benchmark-{uuid.uuid4()}")
+    for i in range(messages):
+        context.append_chat_completion({"role": "user", "content": f"What is the weather like in city number {i}?"})
+    started = time.perf_counter()
+    for _ in range(reads):
+        # fetch the context again as an agent handling a request does
+        WiseAgentRegistry.get_context(context.name).llm_chat_completion
+    elapsed = time.perf_counter() - started
+    WiseAgentRegistry.remove_context(context.name)
+    return elapsed / reads
+
+
+def benchmark_phase_transition(phases: int, agents: int) -> float:
+    context = WiseAgentRegistry.create_context(f"benchmark-{uuid.uuid4()}")
+    context.set_agent_phase_assignments([[f"Agent{phase}-{i}" for i in range(agents)] for phase in range(phases)])
+    context.set_current_phase(0)
+    started = time.perf_counter()
+    for phase in range(phases):
+        for i in range(agents):
+            if context.remove_required_agent_for_current_phase(f"Agent{phase}-{i}") == 0:
+                context.get_agents_for_next_phase()
+    elapsed = time.perf_counter() - started
+    WiseAgentRegistry.remove_context(context.name)
+    return elapsed / phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the context stores")
+    parser.add_argument("--messages", type=int, default=200, help="number of chat completion messages")
+    parser.add_argument("--reads", type=int, default=200, help="number of reads of the chat history")
+    parser.add_argument("--phases", type=int, default=50, help="number of phases")
+    parser.add_argument("--agents", type=int, default=5, help="number of agents in each phase")
+    parser.add_argument("--redis-host", default=None, help="the redis host, the redis store is skipped if not set")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        configs = [("memory", {"context_store": "memory"}),
+                   ("sqlite", {"context_store": "sqlite", "sqlite_path": os.path.join(directory, "context_store.db")})]
+        if args.redis_host is not None:
+            configs.append(("redis", {"context_store": "redis", "redis_host": args.redis_host,
+                                      "redis_port": args.redis_port}))
+        print(f"{args.messages} messages, {args.reads} reads, {args.phases} phases of {args.agents} agents")
+        print(f"{'store':<10}{'append us':>12}{'read us':>12}{'phase us':>12}")
+        for name, config in configs:
+            use_store(config)
+            append_time = benchmark_append(args.messages)
+            read_time = benchmark_read(args.messages, args.reads)
+            phase_time = benchmark_phase_transition(args.phases, args.agents)
+            print(f"{name:<10}{append_time * 1e6:>12.1f}{read_time * 1e6:>12.1f}{phase_time * 1e6:>12.1f}")
+        WiseAgentRegistry.context_store.close()
+
+
+if __name__ == "__main__":
+    main()
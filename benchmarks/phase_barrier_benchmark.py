@@ -0,0 +1,114 @@
+"""
+Measure the contention on the list of agents required for the current phase when all the agents of a phase
+send their response to a phased coordinator at the same time.
+
+The legacy strategy stores the list pickled in the context hash and removes an agent with an optimistic
+WATCH/MULTI loop, followed by a second read to check whether the phase is complete. The atomic strategy is
+WiseAgentContext.remove_required_agent_for_current_phase, which removes the agent from a redis list and
+returns the number of remaining agents in a single MULTI. For each strategy the benchmark reports the
+WatchError retries, the time taken and how many responses saw the phase as complete, which must be 1.
+
+Requires a redis server.
+
+Usage:
+    python benchmarks/phase_barrier_benchmark.py [--agents 12] [--rounds 50] [--redis-host localhost] [--redis-port 6379]
+"""
+import argparse
+import pickle
+import threading
+import time
+import uuid
+
+import redis
+
+from wiseagents import WiseAgentRegistry
+
+
+def legacy_remove(redis_db: redis.Redis, context_name: str, agent_name: str, retries: list) -> int:
+    """Remove the agent with a WATCH loop over the pickled list, then read the list again to count the remaining agents."""
+    pipe = redis_db.pipeline(transaction=True)
+    while True:
+        pipe.watch(context_name)
+        try:
+            stored_agents = pickle.loads(pipe.hget(context_name, "required_agents_for_current_phase"))
+            stored_agents.remove(agent_name)
+            pipe.multi()
+            pipe.hset(context_name, "required_agents_for_current_phase", value=pickle.dumps(stored_agents))
+            pipe.execute()
+            break
+        except redis.WatchError:
+            retries.append(1)
+            continue
+    return len(pickle.loads(redis_db.hget(context_name, "required_agents_for_current_phase")))
+
+
+def run_round(agent_names: list, remove) -> int:
+    """Let all the agents remove themselves at the same time, returning how many saw the phase as complete."""
+    start = threading.Barrier(len(agent_names))
+    completed = []
+
+    def respond(agent_name: str):
+        start.wait()
+        if remove(agent_name) == 0:
+            completed.append(agent_name)
+
+    threads = [threading.Thread(target=respond, args=(agent_name,)) for agent_name in agent_names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(completed)
+
+
+def benchmark_legacy(redis_db: redis.Redis, agent_names: list, rounds: int):
+    retries = []
+    completions = []
+    elapsed = 0.0
+    for _ in range(rounds):
+        context_name = f"benchmark-{uuid.uuid4()}"
+        redis_db.hset(context_name, "required_agents_for_current_phase", value=pickle.dumps(list(agent_names)))
+        started = time.perf_counter()
+        completions.append(run_round(agent_names, lambda agent_name: legacy_remove(redis_db, context_name, agent_name, retries)))
+        elapsed += time.perf_counter() - started
+        redis_db.delete(context_name)
+    report("legacy WATCH", len(retries), elapsed, rounds, completions)
+
+
+def benchmark_atomic(agent_names: list, rounds: int):
+    completions = []
+    elapsed = 0.0
+    for _ in range(rounds):
+        context = WiseAgentRegistry.create_context(f"benchmark-{uuid.uuid4()}")
+        context.set_agent_phase_assignments([list(agent_names)])
+        context.set_current_phase(0)
+        started = time.perf_counter()
+        completions.append(run_round(agent_names, context.remove_required_agent_for_current_phase))
+        elapsed += time.perf_counter() - started
+        WiseAgentRegistry.remove_context(context.name)
+    report("atomic", 0, elapsed, rounds, completions)
+
+
+def report(name: str, retries: int, elapsed: float, rounds: int, completions: list):
+    wrong_rounds = sum(1 for completed in completions if completed != 1)
+    print(f"{name:<14}{retries:>10}{elapsed / rounds * 1000:>12.2f}{wrong_rounds:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the phase barrier of the phased coordinator")
+    parser.add_argument("--agents", type=int, default=12, help="number of agents responding at the same time")
+    parser.add_argument("--rounds", type=int, default=50, help="number of phases")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+    WiseAgentRegistry.config = {"use_redis": True, "redis_host": args.redis_host, "redis_port": args.redis_port,
+                                "redis_max_connections": args.agents + 10}
+    WiseAgentRegistry.get_config()
+    agent_names = [f"Agent{i}" for i in range(args.agents)]
+    print(f"{args.agents} agents, {args.rounds} rounds")
+    print(f"{'strategy':<14}{'retries':>10}{'ms/round':>12}{'wrong rounds':>16}")
+    benchmark_legacy(WiseAgentRegistry.get_context_store().redis_db, agent_names, args.rounds)
+    benchmark_atomic(agent_names, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare the payload size and the encode/decode time of the codecs available to store the registry and
+context values in redis (see the serializer key of registry_config.yaml).
+
+Usage:
+    python benchmarks/serialization_benchmark.py [--messages 50] [--iterations 2000]
+"""
+import argparse
+import timeit
+
+from openai.types.chat import ChatCompletionMessage
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+
+from wiseagents import WiseAgentMetaData
+from wiseagents.wise_agent_codecs import get_codec
+
+
+def chat_messages(count: int) -> list:
+    """Build a representative chat history, mixing plain dict messages and the messages returned by the LLM."""
+    messages = [{"role": "system", "content": "You are a helpful assistant answering questions about the weather."}]
+    for i in range(count - 1):
+        if i % 3 == 0:
+            messages.append({"role": "user", "content": f"What is the weather like in city number {i} today? " * 4})
+        elif i % 3 == 1:
+            messages.append(ChatCompletionMessage(role="assistant", content=None, tool_calls=[
+                ChatCompletionMessageToolCall(id=f"call_{i}", type="function",
+                                              function=Function(name="WeatherAgent",
+                                                                arguments='{"location": "Rome", "unit": "celsius"}'))]))
+        else:
+            messages.append(ChatCompletionMessage(role="assistant",
+                                                  content=f"The weather in city number {i} is sunny, 25 degrees. " * 4))
+    return messages
+
+
+def benchmark(name: str, values: list, iterations: int):
+    print(f"\n{name} ({len(values)} values)")
+    print(f"{'codec':<10}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+    for codec_name in ("pickle", "json", "msgpack"):
+        try:
+            codec = get_codec(codec_name)
+        except ImportError as e:
+            print(f"{codec_name:<10} skipped: {e}")
+            continue
+        encoded = [codec.encode(value) for value in values]
+        size = sum(len(data) for data in encoded)
+        encode_time = timeit.timeit(lambda: [codec.encode(value) for value in values], number=iterations)
+        decode_time = timeit.timeit(lambda: [codec.decode(data) for data in encoded], number=iterations)
+        print(f"{codec_name:<10}{size:>10}{encode_time / iterations * 1e6:>12.1f}{decode_time / iterations * 1e6:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the registry and context codecs")
+    parser.add_argument("--messages", type=int, default=50, help="number of chat completion messages")
+    parser.add_argument("--iterations", type=int, default=2000, help="number of iterations for each measure")
+    args = parser.parse_args()
+    benchmark("Chat completion messages", chat_messages(args.messages), args.iterations)
+    benchmark("Agent metadata", [WiseAgentMetaData(description=f"Agent number {i} answers questions about the weather",
+                                                   system_message="You are a weather expert",
+                                                   pre_user_messages=["Use the metric system"]) for i in range(10)],
+              args.iterations)
+
+
+if __name__ == "__main__":
+    main()
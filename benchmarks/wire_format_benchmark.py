@@ -0,0 +1,39 @@
+"""
+Compare the size and the encode/decode time of a WiseAgentMessage sent by the transports with the JSON wire
+format and with the yaml.dump/yaml.Loader format used before it (see the wire_format key of the transports).
+
+Usage:
+    python benchmarks/wire_format_benchmark.py [--iterations 5000]
+"""
+import argparse
+import timeit
+
+import yaml
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+from wiseagents.transports.wire_format import JSON_WIRE_FORMAT, YAML_WIRE_FORMAT, decode_message, encode_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wire formats of the transports")
+    parser.add_argument("--iterations", type=int, default=5000, help="number of iterations for each measure")
+    args = parser.parse_args()
+    message = WiseAgentMessage(message="What is the weather like in Rome today? " * 4, context_name="Weather_1234",
+                               sender="WeatherClient", message_type=WiseAgentMessageType.QUERY,
+                               route_response_to="WeatherClient")
+    print(f"{'format':<20}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+    body = yaml.dump(message)
+    encode_time = timeit.timeit(lambda: yaml.dump(message), number=args.iterations)
+    decode_time = timeit.timeit(lambda: yaml.load(body, yaml.Loader), number=args.iterations)
+    print(f"{'yaml (unsafe load)':<20}{len(body.encode()):>10}{encode_time / args.iterations * 1e6:>12.1f}"
+          f"{decode_time / args.iterations * 1e6:>12.1f}")
+    for wire_format in (YAML_WIRE_FORMAT, JSON_WIRE_FORMAT):
+        body, content_type = encode_message(message, wire_format)
+        encode_time = timeit.timeit(lambda: encode_message(message, wire_format), number=args.iterations)
+        decode_time = timeit.timeit(lambda: decode_message(body, content_type), number=args.iterations)
+        print(f"{wire_format:<20}{len(body.encode()):>10}{encode_time / args.iterations * 1e6:>12.1f}"
+              f"{decode_time / args.iterations * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
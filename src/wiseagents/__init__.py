@@ -4,21 +4,25 @@
 
 from .utils import AbstractClassError, enforce_no_abstract_class_instances
 from wiseagents.core import WiseAgent
+from wiseagents.core import AsyncWiseAgent
 from wiseagents.core import WiseAgentCollaborationType
 from wiseagents.core import WiseAgentContext
+from wiseagents.core import WiseAgentContextSnapshot
 from wiseagents.core import WiseAgentRegistry
 from wiseagents.core import WiseAgentTool
 from wiseagents.core import WiseAgentMetaData
+from wiseagents.wise_agent_history import WiseAgentHistoryPolicy
 from wiseagents.wise_agent_messaging import WiseAgentEvent
 from wiseagents.wise_agent_messaging import WiseAgentMessage
 from wiseagents.wise_agent_messaging import WiseAgentMessageType
 from wiseagents.wise_agent_messaging import WiseAgentTransport
+from wiseagents.wise_agent_messaging import AsyncWiseAgentTransport
 
 # Define any necessary initialization code here
 
 # Optionally, you can define __all__ to specify the public interface of the package
 # __all__ = ['module1', 'module2', 'subpackage']
-__all__ = ['WiseAgentRegistry', 'WiseAgentContext', 'WiseAgent', 'WiseAgentTool', 'WiseAgentMetaData',
-           'WiseAgentMessage', 'WiseAgentMessageType', 'WiseAgentTransport', 'WiseAgentEvent',
+__all__ = ['WiseAgentRegistry', 'WiseAgentContext', 'WiseAgentContextSnapshot', 'WiseAgent', 'AsyncWiseAgent', 'WiseAgentTool', 'WiseAgentMetaData', 'WiseAgentHistoryPolicy',
+           'WiseAgentMessage', 'WiseAgentMessageType', 'WiseAgentTransport', 'AsyncWiseAgentTransport', 'WiseAgentEvent',
            'WiseAgentCollaborationType',
            'AbstractClassError', 'enforce_no_abstract_class_instances']
@@ -48,9 +48,10 @@ class SequentialCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
-        ctx.set_agents_sequence(self._agents)
-        ctx.set_route_response_to(request.sender)
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
+            ctx.set_agents_sequence(self._agents)
+            ctx.set_route_response_to(request.sender)
         self.send_request(WiseAgentMessage(message=request.message, sender=self.name, context_name=ctx.name), self._agents[0])
 
     def process_response(self, response):
@@ -136,13 +137,14 @@ class SequentialMemoryCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL_MEMORY)
-        if self.metadata.system_message:
-            ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message})
-
-        ctx.set_agents_sequence(self._agents)
-        ctx.set_route_response_to(request.sender)
-        ctx.add_query(request.message)
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL_MEMORY)
+            if self.metadata.system_message:
+                ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message})
+
+            ctx.set_agents_sequence(self._agents)
+            ctx.set_route_response_to(request.sender)
+            ctx.add_query(request.message)
         self.send_request(WiseAgentMessage(message=request.message, sender=self.name, context_name=ctx.name), self._agents[0])
 
 
@@ -218,9 +220,6 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.PHASED)
-        ctx.set_route_response_to(request.sender)
-        logging.debug(f"Registred context: {WiseAgentRegistry.get_context(ctx.name)}")
         # Determine the agents required to answer the query
         agent_selection_prompt = ("Given the following query and a description of the agents that are available," +
                                   " determine all of the agents that could be required to solve the query." +
@@ -228,13 +227,16 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                                   " anything else in the response.\n" +
                                   " Query: " + request.message + "\n" + "Available agents:\n" +
                                   "\n".join(WiseAgentRegistry.get_agent_names_and_descriptions()) + "\n")
-        if self.metadata.system_message or self.llm.system_message:
-            ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message or self.llm.system_message})
-        ctx.append_chat_completion(messages={"role": "user", "content": agent_selection_prompt})
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.PHASED)
+            ctx.set_route_response_to(request.sender)
+            if self.metadata.system_message or self.llm.system_message:
+                ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message or self.llm.system_message})
+            ctx.append_chat_completion(messages={"role": "user", "content": agent_selection_prompt})
+        logging.debug(f"Registred context: {WiseAgentRegistry.get_context(ctx.name)}")
 
         logging.debug(f"messages: {ctx.llm_chat_completion}")
-        llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
-        ctx.append_chat_completion(messages=llm_response.choices[0].message)
+        llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), tools=[])
 
         # Assign the agents to phases
         agent_assignment_prompt = ("Assign each of the agents that will be required to solve the query to one of the following phases:\n" +
@@ -243,13 +245,16 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                                    " Format the response as a space separated list of agents for each phase, where the first"
                                    " line contains the list of agents for the first phase and second line contains the list of"
                                    " agents for the second phase and so on. Don't include anything else in the response.\n")
-        ctx.append_chat_completion(messages={"role": "user", "content": agent_assignment_prompt})
-        llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
-        ctx.append_chat_completion(messages=llm_response.choices[0].message)     
+        with ctx.batch():
+            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+            ctx.append_chat_completion(messages={"role": "user", "content": agent_assignment_prompt})
+        llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), tools=[])
         phases = [phase.split() for phase in llm_response.choices[0].message.content.splitlines()]
-        ctx.set_agent_phase_assignments(phases)
-        ctx.set_current_phase(0)
-        ctx.add_query(request.message)
+        with ctx.batch():
+            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+            ctx.set_agent_phase_assignments(phases)
+            ctx.set_current_phase(0)
+            ctx.add_query(request.message)
 
         # Kick off the first phase
         for agent in phases[0]:
@@ -270,12 +275,11 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         if response.message_type != WiseAgentMessageType.ACK:
             raise ValueError(f"Unexpected response message_type: {response.message_type} with message: {response.message}")
 
-        # Remove the agent from the required agents for this phase
-        ctx.remove_required_agent_for_current_phase(response.sender)
-
+        # Remove the agent from the required agents for this phase. The number of remaining agents is
+        # returned atomically with the removal, so only the response of the last agent of the phase sees 0.
         # If there are no more agents remaining in this phase, move on to the next phase,
         # return the final answer, or iterate
-        if len(ctx.get_required_agents_for_current_phase()) == 0:
+        if ctx.remove_required_agent_for_current_phase(response.sender) == 0:
             next_phase = ctx.get_agents_for_next_phase()
             if next_phase is None:
                 # Determine the final answer
@@ -286,7 +290,7 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                                        " Your answer goes here.\n"
                                        " 85\n")
                 ctx.append_chat_completion(messages={"role": "user", "content": final_answer_prompt})
-                llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
+                llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), tools=[])
                 final_answer_and_score = llm_response.choices[0].message.content.splitlines()
                 final_answer = "\n".join(final_answer_and_score[:-1])
                 if final_answer_and_score[-1].strip().isnumeric():
@@ -298,11 +302,15 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                 # Determine if we should return the final answer or iterate
                 if score >= self.confidence_score_threshold:
                     self.send_response(WiseAgentMessage(message=final_answer, sender=self.name,
-                                                        context_name=response.context_name), ctx.get_route_response_to())
+                                                        context_name=WiseAgentRegistry.get_parent_context_name(response.context_name)),
+                                       ctx.get_route_response_to())
+                    WiseAgentRegistry.remove_context(context_name=response.context_name)
                 elif len(ctx.get_queries()) == self.max_iterations:
                     self.send_response(WiseAgentMessage(message=CANNOT_ANSWER, message_type=WiseAgentMessageType.CANNOT_ANSWER,
-                                                        sender=self.name, context_name=response.context_name),
+                                                        sender=self.name,
+                                                        context_name=WiseAgentRegistry.get_parent_context_name(response.context_name)),
                                        ctx.get_route_response_to())
+                    WiseAgentRegistry.remove_context(context_name=response.context_name)
                 else:
                     # Rephrase the query and iterate
                     if len(ctx.get_queries()) < self.max_iterations:
@@ -313,12 +321,14 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                                                  " The response should contain only the rephrased query."
                                                  " Don't include anything else in the response.\n")
                         ctx.append_chat_completion(messages={"role": "user", "content": rephrase_query_prompt})
-                        # Note that llm_chat_completion is being used here so we have the full history
-                        llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
+                        # Note that the chat completion history is being used here so we have the full history,
+                        # as selected by the history policy
+                        llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), tools=[])
                         rephrased_query = llm_response.choices[0].message.content
-                        ctx.append_chat_completion(messages=llm_response.choices[0].message)
-                        ctx.set_current_phase(0)
-                        ctx.add_query(rephrased_query)
+                        with ctx.batch():
+                            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+                            ctx.set_current_phase(0)
+                            ctx.add_query(rephrased_query)
                         for agent in ctx.get_required_agents_for_current_phase():
                             self.send_request(WiseAgentMessage(message=rephrased_query, sender=self.name,
                                                                context_name=response.context_name),
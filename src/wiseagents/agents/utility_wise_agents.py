@@ -224,24 +224,27 @@ class LLMWiseAgentWithTools(WiseAgent):
         """
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
         ctx = WiseAgentRegistry.create_sub_context(request.context_name,sub_ctx_name)
-        if self.llm.system_message:
-            ctx.append_chat_completion(messages= {"role": "system", "content": self.llm.system_message})
-        ctx.append_chat_completion(messages= {"role": "user", "content": request.message})
-        
-        for tool in self._tools:
-            ctx.append_available_tool_in_chat(tools=WiseAgentRegistry.get_tool(tool).get_tool_OpenAI_format())
+        with ctx.batch():
+            if self.llm.system_message:
+                ctx.append_chat_completion(messages= {"role": "system", "content": self.llm.system_message})
+            ctx.append_chat_completion(messages= {"role": "user", "content": request.message})
+            
+            for tool in self._tools:
+                ctx.append_available_tool_in_chat(tools=WiseAgentRegistry.get_tool(tool).get_tool_OpenAI_format())
             
         logging.debug(f"messages: {ctx.llm_chat_completion}, Tools: {ctx.llm_available_tools_in_chat}")
         # TODO: https://github.com/wise-agents/wise-agents/issues/205
-        llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, ctx.llm_available_tools_in_chat)
+        llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), ctx.llm_available_tools_in_chat)
         
         ##calling tool
         response_message = llm_response.choices[0].message
         tool_calls = response_message.tool_calls
         logging.debug(f"Tool calls: {tool_calls}")
         logging.debug(f"Response message: {response_message}")
+        remaining_tool_calls = 0
         # Step 2: check if the model wanted to call a function
         if tool_calls is not None:
+            remaining_tool_calls = len(tool_calls)
             # Step 3: call the function
             # TODO: the JSON response may not always be valid; be sure to handle errors
             ctx.append_chat_completion(messages= response_message)  # extend conversation with assistant's reply
@@ -272,12 +275,12 @@ class LLMWiseAgentWithTools(WiseAgent):
                             "content": function_response,
                         }
                     )  # extend conversation with function response
-                    ctx.remove_required_tool_call(tool_name=tool_call.function.name)
+                    remaining_tool_calls = ctx.remove_required_tool_call(tool_name=tool_call.function.name)
             
         
         #SEND THE RESPONSE IF NOT ASYNC, OTHERWISE WE WILL DO LATER IN PROCESS_RESPONSE
-        if ctx.llm_required_tool_call == []: # if all tool calls have been completed (no asynch needed)
-            llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, 
+        if remaining_tool_calls == 0: # if all tool calls have been completed (no asynch needed)
+            llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), 
                                                             ctx.llm_available_tools_in_chat)
             response_message = llm_response.choices[0].message
             logging.debug(f"sending response {response_message.content} to: {request.sender}")
@@ -303,10 +306,9 @@ class LLMWiseAgentWithTools(WiseAgent):
                 "content": response.message,
             }
         )  # extend conversation with function response
-        ctx.remove_required_tool_call(tool_name=response.sender)
-            
-        if ctx.llm_required_tool_call == []: # if all tool calls have been completed (no asynch needed)
-            llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, 
+        # only the response completing the last tool call sees no remaining tool calls
+        if ctx.remove_required_tool_call(tool_name=response.sender) == 0: # if all tool calls have been completed
+            llm_response = self.llm.process_chat_completion(self.get_chat_completion_history(ctx), 
                                                             ctx.llm_available_tools_in_chat)
             response_message = llm_response.choices[0].message
             logging.getLogger(self.name).info(f"sending response {response_message.content} to: {response.route_response_to}")
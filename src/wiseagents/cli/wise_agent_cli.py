@@ -79,14 +79,19 @@ def main():
             print('/(l)oad-agents: Load agents from file')
             print('/(r)eload agents: Reload agents from file')
             print('/(c)hat: Start a chat')
-            print('/(t)race: Show the message trace')
+            print('/(t)race: Show the most recent messages of the message trace')
             print('/e(x)it: Exit the application')
             print('/(h)elp: Show the available commands')
             print('(a)gents: Show the registered agents')
             print('(s)end: Send a message to an agent')
             
         if (user_input == '/trace' or user_input == '/t'):
-            for msg in WiseAgentRegistry.get_context(context_name).message_trace:
+            count = input('Enter the number of most recent messages to show (ENTER for all): ').strip()
+            while count and (not count.isdecimal() or int(count) < 1):
+                count = input(f'{count} is not a number greater than 0, enter the number of most recent messages '
+                              f'to show (ENTER for all): ').strip()
+            context = WiseAgentRegistry.get_context(context_name)
+            for msg in (context.get_message_trace_tail(int(count)) if count else context.message_trace):
                 print(msg)
         if  (user_input == '/exit' or user_input == '/x'):
             #stop all agents
@@ -0,0 +1,15 @@
+# This is the __init__.py file for the wiseagents.context_stores package
+
+# Import any modules or subpackages here
+
+# Define any necessary initialization code here
+
+from wiseagents.context_stores.wise_agent_context_store import (WiseAgentContextStore, create_context_store,
+                                                                 register_context_store)
+from wiseagents.context_stores.memory import MemoryWiseAgentContextStore
+from wiseagents.context_stores.redis import RedisWiseAgentContextStore
+from wiseagents.context_stores.sqlite import SQLiteWiseAgentContextStore
+
+# Optionally, you can define __all__ to specify the public interface of the package
+__all__ = ['WiseAgentContextStore', 'MemoryWiseAgentContextStore', 'RedisWiseAgentContextStore',
+           'SQLiteWiseAgentContextStore', 'create_context_store', 'register_context_store']
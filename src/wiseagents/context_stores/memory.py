@@ -0,0 +1,267 @@
+import pickle
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from wiseagents.context_stores.wise_agent_context_store import WiseAgentContextStore, register_context_store, parse_trace_id
+
+
+class _MemoryContextData():
+    '''The data of a context kept by MemoryWiseAgentContextStore.'''
+
+    def __init__(self):
+        self.fields : Dict[str, Any] = {}
+        self.lists : Dict[str, List] = {}
+        # The most recent messages traced in the context, as (id, message) tuples
+        self.trace : deque = deque()
+        self.trace_sequence : int = 0
+
+
+# The data read for the contexts without any data, never modified
+_NO_DATA = _MemoryContextData()
+
+
+class MemoryWiseAgentContextStore(WiseAgentContextStore):
+    '''
+    A context store keeping the contexts, the agents and the tools in the memory of the process, so all the agents
+    need to run in the same process. The store is safe to use from the threads of all the agents: the data of each
+    context is guarded by one of a set of striped locks, chosen by the name of the context, so that agents working
+    on different contexts rarely wait for each other.
+    '''
+
+    name = "memory"
+
+    # The number of locks guarding the data of the contexts
+    LOCK_STRIPES = 64
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self._contexts : Dict[str, Any] = {}
+        self._data : Dict[str, _MemoryContextData] = {}
+        # Creation and last access times of the sub contexts, used to expire them
+        self._created_at : Dict[str, float] = {}
+        self._last_access : Dict[str, float] = {}
+        self._agents : Dict[str, Any] = {}
+        # The instances of each agent, with the time of their last heartbeat
+        self._agent_instances : Dict[str, Dict[str, float]] = {}
+        self._tools : Dict[str, Any] = {}
+        # Guards the dicts above
+        self._lock = threading.RLock()
+        self._context_locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+
+    def _context_lock(self, context_name: str) -> threading.RLock:
+        '''Get the lock guarding the data of the context with the given name.'''
+        return self._context_locks[hash(context_name) % len(self._context_locks)]
+
+    def _find_data(self, context_name: str) -> _MemoryContextData:
+        '''Get the data of the context with the given name for reading, without creating it.'''
+        return self._data.get(context_name) or _NO_DATA
+
+    def _get_data(self, context_name: str) -> _MemoryContextData:
+        '''Get the data of the context with the given name, creating it if needed.'''
+        data = self._data.get(context_name)
+        if data is None:
+            with self._lock:
+                data = self._data.setdefault(context_name, _MemoryContextData())
+        return data
+
+    @contextmanager
+    def batch(self, context_name: str) -> Iterator[None]:
+        '''Hold the lock of the given context for the whole with block, so that other threads see either none or
+        all the changes made within the block. The changes are applied immediately and are not rolled back if the
+        block raises an exception.'''
+        with self._context_lock(context_name):
+            yield
+
+    def register_context(self, context: Any, now: float):
+        with self._lock:
+            if context.name in self._contexts:
+                raise NameError(f"Context with name {context.name} already exists")
+            self._contexts[context.name] = context
+            if "_" in context.name:
+                self._created_at[context.name] = now
+                self._last_access[context.name] = now
+
+    def get_context(self, context_name: str) -> Optional[Any]:
+        return self._contexts.get(context_name)
+
+    def get_contexts(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._contexts)
+
+    def context_exists(self, context_name: str) -> bool:
+        return context_name in self._contexts
+
+    def remove_context(self, context_name: str):
+        with self._lock:
+            self._contexts.pop(context_name, None)
+            self._data.pop(context_name, None)
+            self._created_at.pop(context_name, None)
+            self._last_access.pop(context_name, None)
+
+    def touch_context(self, context_name: str, now: float):
+        with self._lock:
+            if context_name in self._last_access:
+                self._last_access[context_name] = now
+
+    def get_expired_context_names(self, ttl: Optional[float], idle_timeout: Optional[float], now: float) -> List[str]:
+        expired = set()
+        with self._lock:
+            if ttl is not None:
+                expired.update(name for name, created_at in self._created_at.items() if created_at <= now - ttl)
+            if idle_timeout is not None:
+                expired.update(name for name, last_access in self._last_access.items()
+                               if last_access <= now - idle_timeout)
+        return list(expired)
+
+    def get_context_stats(self) -> Dict[str, int]:
+        with self._lock:
+            contexts = list(self._contexts.items())
+        size = 0
+        for context_name, context in contexts:
+            data = self._find_data(context_name)
+            with self._context_lock(context_name):
+                size += len(pickle.dumps((context, data.fields, data.lists, list(data.trace))))
+        return {"live_contexts": len(contexts), "bytes": size}
+
+    def get_field(self, context_name: str, key: str, default: Any = None) -> Any:
+        with self._context_lock(context_name):
+            return self._find_data(context_name).fields.get(key, default)
+
+    def get_fields(self, context_name: str) -> Dict[str, Any]:
+        with self._context_lock(context_name):
+            return dict(self._find_data(context_name).fields)
+
+    def set_field(self, context_name: str, key: str, value: Any):
+        with self._context_lock(context_name):
+            self._get_data(context_name).fields[key] = value
+
+    def get_list(self, context_name: str, key: str) -> List:
+        with self._context_lock(context_name):
+            return list(self._find_data(context_name).lists.get(key, []))
+
+    def get_last_list_element(self, context_name: str, key: str) -> Optional[Any]:
+        with self._context_lock(context_name):
+            values = self._find_data(context_name).lists.get(key)
+            return values[-1] if values else None
+
+    def append_to_list(self, context_name: str, key: str, value: Any):
+        with self._context_lock(context_name):
+            self._get_data(context_name).lists.setdefault(key, []).append(value)
+
+    def remove_from_list(self, context_name: str, key: str, value: Any) -> int:
+        with self._context_lock(context_name):
+            values = self._get_data(context_name).lists.setdefault(key, [])
+            values.remove(value)
+            return len(values)
+
+    def replace_list(self, context_name: str, key: str, values: List):
+        with self._context_lock(context_name):
+            self._get_data(context_name).lists[key] = list(values)
+
+    def merge_list(self, source_context_name: str, target_context_name: str, key: str) -> int:
+        # take the locks in a fixed order, so that concurrent merges can't deadlock
+        locks = sorted({self._context_lock(source_context_name), self._context_lock(target_context_name)}, key=id)
+        with locks[0], locks[-1]:
+            values = list(self._find_data(source_context_name).lists.get(key, []))
+            self._get_data(target_context_name).lists.setdefault(key, []).extend(values)
+            return len(values)
+
+    def trace(self, context_name: str, message: Any, max_length: int):
+        '''Trace the message itself in a ring buffer of max_length entries.'''
+        with self._context_lock(context_name):
+            data = self._get_data(context_name)
+            if data.trace.maxlen != max_length:
+                data.trace = deque(data.trace, maxlen=max_length)
+            data.trace_sequence += 1
+            data.trace.append((f"{int(time.time() * 1000)}-{data.trace_sequence}", message))
+
+    def get_trace_tail(self, context_name: str, count: int) -> List[Any]:
+        with self._context_lock(context_name):
+            return [message for _, message in list(self._find_data(context_name).trace)[-count:]]
+
+    def get_trace_range(self, context_name: str, start: str = "-", end: str = "+",
+                        count: Optional[int] = None) -> List[Tuple[str, Any]]:
+        lower, include_lower = parse_trace_id(start, (0, 0))
+        upper, include_upper = parse_trace_id(end, (float("inf"), float("inf")))
+        with self._context_lock(context_name):
+            trace = list(self._find_data(context_name).trace)
+        entries = []
+        for entry_id, message in trace:
+            parsed_id = parse_trace_id(entry_id, None)[0]
+            if (lower < parsed_id or (include_lower and lower == parsed_id)) and \
+                    (parsed_id < upper or (include_upper and parsed_id == upper)):
+                entries.append((entry_id, message))
+                if count is not None and len(entries) == count:
+                    break
+        return entries
+
+    def register_agent(self, agent_name: str, agent_metadata: Any):
+        with self._lock:
+            if self._agents.get(agent_name) is not None:
+                raise NameError(f"Agent with name {agent_name} already exists")
+            self._agents[agent_name] = agent_metadata
+
+    def unregister_agent(self, agent_name: str):
+        with self._lock:
+            self._agents.pop(agent_name, None)
+            self._agent_instances.pop(agent_name, None)
+
+    def register_agent_instance(self, agent_name: str, instance_id: str, agent_metadata: Any, now: float) -> int:
+        with self._lock:
+            registered_metadata = self._agents.get(agent_name)
+            if registered_metadata is not None and registered_metadata != agent_metadata:
+                raise NameError(f"Agent with name {agent_name} already exists with different metadata")
+            self._agents[agent_name] = agent_metadata
+            instances = self._agent_instances.setdefault(agent_name, {})
+            instances[instance_id] = now
+            return len(instances)
+
+    def unregister_agent_instance(self, agent_name: str, instance_id: str) -> int:
+        with self._lock:
+            instances = self._agent_instances.get(agent_name, {})
+            instances.pop(instance_id, None)
+            if not instances:
+                self.unregister_agent(agent_name)
+            return len(instances)
+
+    def expire_agent_instance(self, agent_name: str, instance_id: str, expired_before: float) -> bool:
+        with self._lock:
+            last_heartbeat = self._agent_instances.get(agent_name, {}).get(instance_id)
+            if last_heartbeat is None or last_heartbeat >= expired_before:
+                return False
+            self.unregister_agent_instance(agent_name, instance_id)
+            return True
+
+    def touch_agent_instances(self, instances: Dict[Tuple[str, str], Any], now: float):
+        with self._lock:
+            for (agent_name, instance_id), agent_metadata in instances.items():
+                self._agents.setdefault(agent_name, agent_metadata)
+                self._agent_instances.setdefault(agent_name, {})[instance_id] = now
+
+    def get_agent_instances(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {agent_name: dict(instances) for agent_name, instances in self._agent_instances.items()}
+
+    def get_agents(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._agents)
+
+    def get_agent(self, agent_name: str) -> Optional[Any]:
+        return self._agents.get(agent_name)
+
+    def register_tool(self, tool: Any):
+        with self._lock:
+            self._tools[tool.name] = tool
+
+    def get_tools(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._tools)
+
+    def get_tool(self, tool_name: str) -> Optional[Any]:
+        return self._tools.get(tool_name)
+
+
+register_context_store(MemoryWiseAgentContextStore)
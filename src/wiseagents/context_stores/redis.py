@@ -0,0 +1,663 @@
+import logging
+import pickle
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import redis
+
+from wiseagents.context_stores.wise_agent_context_store import WiseAgentContextStore, register_context_store
+from wiseagents.wise_agent_redis import WiseAgentRedisConnectionManager
+
+
+class _RedisBatch():
+    '''The changes to a context buffered by RedisWiseAgentContextStore.batch.'''
+
+    def __init__(self, pipeline: redis.client.Pipeline):
+        self.pipeline = pipeline
+        # The fields of the context hash set in the batch
+        self.fields : Dict[str, Any] = {}
+        # The ("append", value) and ("remove", value) operations applied to each redis list in the batch, in order
+        self.list_operations : Dict[str, List[Tuple[str, Any]]] = {}
+        # The redis lists whose content is replaced by the batch
+        self.replaced_lists : set[str] = set()
+        # The position in the pipeline, the redis list name and the encoded value of each append
+        self.appends : List[Tuple[int, str, bytes]] = []
+
+    def apply_list_operations(self, redis_key: str, fetch: Callable[[], List]) -> List:
+        '''
+        Get a list as it will be once the batch is sent to redis.
+
+        Args:
+            redis_key (str): the name of the redis list
+            fetch (Callable[[], List]): the function reading the current list from redis
+
+        Returns:
+            List: the list with the operations of the batch applied
+        '''
+        items = [] if redis_key in self.replaced_lists else fetch()
+        for operation, value in self.list_operations[redis_key]:
+            if operation == "append":
+                items.append(value)
+            elif value in items:
+                items.remove(value)
+        return items
+
+
+class _RedisListView():
+    '''A process local copy of a redis list which is only ever appended to.'''
+
+    def __init__(self):
+        self.items : List = []
+        # the generation of the context the items were read from, see CONTEXTS_GENERATIONS
+        self.generation : Optional[bytes] = None
+        self.lock = threading.Lock()
+
+    def append_if_length_matches(self, value: Any, length: int):
+        '''
+        Append a value written by this process to the local copy, if the local copy was up to date
+        before the write. Otherwise the next read will fetch the missing elements from redis.
+
+        Args:
+            value (Any): the value appended to the redis list
+            length (int): the length of the redis list after the value was appended
+        '''
+        with self.lock:
+            if len(self.items) + 1 == length:
+                self.items.append(value)
+
+
+class RedisWiseAgentContextStore(WiseAgentContextStore):
+    '''
+    A context store keeping the contexts, the agents and the tools in a redis server shared by all the agents,
+    which can then run in different processes and on different hosts. The connections are taken from the pool
+    managed by WiseAgentRedisConnectionManager.
+
+    The contexts are pickled in the contexts hash. The fields of each context are stored in a hash named after the
+    context, and its lists in redis lists named <context name>:<field>. The agents and tools are stored in the
+    agents and tools hashes.
+    '''
+
+    name = "redis"
+
+    # The fields of the contexts stored as redis lists named <context name>:<field>
+    LIST_FIELDS = ("llm_chat_completion", "llm_required_tool_call", "llm_available_tools_in_chat",
+                   "required_agents_for_current_phase", "queries")
+
+    # The lists which are only ever appended to, cached in each process
+    APPEND_ONLY_LIST_FIELDS = ("llm_chat_completion", "llm_available_tools_in_chat", "queries")
+
+    # The fields of the contexts stored as plain strings rather than with the codec
+    STRING_FIELDS = ("route_response_to", "collaboration_type")
+
+    # The field of the contexts stored as a redis stream named <context name>:<field>
+    TRACE_FIELD = "message_trace"
+
+    # Appends the elements of the list KEYS[1] to the list KEYS[2], in chunks to stay within the
+    # limit on the number of arguments of a lua function, returning the number of appended elements
+    MERGE_LIST_SCRIPT = """
+        local values = redis.call('LRANGE', KEYS[1], 0, -1)
+        for i = 1, #values, 1000 do
+            redis.call('RPUSH', KEYS[2], unpack(values, i, math.min(i + 999, #values)))
+        end
+        return #values
+    """
+
+    # Records a heartbeat, ARGV[1], of the instances whose agent name, instance id and encoded agent metadata are
+    # the following triples of ARGV, and whose instances hashes are KEYS[3], KEYS[4]..., registering again the
+    # missing instances and, in the agents hash KEYS[1], the missing agents, incrementing KEYS[2] if any
+    TOUCH_AGENT_INSTANCES_SCRIPT = """
+        local added = false
+        for i = 3, #KEYS do
+            local arg = 2 + (i - 3) * 3
+            redis.call('HSET', KEYS[i], ARGV[arg + 1], ARGV[1])
+            if redis.call('HSETNX', KEYS[1], ARGV[arg], ARGV[arg + 2]) == 1 then
+                added = true
+            end
+        end
+        if added then
+            redis.call('INCR', KEYS[2])
+        end
+    """
+
+    CONTEXTS_CHANNEL = "contexts"
+    DEFAULT_CONTEXT_CACHE_SIZE = 256
+
+    CONTEXTS_CREATED_AT = "contexts_created_at"
+    CONTEXTS_LAST_ACCESS = "contexts_last_access"
+
+    # A hash with the names of the registered contexts as keys and a random id, drawn whenever the context is
+    # registered, as values, so that a list cached in a process is never mistaken for the list of a context
+    # removed and registered again under the same name by another process
+    CONTEXTS_GENERATIONS = "contexts_generations"
+
+    AGENTS_VERSION = "agents_version"
+    TOOLS_VERSION = "tools_version"
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.redis_db : redis.Redis = WiseAgentRedisConnectionManager.get_redis(config)
+
+        # Process local cache of the contexts read from redis, in least recently used order.
+        # Entries are invalidated through the CONTEXTS_CHANNEL pub/sub channel whenever a
+        # context is registered or removed by any process.
+        self._context_cache : OrderedDict[str, Any] = OrderedDict()
+        self._context_cache_lock = threading.Lock()
+        # Incremented by every invalidation, so that a context read from redis before an invalidation
+        # which arrived while the read was in progress is not cached
+        self._context_cache_invalidations = 0
+        self._context_cache_invalidation_thread = None
+
+        # Process local copies of the append-only redis lists, keyed by redis list name, so that
+        # a context fetched again from the registry doesn't need to read the whole list again.
+        self._list_views : Dict[str, _RedisListView] = {}
+        self._list_views_lock = threading.Lock()
+
+        # The batches opened in the current thread, keyed by context name
+        self._batches = threading.local()
+
+        # Process local copies of the agents and tools hashes, keyed by hash name, along with the
+        # version of the hash they were read at. The version is a counter incremented in redis
+        # by every change to the hash, so a copy is only read again after the hash has changed.
+        self._directory_cache : Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._directory_cache_lock = threading.Lock()
+
+        self._merge_list_script = None
+        self._touch_agent_instances_script = None
+
+        self._start_context_cache_invalidation()
+
+    def close(self):
+        '''Stop listening for the changes to the contexts.'''
+        if self._context_cache_invalidation_thread is not None:
+            self._context_cache_invalidation_thread.stop()
+            self._context_cache_invalidation_thread = None
+
+    def _context_cache_size(self) -> int:
+        '''Get the maximum number of contexts cached in this process, 0 if the cache is disabled.'''
+        return self._config.get("context_cache_size", self.DEFAULT_CONTEXT_CACHE_SIZE)
+
+    def _start_context_cache_invalidation(self):
+        '''
+        Subscribe to the contexts channel, evicting from the context cache the contexts
+        registered or removed by any process. The context cache is only used once the
+        subscription is in place.
+        '''
+        if self._context_cache_size() <= 0:
+            return
+        try:
+            pubsub = self.redis_db.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.CONTEXTS_CHANNEL: self._on_context_changed})
+            self._context_cache_invalidation_thread = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                                           exception_handler=self._on_context_channel_error)
+        except Exception as e:
+            logging.warning(f"Context cache disabled, unable to subscribe to {self.CONTEXTS_CHANNEL}: {e}")
+
+    def _on_context_changed(self, message: dict):
+        '''Evict the context named in the given pub/sub message from the context cache and drop its cached lists.'''
+        context_name = message["data"].decode("utf-8")
+        with self._context_cache_lock:
+            self._context_cache.pop(context_name, None)
+            self._context_cache_invalidations += 1
+        self._drop_list_views(context_name)
+
+    def _on_context_channel_error(self, e: Exception, pubsub, thread):
+        '''
+        Clear the context cache, since invalidation messages may have been missed while the
+        subscription to the contexts channel was broken.
+        '''
+        logging.warning(f"Error listening on {self.CONTEXTS_CHANNEL}, clearing the context cache: {e}")
+        with self._context_cache_lock:
+            self._context_cache.clear()
+            self._context_cache_invalidations += 1
+        with self._list_views_lock:
+            self._list_views.clear()
+
+    def _redis_keys(self, context_name: str) -> List[str]:
+        '''Get the names of all the redis keys holding the data of the context with the given name.'''
+        return ([context_name] + [self._list_key(context_name, field) for field in self.LIST_FIELDS]
+                + [self._list_key(context_name, self.TRACE_FIELD)])
+
+    def _list_key(self, context_name: str, key: str) -> str:
+        '''Get the name of the redis list holding the given field of the context.'''
+        return f"{context_name}:{key}"
+
+    @contextmanager
+    def batch(self, context_name: str) -> Iterator[None]:
+        '''
+        Buffer the changes made to the context within the with block and send them to redis as a single
+        transactional pipeline when the block exits. Reads within the block see the buffered changes.
+        Nothing is sent to redis if the block raises an exception. A batch is only visible to the thread
+        that opened it.
+        '''
+        batches = self._batches.__dict__.setdefault("batches", {})
+        if context_name in batches:
+            yield
+            return
+        batch = batches[context_name] = _RedisBatch(self.redis_db.pipeline(transaction=True))
+        try:
+            yield
+        finally:
+            del batches[context_name]
+        results = batch.pipeline.execute()
+        for index, redis_key, encoded_value in batch.appends:
+            view = self._list_views.get(redis_key)
+            if view is not None:
+                view.append_if_length_matches(self.codec.decode(encoded_value), results[index])
+
+    def _get_batch(self, context_name: str) -> Optional[_RedisBatch]:
+        '''Get the batch opened for the context in the current thread, if any.'''
+        return self._batches.__dict__.get("batches", {}).get(context_name)
+
+    def register_context(self, context: Any, now: float):
+        if self.context_exists(context.name):
+            raise NameError(f"Context with name {context.name} already exists")
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.hset("contexts", key=context.name, value=pickle.dumps(context))
+        pipeline.hset(self.CONTEXTS_GENERATIONS, key=context.name, value=uuid.uuid4().hex)
+        if "_" in context.name:
+            pipeline.zadd(self.CONTEXTS_CREATED_AT, {context.name: now})
+            pipeline.zadd(self.CONTEXTS_LAST_ACCESS, {context.name: now})
+        pipeline.publish(self.CONTEXTS_CHANNEL, context.name)
+        pipeline.execute()
+
+    def get_context(self, context_name: str) -> Optional[Any]:
+        use_cache = self._context_cache_invalidation_thread is not None
+        if use_cache:
+            with self._context_cache_lock:
+                context = self._context_cache.get(context_name)
+                if context is not None:
+                    self._context_cache.move_to_end(context_name)
+                    return context
+                invalidations = self._context_cache_invalidations
+        ctx = self.redis_db.hget("contexts", key=context_name)
+        if ctx is None:
+            return None
+        context = pickle.loads(ctx)
+        if use_cache:
+            with self._context_cache_lock:
+                if self._context_cache_invalidations != invalidations:
+                    # the context may have changed since it was read
+                    return context
+                self._context_cache[context_name] = context
+                if len(self._context_cache) > self._context_cache_size():
+                    self._context_cache.popitem(last=False)
+        return context
+
+    def get_contexts(self) -> Dict[str, Any]:
+        return {key.decode("utf-8"): pickle.loads(value) for key, value in self.redis_db.hgetall("contexts").items()}
+
+    def context_exists(self, context_name: str) -> bool:
+        return self.redis_db.hexists("contexts", key=context_name)
+
+    def remove_context(self, context_name: str):
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.hdel("contexts", context_name)
+        pipeline.hdel(self.CONTEXTS_GENERATIONS, context_name)
+        pipeline.delete(*self._redis_keys(context_name))
+        pipeline.zrem(self.CONTEXTS_CREATED_AT, context_name)
+        pipeline.zrem(self.CONTEXTS_LAST_ACCESS, context_name)
+        pipeline.publish(self.CONTEXTS_CHANNEL, context_name)
+        pipeline.execute()
+        with self._context_cache_lock:
+            self._context_cache.pop(context_name, None)
+            self._context_cache_invalidations += 1
+        self._drop_list_views(context_name)
+
+    def _drop_list_views(self, context_name: str):
+        '''Drop the process local copies of the lists of the context with the given name.'''
+        with self._list_views_lock:
+            for redis_key in [redis_key for redis_key in self._list_views if redis_key.startswith(f"{context_name}:")]:
+                del self._list_views[redis_key]
+
+    def touch_context(self, context_name: str, now: float):
+        # only update the contexts which haven't been removed in the meantime
+        self.redis_db.zadd(self.CONTEXTS_LAST_ACCESS, {context_name: now}, xx=True)
+
+    def get_expired_context_names(self, ttl: Optional[float], idle_timeout: Optional[float], now: float) -> List[str]:
+        expired = set()
+        if ttl is not None:
+            expired.update(name.decode("utf-8") for name in
+                           self.redis_db.zrangebyscore(self.CONTEXTS_CREATED_AT, "-inf", now - ttl))
+        if idle_timeout is not None:
+            expired.update(name.decode("utf-8") for name in
+                           self.redis_db.zrangebyscore(self.CONTEXTS_LAST_ACCESS, "-inf", now - idle_timeout))
+        return list(expired)
+
+    def get_context_stats(self) -> Dict[str, int]:
+        context_names = [name.decode("utf-8") for name in self.redis_db.hkeys("contexts")]
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for context_name in context_names:
+            pipeline.hstrlen("contexts", context_name)
+            for key in self._redis_keys(context_name):
+                pipeline.memory_usage(key)
+        size = sum(usage for usage in pipeline.execute() if usage is not None)
+        return {"live_contexts": len(context_names), "bytes": size}
+
+    def _encode_field(self, key: str, value: Any) -> Any:
+        '''Encode the value of a field of a context hash.'''
+        if key in self.STRING_FIELDS:
+            return value
+        return self.codec.encode(value)
+
+    def _decode_field(self, key: str, value: bytes) -> Any:
+        '''Decode the value of a field of a context hash.'''
+        if key in self.STRING_FIELDS:
+            return value.decode("utf-8")
+        return self.codec.decode(value)
+
+    def get_field(self, context_name: str, key: str, default: Any = None) -> Any:
+        batch = self._get_batch(context_name)
+        if batch is not None and key in batch.fields:
+            return batch.fields[key]
+        redis_return = self.redis_db.hget(context_name, key)
+        if redis_return is not None:
+            return self._decode_field(key, redis_return)
+        else:
+            return default
+
+    def get_fields(self, context_name: str) -> Dict[str, Any]:
+        fields = {key.decode("utf-8"): self._decode_field(key.decode("utf-8"), value)
+                  for key, value in self.redis_db.hgetall(context_name).items()}
+        batch = self._get_batch(context_name)
+        if batch is not None:
+            fields.update(batch.fields)
+        return fields
+
+    def get_snapshot(self, context_name: str, list_keys: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        '''Read the context hash and the last element of each list with a single transactional pipeline.'''
+        list_keys = list(list_keys)
+        batch = self._get_batch(context_name)
+        if batch is not None:
+            return super().get_snapshot(context_name, list_keys)
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.hgetall(context_name)
+        for key in list_keys:
+            pipeline.lindex(self._list_key(context_name, key), -1)
+        results = pipeline.execute()
+        fields = {key.decode("utf-8"): self._decode_field(key.decode("utf-8"), value) for key, value in results[0].items()}
+        last_elements = {key: self.codec.decode(value) if value is not None else None
+                         for key, value in zip(list_keys, results[1:])}
+        return fields, last_elements
+
+    def set_field(self, context_name: str, key: str, value: Any):
+        encoded_value = self._encode_field(key, value)
+        batch = self._get_batch(context_name)
+        if batch is not None:
+            batch.pipeline.hset(context_name, key, value=encoded_value)
+            batch.fields[key] = value
+        else:
+            self.redis_db.hset(context_name, key, value=encoded_value)
+
+    def get_list(self, context_name: str, key: str) -> List:
+        '''Get a list of a context. The lists which are only ever appended to are cached in this process and only
+        the elements appended since the last read are fetched, using the generation of the context and the length
+        of the list as the version stamp of the cached copy.'''
+        redis_key = self._list_key(context_name, key)
+
+        def fetch() -> List:
+            if key in self.APPEND_ONLY_LIST_FIELDS:
+                return self._fetch_appended_list(context_name, redis_key)
+            return self._fetch_list(redis_key)
+
+        batch = self._get_batch(context_name)
+        if batch is not None and redis_key in batch.list_operations:
+            return batch.apply_list_operations(redis_key, fetch)
+        return fetch()
+
+    def _fetch_list(self, redis_key: str) -> List:
+        '''Read a whole list from redis.'''
+        return [self.codec.decode(value) for value in self.redis_db.lrange(redis_key, 0, -1)]
+
+    def _fetch_appended_list(self, context_name: str, redis_key: str) -> List:
+        '''Read the elements of a list of a context appended since the last read in this process from redis.'''
+        with self._list_views_lock:
+            view = self._list_views.get(redis_key)
+            if view is None:
+                view = self._list_views[redis_key] = _RedisListView()
+        with view.lock:
+            pipeline = self.redis_db.pipeline(transaction=True)
+            pipeline.hget(self.CONTEXTS_GENERATIONS, context_name)
+            pipeline.llen(redis_key)
+            pipeline.lrange(redis_key, len(view.items), -1)
+            generation, length, tail = pipeline.execute()
+            if generation == view.generation and length == len(view.items) + len(tail):
+                view.items.extend(self.codec.decode(value) for value in tail)
+            else:
+                # the list has been shrunk or replaced, or the context registered again, read it again from scratch
+                view.generation = generation
+                view.items = self._fetch_list(redis_key)
+            return list(view.items)
+
+    def get_last_list_element(self, context_name: str, key: str) -> Optional[Any]:
+        if self._get_batch(context_name) is not None:
+            values = self.get_list(context_name, key)
+            return values[-1] if values else None
+        redis_return = self.redis_db.lindex(self._list_key(context_name, key), -1)
+        if redis_return is not None:
+            return self.codec.decode(redis_return)
+        else:
+            return None
+
+    def append_to_list(self, context_name: str, key: str, value: Any):
+        redis_key = self._list_key(context_name, key)
+        encoded_value = self.codec.encode(value)
+        batch = self._get_batch(context_name)
+        if batch is not None:
+            batch.appends.append((len(batch.pipeline), redis_key, encoded_value))
+            batch.pipeline.rpush(redis_key, encoded_value)
+            batch.list_operations.setdefault(redis_key, []).append(("append", value))
+            return
+        length = self.redis_db.rpush(redis_key, encoded_value)
+        view = self._list_views.get(redis_key)
+        if view is not None:
+            view.append_if_length_matches(self.codec.decode(encoded_value), length)
+
+    def remove_from_list(self, context_name: str, key: str, value: Any) -> int:
+        redis_key = self._list_key(context_name, key)
+        batch = self._get_batch(context_name)
+        if batch is not None:
+            batch.pipeline.lrem(redis_key, 1, self.codec.encode(value))
+            batch.list_operations.setdefault(redis_key, []).append(("remove", value))
+            return len(self.get_list(context_name, key))
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.lrem(redis_key, 1, self.codec.encode(value))
+        pipeline.llen(redis_key)
+        return pipeline.execute()[1]
+
+    def replace_list(self, context_name: str, key: str, values: List):
+        redis_key = self._list_key(context_name, key)
+        with self.batch(context_name):
+            batch = self._get_batch(context_name)
+            batch.pipeline.delete(redis_key)
+            if values:
+                batch.pipeline.rpush(redis_key, *[self.codec.encode(value) for value in values])
+            batch.list_operations[redis_key] = [("append", value) for value in values]
+            batch.replaced_lists.add(redis_key)
+
+    def merge_list(self, source_context_name: str, target_context_name: str, key: str) -> int:
+        '''Merge the list with a lua script, so that the elements are copied within redis in a single atomic step.'''
+        if self._merge_list_script is None:
+            self._merge_list_script = self.redis_db.register_script(self.MERGE_LIST_SCRIPT)
+        return self._merge_list_script(keys=[self._list_key(source_context_name, key),
+                                             self._list_key(target_context_name, key)])
+
+    def trace(self, context_name: str, message: Any, max_length: int):
+        '''Trace the message in a redis stream capped to about max_length entries.'''
+        redis_key = self._list_key(context_name, self.TRACE_FIELD)
+        fields = {"message": self.codec.encode(message.__repr__())}
+        batch = self._get_batch(context_name)
+        # approximate trimming lets redis drop whole nodes of the stream, keeping XADD O(1)
+        if batch is not None:
+            batch.pipeline.xadd(redis_key, fields, maxlen=max_length, approximate=True)
+        else:
+            self.redis_db.xadd(redis_key, fields, maxlen=max_length, approximate=True)
+
+    def get_trace_tail(self, context_name: str, count: int) -> List[Any]:
+        entries = self.redis_db.xrevrange(self._list_key(context_name, self.TRACE_FIELD), count=count)
+        return [self.codec.decode(fields[b"message"]) for _, fields in reversed(entries)]
+
+    def get_trace_range(self, context_name: str, start: str = "-", end: str = "+",
+                        count: Optional[int] = None) -> List[Tuple[str, Any]]:
+        entries = self.redis_db.xrange(self._list_key(context_name, self.TRACE_FIELD), min=start, max=end, count=count)
+        return [(entry_id.decode("utf-8"), self.codec.decode(fields[b"message"])) for entry_id, fields in entries]
+
+    def register_agent(self, agent_name: str, agent_metadata: Any):
+        pipe = self.redis_db.pipeline(transaction=True)
+        while True:
+            pipe.watch("agents")
+            try:
+                if(pipe.hexists("agents", agent_name) == True):
+                    pipe.unwatch()
+                    raise NameError(f"Agent with name {agent_name} already exists")
+                else:
+                    pipe.multi()
+                    pipe.hset("agents", key=agent_name, value=self.codec.encode(agent_metadata))
+                    pipe.incr(self.AGENTS_VERSION)
+                    pipe.execute()
+                return
+            except redis.WatchError:
+                logging.debug("WatchError in register_agent")
+                continue
+
+    def unregister_agent(self, agent_name: str):
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.hdel("agents", agent_name)
+        pipeline.delete(self._agent_instances_key(agent_name))
+        pipeline.incr(self.AGENTS_VERSION)
+        pipeline.execute()
+
+    def _agent_instances_key(self, agent_name: str) -> str:
+        '''Get the name of the hash with the ids of the instances of an agent and the time of their last heartbeat.'''
+        return f"agent_instances:{agent_name}"
+
+    def register_agent_instance(self, agent_name: str, instance_id: str, agent_metadata: Any, now: float) -> int:
+        instances_key = self._agent_instances_key(agent_name)
+        pipe = self.redis_db.pipeline(transaction=True)
+        while True:
+            pipe.watch("agents", instances_key)
+            try:
+                registered_metadata = pipe.hget("agents", agent_name)
+                if registered_metadata is not None and self.codec.decode(registered_metadata) != agent_metadata:
+                    pipe.unwatch()
+                    raise NameError(f"Agent with name {agent_name} already exists with different metadata")
+                pipe.multi()
+                if registered_metadata is None:
+                    pipe.hset("agents", key=agent_name, value=self.codec.encode(agent_metadata))
+                    pipe.incr(self.AGENTS_VERSION)
+                pipe.hset(instances_key, key=instance_id, value=now)
+                pipe.hlen(instances_key)
+                return pipe.execute()[-1]
+            except redis.WatchError:
+                logging.debug("WatchError in register_agent_instance")
+                continue
+            finally:
+                pipe.reset()
+
+    def unregister_agent_instance(self, agent_name: str, instance_id: str) -> int:
+        return self._remove_agent_instance(agent_name, instance_id)
+
+    def expire_agent_instance(self, agent_name: str, instance_id: str, expired_before: float) -> bool:
+        return self._remove_agent_instance(agent_name, instance_id, expired_before) is not None
+
+    def _remove_agent_instance(self, agent_name: str, instance_id: str,
+                               expired_before: Optional[float] = None) -> Optional[int]:
+        '''Remove an instance of an agent, only if its last heartbeat is older than expired_before when given,
+        returning the number of instances left, or None if the instance was not expired.'''
+        instances_key = self._agent_instances_key(agent_name)
+        pipe = self.redis_db.pipeline(transaction=True)
+        while True:
+            pipe.watch(instances_key)
+            try:
+                last_heartbeat = pipe.hget(instances_key, instance_id)
+                if expired_before is not None and (last_heartbeat is None or float(last_heartbeat) >= expired_before):
+                    pipe.unwatch()
+                    return None
+                remaining = pipe.hlen(instances_key) - (last_heartbeat is not None)
+                pipe.multi()
+                pipe.hdel(instances_key, instance_id)
+                if remaining == 0:
+                    pipe.hdel("agents", agent_name)
+                    pipe.incr(self.AGENTS_VERSION)
+                pipe.execute()
+                return remaining
+            except redis.WatchError:
+                logging.debug("WatchError in _remove_agent_instance")
+                continue
+            finally:
+                pipe.reset()
+
+    def touch_agent_instances(self, instances: Dict[Tuple[str, str], Any], now: float):
+        if not instances:
+            return
+        if self._touch_agent_instances_script is None:
+            self._touch_agent_instances_script = self.redis_db.register_script(self.TOUCH_AGENT_INSTANCES_SCRIPT)
+        args : List[Any] = [now]
+        for (agent_name, instance_id), agent_metadata in instances.items():
+            args += [agent_name, instance_id, self.codec.encode(agent_metadata)]
+        self._touch_agent_instances_script(keys=["agents", self.AGENTS_VERSION] +
+                                           [self._agent_instances_key(agent_name) for agent_name, _ in instances],
+                                           args=args)
+
+    def get_agent_instances(self) -> Dict[str, Dict[str, float]]:
+        agent_names = list(self.get_agents())
+        pipeline = self.redis_db.pipeline(transaction=False)
+        for agent_name in agent_names:
+            pipeline.hgetall(self._agent_instances_key(agent_name))
+        instances = {}
+        for agent_name, entries in zip(agent_names, pipeline.execute()):
+            if entries:
+                instances[agent_name] = {instance_id.decode("utf-8"): float(last_heartbeat)
+                                         for instance_id, last_heartbeat in entries.items()}
+        return instances
+
+    def get_agents(self) -> Dict[str, Any]:
+        return dict(self._get_directory("agents", self.AGENTS_VERSION, self.codec.decode))
+
+    def get_agent(self, agent_name: str) -> Optional[Any]:
+        return self._get_directory("agents", self.AGENTS_VERSION, self.codec.decode).get(agent_name)
+
+    def register_tool(self, tool: Any):
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.hset("tools", key=tool.name, value=pickle.dumps(tool))
+        pipeline.incr(self.TOOLS_VERSION)
+        pipeline.execute()
+
+    def get_tools(self) -> Dict[str, Any]:
+        return dict(self._get_directory("tools", self.TOOLS_VERSION, pickle.loads))
+
+    def get_tool(self, tool_name: str) -> Optional[Any]:
+        return self._get_directory("tools", self.TOOLS_VERSION, pickle.loads).get(tool_name)
+
+    def _get_directory(self, hash_name: str, version_key: str, decode: Callable[[bytes], Any]) -> Dict[str, Any]:
+        '''
+        Get the decoded content of the agents or tools hash, reading it from redis only if its version
+        changed since it was last read by this process.
+
+        Args:
+            hash_name (str): the name of the hash
+            version_key (str): the name of the counter incremented by every change to the hash
+            decode (Callable[[bytes], Any]): the function used to decode the values of the hash
+
+        Returns:
+            Dict[str, Any]: the decoded hash, shared by all the callers in the process
+        '''
+        version = int(self.redis_db.get(version_key) or 0)
+        cached = self._directory_cache.get(hash_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        pipeline = self.redis_db.pipeline(transaction=True)
+        pipeline.get(version_key)
+        pipeline.hgetall(hash_name)
+        version, entries = pipeline.execute()
+        version = int(version or 0)
+        directory = {key.decode("utf-8"): decode(value) for key, value in entries.items()}
+        with self._directory_cache_lock:
+            self._directory_cache[hash_name] = (version, directory)
+        logging.debug(f"Read {len(directory)} entries of {hash_name} at version {version}")
+        return directory
+
+
+register_context_store(RedisWiseAgentContextStore)
@@ -0,0 +1,358 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from wiseagents.context_stores.wise_agent_context_store import WiseAgentContextStore, register_context_store, parse_trace_id
+
+
+class SQLiteWiseAgentContextStore(WiseAgentContextStore):
+    '''
+    A context store keeping the contexts, the agents and the tools in a local SQLite database, for the deployments
+    running on a single host which need their state to survive a restart without running a redis server. The
+    agents can run in the same process or in several processes sharing the database file.
+
+    The database is opened in WAL mode, so that readers don't block the writer, with synchronous=NORMAL, which
+    is durable across process crashes and only loses the most recent transactions on a power failure. Each
+    thread uses its own connection. The store is configured with the following keys of registry_config.yaml:
+
+        sqlite_path: the path of the database file, defaults to .wise-agents/context_store.db
+        sqlite_busy_timeout: the number of seconds to wait for the lock held by another writer, defaults to 30
+    '''
+
+    name = "sqlite"
+
+    DEFAULT_PATH = os.path.join(".wise-agents", "context_store.db")
+    DEFAULT_BUSY_TIMEOUT = 30
+
+    # The upper bound of the trace ids, used for the "+" trace id
+    _MAX_TRACE_ID = (2 ** 63 - 1, 2 ** 63 - 1)
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contexts (
+            name TEXT PRIMARY KEY,
+            context BLOB NOT NULL,
+            created_at REAL,
+            last_access REAL
+        );
+        CREATE TABLE IF NOT EXISTS context_fields (
+            context_name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB,
+            PRIMARY KEY (context_name, key)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS context_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            context_name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB
+        );
+        CREATE INDEX IF NOT EXISTS context_lists_by_key ON context_lists (context_name, key, id);
+        CREATE TABLE IF NOT EXISTS context_trace (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            context_name TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            message BLOB
+        );
+        CREATE INDEX IF NOT EXISTS context_trace_by_context ON context_trace (context_name, id);
+        CREATE TABLE IF NOT EXISTS agents (
+            name TEXT PRIMARY KEY,
+            metadata BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS agent_instances (
+            agent_name TEXT NOT NULL,
+            instance_id TEXT NOT NULL,
+            last_heartbeat REAL NOT NULL,
+            PRIMARY KEY (agent_name, instance_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS tools (
+            name TEXT PRIMARY KEY,
+            tool BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self._path = config.get("sqlite_path", self.DEFAULT_PATH)
+        self._busy_timeout = config.get("sqlite_busy_timeout", self.DEFAULT_BUSY_TIMEOUT)
+        self._local = threading.local()
+        self._connections : List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+        logging.debug(f"Using the SQLite context store {self._path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        '''Get the connection of the current thread, opening it if needed.'''
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode, the transactions are started explicitly
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        '''Close the connections of all the threads.'''
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        '''
+        Run the with block in a write transaction, rolled back if the block raises an exception.
+        The transaction takes the write lock immediately, so that the reads within the block see the
+        data as it is when the block writes it. A block within another transaction joins it.
+        '''
+        connection = self._connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @contextmanager
+    def batch(self, context_name: str) -> Iterator[None]:
+        '''Apply the changes made within the with block in a single transaction, which is rolled back if the
+        block raises an exception. The transaction holds the write lock of the database, so batches should be short.'''
+        with self._transaction():
+            yield
+
+    def register_context(self, context: Any, now: float):
+        is_sub_context = "_" in context.name
+        try:
+            self._connection().execute("INSERT INTO contexts (name, context, created_at, last_access) VALUES (?, ?, ?, ?)",
+                                       (context.name, pickle.dumps(context), now if is_sub_context else None,
+                                        now if is_sub_context else None))
+        except sqlite3.IntegrityError:
+            raise NameError(f"Context with name {context.name} already exists")
+
+    def get_context(self, context_name: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT context FROM contexts WHERE name = ?", (context_name,)).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def get_contexts(self) -> Dict[str, Any]:
+        return {name: pickle.loads(context) for name, context in
+                self._connection().execute("SELECT name, context FROM contexts")}
+
+    def context_exists(self, context_name: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM contexts WHERE name = ?", (context_name,)).fetchone() is not None
+
+    def remove_context(self, context_name: str):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM contexts WHERE name = ?", (context_name,))
+            for table in ("context_fields", "context_lists", "context_trace"):
+                connection.execute(f"DELETE FROM {table} WHERE context_name = ?", (context_name,))
+
+    def touch_context(self, context_name: str, now: float):
+        self._connection().execute("UPDATE contexts SET last_access = ? WHERE name = ? AND last_access IS NOT NULL",
+                                   (now, context_name))
+
+    def get_expired_context_names(self, ttl: Optional[float], idle_timeout: Optional[float], now: float) -> List[str]:
+        conditions = []
+        parameters = []
+        if ttl is not None:
+            conditions.append("created_at <= ?")
+            parameters.append(now - ttl)
+        if idle_timeout is not None:
+            conditions.append("last_access <= ?")
+            parameters.append(now - idle_timeout)
+        if not conditions:
+            return []
+        return [name for name, in
+                self._connection().execute(f"SELECT name FROM contexts WHERE {' OR '.join(conditions)}", parameters)]
+
+    def get_context_stats(self) -> Dict[str, int]:
+        live_contexts, size = self._connection().execute("""
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(context)), 0)
+                + (SELECT COALESCE(SUM(LENGTH(value)), 0) FROM context_fields WHERE context_name IN (SELECT name FROM contexts))
+                + (SELECT COALESCE(SUM(LENGTH(value)), 0) FROM context_lists WHERE context_name IN (SELECT name FROM contexts))
+                + (SELECT COALESCE(SUM(LENGTH(message)), 0) FROM context_trace WHERE context_name IN (SELECT name FROM contexts))
+            FROM contexts""").fetchone()
+        return {"live_contexts": live_contexts, "bytes": size}
+
+    def get_field(self, context_name: str, key: str, default: Any = None) -> Any:
+        row = self._connection().execute("SELECT value FROM context_fields WHERE context_name = ? AND key = ?",
+                                         (context_name, key)).fetchone()
+        return self.codec.decode(row[0]) if row is not None else default
+
+    def get_fields(self, context_name: str) -> Dict[str, Any]:
+        return {key: self.codec.decode(value) for key, value in
+                self._connection().execute("SELECT key, value FROM context_fields WHERE context_name = ?", (context_name,))}
+
+    def get_snapshot(self, context_name: str, list_keys: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        '''Read the fields and the last elements in a read transaction, which doesn't block the writers.'''
+        connection = self._connection()
+        if connection.in_transaction:
+            return super().get_snapshot(context_name, list_keys)
+        connection.execute("BEGIN DEFERRED")
+        try:
+            return (self.get_fields(context_name),
+                    {key: self.get_last_list_element(context_name, key) for key in list_keys})
+        finally:
+            connection.execute("COMMIT")
+
+    def set_field(self, context_name: str, key: str, value: Any):
+        self._connection().execute("INSERT OR REPLACE INTO context_fields (context_name, key, value) VALUES (?, ?, ?)",
+                                   (context_name, key, self.codec.encode(value)))
+
+    def get_list(self, context_name: str, key: str) -> List:
+        return [self.codec.decode(value) for value, in
+                self._connection().execute("SELECT value FROM context_lists WHERE context_name = ? AND key = ? ORDER BY id",
+                                           (context_name, key))]
+
+    def get_last_list_element(self, context_name: str, key: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT value FROM context_lists WHERE context_name = ? AND key = ? "
+                                         "ORDER BY id DESC LIMIT 1", (context_name, key)).fetchone()
+        return self.codec.decode(row[0]) if row is not None else None
+
+    def append_to_list(self, context_name: str, key: str, value: Any):
+        self._connection().execute("INSERT INTO context_lists (context_name, key, value) VALUES (?, ?, ?)",
+                                   (context_name, key, self.codec.encode(value)))
+
+    def remove_from_list(self, context_name: str, key: str, value: Any) -> int:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM context_lists WHERE id = (SELECT id FROM context_lists "
+                               "WHERE context_name = ? AND key = ? AND value = ? ORDER BY id LIMIT 1)",
+                               (context_name, key, self.codec.encode(value)))
+            return connection.execute("SELECT COUNT(*) FROM context_lists WHERE context_name = ? AND key = ?",
+                                      (context_name, key)).fetchone()[0]
+
+    def replace_list(self, context_name: str, key: str, values: List):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM context_lists WHERE context_name = ? AND key = ?", (context_name, key))
+            connection.executemany("INSERT INTO context_lists (context_name, key, value) VALUES (?, ?, ?)",
+                                   [(context_name, key, self.codec.encode(value)) for value in values])
+
+    def merge_list(self, source_context_name: str, target_context_name: str, key: str) -> int:
+        return self._connection().execute("INSERT INTO context_lists (context_name, key, value) SELECT ?, key, value "
+                                          "FROM context_lists WHERE context_name = ? AND key = ? ORDER BY id",
+                                          (target_context_name, source_context_name, key)).rowcount
+
+    def trace(self, context_name: str, message: Any, max_length: int):
+        '''Trace the string representation of the message, deleting the messages beyond the most recent max_length.'''
+        with self._transaction() as connection:
+            connection.execute("INSERT INTO context_trace (context_name, created_at, message) VALUES (?, ?, ?)",
+                               (context_name, int(time.time() * 1000), self.codec.encode(message.__repr__())))
+            connection.execute("DELETE FROM context_trace WHERE context_name = ? AND id <= (SELECT id FROM context_trace "
+                               "WHERE context_name = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                               (context_name, context_name, max_length))
+
+    def get_trace_tail(self, context_name: str, count: int) -> List[Any]:
+        rows = self._connection().execute("SELECT message FROM context_trace WHERE context_name = ? ORDER BY id DESC LIMIT ?",
+                                          (context_name, count)).fetchall()
+        return [self.codec.decode(message) for message, in reversed(rows)]
+
+    def get_trace_range(self, context_name: str, start: str = "-", end: str = "+",
+                        count: Optional[int] = None) -> List[Tuple[str, Any]]:
+        lower, include_lower = parse_trace_id(start, (0, 0))
+        upper, include_upper = parse_trace_id(end, self._MAX_TRACE_ID)
+        rows = self._connection().execute(
+            f"SELECT created_at, id, message FROM context_trace WHERE context_name = ? "
+            f"AND (created_at, id) {'>=' if include_lower else '>'} (?, ?) "
+            f"AND (created_at, id) {'<=' if include_upper else '<'} (?, ?) ORDER BY id LIMIT ?",
+            (context_name, *lower, *upper, count if count is not None else -1))
+        return [(f"{created_at}-{entry_id}", self.codec.decode(message)) for created_at, entry_id, message in rows]
+
+    def register_agent(self, agent_name: str, agent_metadata: Any):
+        try:
+            self._connection().execute("INSERT INTO agents (name, metadata) VALUES (?, ?)",
+                                       (agent_name, self.codec.encode(agent_metadata)))
+        except sqlite3.IntegrityError:
+            raise NameError(f"Agent with name {agent_name} already exists")
+
+    def unregister_agent(self, agent_name: str):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM agents WHERE name = ?", (agent_name,))
+            connection.execute("DELETE FROM agent_instances WHERE agent_name = ?", (agent_name,))
+
+    def register_agent_instance(self, agent_name: str, instance_id: str, agent_metadata: Any, now: float) -> int:
+        with self._transaction() as connection:
+            row = connection.execute("SELECT metadata FROM agents WHERE name = ?", (agent_name,)).fetchone()
+            if row is None:
+                connection.execute("INSERT INTO agents (name, metadata) VALUES (?, ?)",
+                                   (agent_name, self.codec.encode(agent_metadata)))
+            elif self.codec.decode(row[0]) != agent_metadata:
+                raise NameError(f"Agent with name {agent_name} already exists with different metadata")
+            connection.execute("INSERT OR REPLACE INTO agent_instances (agent_name, instance_id, last_heartbeat) "
+                               "VALUES (?, ?, ?)", (agent_name, instance_id, now))
+            return connection.execute("SELECT COUNT(*) FROM agent_instances WHERE agent_name = ?",
+                                      (agent_name,)).fetchone()[0]
+
+    def unregister_agent_instance(self, agent_name: str, instance_id: str) -> int:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM agent_instances WHERE agent_name = ? AND instance_id = ?",
+                               (agent_name, instance_id))
+            return self._remove_agent_without_instances(connection, agent_name)
+
+    def expire_agent_instance(self, agent_name: str, instance_id: str, expired_before: float) -> bool:
+        with self._transaction() as connection:
+            if connection.execute("DELETE FROM agent_instances WHERE agent_name = ? AND instance_id = ? "
+                                  "AND last_heartbeat < ?", (agent_name, instance_id, expired_before)).rowcount == 0:
+                return False
+            self._remove_agent_without_instances(connection, agent_name)
+            return True
+
+    def _remove_agent_without_instances(self, connection: sqlite3.Connection, agent_name: str) -> int:
+        '''Remove the metadata of an agent if it has no instances left, returning the number of its instances.'''
+        count = connection.execute("SELECT COUNT(*) FROM agent_instances WHERE agent_name = ?",
+                                   (agent_name,)).fetchone()[0]
+        if count == 0:
+            connection.execute("DELETE FROM agents WHERE name = ?", (agent_name,))
+        return count
+
+    def touch_agent_instances(self, instances: Dict[Tuple[str, str], Any], now: float):
+        with self._transaction() as connection:
+            connection.executemany("INSERT OR IGNORE INTO agents (name, metadata) VALUES (?, ?)",
+                                   [(agent_name, self.codec.encode(agent_metadata))
+                                    for (agent_name, _), agent_metadata in instances.items()])
+            connection.executemany("INSERT OR REPLACE INTO agent_instances (agent_name, instance_id, last_heartbeat) "
+                                   "VALUES (?, ?, ?)",
+                                   [(agent_name, instance_id, now) for agent_name, instance_id in instances])
+
+    def get_agent_instances(self) -> Dict[str, Dict[str, float]]:
+        instances : Dict[str, Dict[str, float]] = {}
+        for agent_name, instance_id, last_heartbeat in self._connection().execute(
+                "SELECT agent_name, instance_id, last_heartbeat FROM agent_instances"):
+            instances.setdefault(agent_name, {})[instance_id] = last_heartbeat
+        return instances
+
+    def get_agents(self) -> Dict[str, Any]:
+        return {name: self.codec.decode(metadata) for name, metadata in
+                self._connection().execute("SELECT name, metadata FROM agents")}
+
+    def get_agent(self, agent_name: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT metadata FROM agents WHERE name = ?", (agent_name,)).fetchone()
+        return self.codec.decode(row[0]) if row is not None else None
+
+    def register_tool(self, tool: Any):
+        self._connection().execute("INSERT OR REPLACE INTO tools (name, tool) VALUES (?, ?)",
+                                   (tool.name, pickle.dumps(tool)))
+
+    def get_tools(self) -> Dict[str, Any]:
+        return {name: pickle.loads(tool) for name, tool in self._connection().execute("SELECT name, tool FROM tools")}
+
+    def get_tool(self, tool_name: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT tool FROM tools WHERE name = ?", (tool_name,)).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+
+register_context_store(SQLiteWiseAgentContextStore)
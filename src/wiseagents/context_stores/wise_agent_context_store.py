@@ -0,0 +1,398 @@
+import threading
+from abc import abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from wiseagents.wise_agent_codecs import WiseAgentCodec, get_codec
+
+
+class WiseAgentContextStore:
+    '''
+    A WiseAgentContextStore holds the state shared by the agents: the contexts and their data, and the agents and
+    tools registered in the registry. WiseAgentContext and WiseAgentRegistry delegate all their storage to the store
+    selected with the context_store key of registry_config.yaml, so that the same agents can run in a single process,
+    on a single host with persistent state or distributed across several hosts.
+
+    The data of a context is made of fields, holding single values, and lists, identified by the name of the
+    field. Contexts are identified by their name, which is also passed to every method accessing their data.
+    '''
+
+    name : str = None
+
+    def __init__(self, config: Dict[str, Any]):
+        '''
+        Initialize the store.
+
+        Args:
+            config (Dict[str, Any]): the registry configuration
+        '''
+        self._config = config
+
+    @property
+    def codec(self) -> WiseAgentCodec:
+        '''Get the codec used to serialize the values stored by the store, configured with the serializer key.'''
+        return get_codec(self._config.get("serializer"))
+
+    def close(self):
+        '''Release the resources held by the store.'''
+        pass
+
+    @contextmanager
+    def batch(self, context_name: str) -> Iterator[None]:
+        '''
+        Apply the changes made to the data of the given context within the with block atomically, see
+        WiseAgentContext.batch. Nested batches join the outermost one.
+
+        Args:
+            context_name (str): the name of the context
+        '''
+        yield
+
+    # Contexts
+
+    @abstractmethod
+    def register_context(self, context: Any, now: float):
+        '''
+        Register the given context, raising a NameError if a context with the same name already exists.
+
+        Args:
+            context (WiseAgentContext): the context
+            now (float): the registration time, recorded for the sub contexts so that they can be expired
+        '''
+        ...
+
+    @abstractmethod
+    def get_context(self, context_name: str) -> Optional[Any]:
+        '''
+        Get the context with the given name.
+
+        Returns:
+            Optional[WiseAgentContext]: the context or None if it doesn't exist
+        '''
+        ...
+
+    @abstractmethod
+    def get_contexts(self) -> Dict[str, Any]:
+        '''
+        Get all the contexts.
+
+        Returns:
+            Dict[str, WiseAgentContext]: a new dict with the context names as keys and the contexts as values
+        '''
+        ...
+
+    @abstractmethod
+    def context_exists(self, context_name: str) -> bool:
+        '''Get whether a context with the given name exists.'''
+        ...
+
+    @abstractmethod
+    def remove_context(self, context_name: str):
+        '''Remove the context with the given name along with all its data.'''
+        ...
+
+    @abstractmethod
+    def touch_context(self, context_name: str, now: float):
+        '''Record an access to the sub context with the given name, if it still exists.'''
+        ...
+
+    @abstractmethod
+    def get_expired_context_names(self, ttl: Optional[float], idle_timeout: Optional[float], now: float) -> List[str]:
+        '''
+        Get the names of the sub contexts created more than ttl seconds ago or not accessed in the last
+        idle_timeout seconds.
+
+        Args:
+            ttl (Optional[float]): the time to live of the sub contexts, None if they don't expire after a fixed time
+            idle_timeout (Optional[float]): the idle timeout of the sub contexts, None if they don't expire when idle
+            now (float): the current time
+        '''
+        ...
+
+    @abstractmethod
+    def get_context_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics about the contexts.
+
+        Returns:
+            Dict[str, int]: the number of live contexts and the number of bytes used to store them
+        '''
+        ...
+
+    # Context fields
+
+    @abstractmethod
+    def get_field(self, context_name: str, key: str, default: Any = None) -> Any:
+        '''
+        Get a field of a context.
+
+        Args:
+            context_name (str): the name of the context
+            key (str): the name of the field
+            default (Any): the value returned if the field is not set
+        '''
+        ...
+
+    @abstractmethod
+    def set_field(self, context_name: str, key: str, value: Any):
+        '''
+        Set a field of a context.
+
+        Args:
+            context_name (str): the name of the context
+            key (str): the name of the field
+            value (Any): the value of the field
+        '''
+        ...
+
+    @abstractmethod
+    def get_fields(self, context_name: str) -> Dict[str, Any]:
+        '''
+        Get all the fields of a context.
+
+        Returns:
+            Dict[str, Any]: a new dict with the names of the fields set for the context as keys
+        '''
+        ...
+
+    def get_snapshot(self, context_name: str, list_keys: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        '''
+        Get all the fields of a context along with the last element of the given lists, read consistently and
+        with as few round trips to the underlying storage as possible.
+
+        Args:
+            context_name (str): the name of the context
+            list_keys (Iterable[str]): the names of the lists whose last element is read
+
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Any]]: the fields of the context, as returned by get_fields, and the last
+            element of each list, None if the list is empty
+        '''
+        with self.batch(context_name):
+            return (self.get_fields(context_name),
+                    {key: self.get_last_list_element(context_name, key) for key in list_keys})
+
+    # Context lists
+
+    @abstractmethod
+    def get_list(self, context_name: str, key: str) -> List:
+        '''
+        Get a list of a context.
+
+        Returns:
+            List: a copy of the list, empty if the list doesn't exist
+        '''
+        ...
+
+    @abstractmethod
+    def get_last_list_element(self, context_name: str, key: str) -> Optional[Any]:
+        '''Get the last element of a list of a context, None if the list is empty.'''
+        ...
+
+    @abstractmethod
+    def append_to_list(self, context_name: str, key: str, value: Any):
+        '''Append a value to a list of a context.'''
+        ...
+
+    @abstractmethod
+    def remove_from_list(self, context_name: str, key: str, value: Any) -> int:
+        '''
+        Remove the first occurrence of a value from a list of a context.
+
+        Returns:
+            int: the length of the list after the removal, read atomically with the removal so that exactly
+            one of several concurrent callers removing the last elements sees an empty list
+        '''
+        ...
+
+    @abstractmethod
+    def replace_list(self, context_name: str, key: str, values: List):
+        '''Replace the content of a list of a context.'''
+        ...
+
+    @abstractmethod
+    def merge_list(self, source_context_name: str, target_context_name: str, key: str) -> int:
+        '''
+        Append all the elements of a list of a context to the same list of another context, as individual elements,
+        in a single atomic operation whose cost doesn't depend on the length of the target list.
+
+        Args:
+            source_context_name (str): the name of the context whose list is merged
+            target_context_name (str): the name of the context the elements are appended to
+            key (str): the name of the list
+
+        Returns:
+            int: the number of elements appended
+        '''
+        ...
+
+    # Message trace
+
+    @abstractmethod
+    def trace(self, context_name: str, message: Any, max_length: int):
+        '''
+        Trace a message exchanged within a context, keeping about max_length of the most recent messages.
+        Persistent stores keep the string representation of the message.
+        '''
+        ...
+
+    @abstractmethod
+    def get_trace_tail(self, context_name: str, count: int) -> List[Any]:
+        '''Get the last count messages traced in a context, oldest first.'''
+        ...
+
+    @abstractmethod
+    def get_trace_range(self, context_name: str, start: str = "-", end: str = "+",
+                        count: Optional[int] = None) -> List[Tuple[str, Any]]:
+        '''Get the ids and the messages traced in a context between the given trace ids, see
+        WiseAgentContext.get_message_trace_range.'''
+        ...
+
+    # Agents and tools
+
+    @abstractmethod
+    def register_agent(self, agent_name: str, agent_metadata: Any):
+        '''Register the metadata of an agent, raising a NameError if an agent with the same name already exists.'''
+        ...
+
+    @abstractmethod
+    def unregister_agent(self, agent_name: str):
+        '''Remove the metadata of the agent with the given name, along with all its instances.'''
+        ...
+
+    @abstractmethod
+    def register_agent_instance(self, agent_name: str, instance_id: str, agent_metadata: Any, now: float) -> int:
+        '''
+        Register an instance, or replica, of an agent, registering the metadata of the agent along with its first
+        instance. The instances of an agent share its queues, consuming its messages as competing consumers.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (str): the id of the instance, unique among the instances of the agent
+            agent_metadata (Any): the metadata of the agent, which must be equal to the metadata already registered
+            for the agent, if any, otherwise a NameError is raised
+            now (float): the current time, as returned by time.time(), recorded as the last heartbeat of the instance
+
+        Returns:
+            int: the number of instances of the agent, including the new one
+        '''
+        ...
+
+    @abstractmethod
+    def unregister_agent_instance(self, agent_name: str, instance_id: str) -> int:
+        '''
+        Remove an instance of an agent, removing the metadata of the agent along with its last instance.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (str): the id of the instance
+
+        Returns:
+            int: the number of instances of the agent left
+        '''
+        ...
+
+    @abstractmethod
+    def expire_agent_instance(self, agent_name: str, instance_id: str, expired_before: float) -> bool:
+        '''
+        Remove an instance of an agent if its last heartbeat is older than the given time, checked atomically with
+        the removal so that an instance sending a heartbeat meanwhile is kept, removing the metadata of the agent
+        along with its last instance.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (str): the id of the instance
+            expired_before (float): the time before which the last heartbeat of an expired instance was recorded
+
+        Returns:
+            bool: whether the instance was removed
+        '''
+        ...
+
+    @abstractmethod
+    def touch_agent_instances(self, instances: Dict[Tuple[str, str], Any], now: float):
+        '''
+        Record a heartbeat of the given instances, registering again the instances which are missing, e.g. because
+        they were expired while their process was paused, along with the metadata of their agent if it was removed
+        with its last instance.
+
+        Args:
+            instances (Dict[Tuple[str, str], Any]): the agent names and the ids of the instances as keys and the
+            metadata of the agents as values
+            now (float): the current time, as returned by time.time()
+        '''
+        ...
+
+    @abstractmethod
+    def get_agent_instances(self) -> Dict[str, Dict[str, float]]:
+        '''Get a new dict with the agent names as keys and, as values, dicts with the ids of the instances of the
+        agent as keys and the time of their last heartbeat as values.'''
+        ...
+
+    @abstractmethod
+    def get_agents(self) -> Dict[str, Any]:
+        '''Get a new dict with the agent names as keys and the agent metadata as values.'''
+        ...
+
+    @abstractmethod
+    def get_agent(self, agent_name: str) -> Optional[Any]:
+        '''Get the metadata of the agent with the given name, None if the agent is not registered.'''
+        ...
+
+    @abstractmethod
+    def register_tool(self, tool: Any):
+        '''Register a tool, replacing any tool with the same name.'''
+        ...
+
+    @abstractmethod
+    def get_tools(self) -> Dict[str, Any]:
+        '''Get a new dict with the tool names as keys and the tools as values.'''
+        ...
+
+    @abstractmethod
+    def get_tool(self, tool_name: str) -> Optional[Any]:
+        '''Get the tool with the given name, None if the tool is not registered.'''
+        ...
+
+
+def parse_trace_id(trace_id: str, default: Optional[Tuple]) -> Tuple[Optional[Tuple], bool]:
+    '''Parse a message trace id as used by WiseAgentContext.get_message_trace_range, returning the id as a tuple
+    of numbers, or the given default for "-" and "+", and whether the id is inclusive.'''
+    inclusive = not trace_id.startswith("(")
+    trace_id = trace_id.lstrip("(")
+    if trace_id in ("-", "+"):
+        return default, inclusive
+    milliseconds, _, sequence = trace_id.partition("-")
+    return (int(milliseconds), int(sequence or 0)), inclusive
+
+
+_context_store_classes : Dict[str, type] = {}
+_context_store_classes_lock = threading.Lock()
+
+
+def register_context_store(context_store_class: type):
+    """
+    Register a context store class, making it selectable by name with the context_store key of registry_config.yaml.
+
+    Args:
+        context_store_class (type): the WiseAgentContextStore subclass, whose name attribute is used as the store name
+    """
+    with _context_store_classes_lock:
+        _context_store_classes[context_store_class.name] = context_store_class
+
+
+def create_context_store(config: Dict[str, Any]) -> WiseAgentContextStore:
+    """
+    Create the context store selected by the given configuration.
+
+    Args:
+        config (Dict[str, Any]): the registry configuration. The store is selected with the context_store key,
+        which defaults to redis if use_redis is true and to memory otherwise
+
+    Returns:
+        WiseAgentContextStore: the new store
+    """
+    name = config.get("context_store") or ("redis" if config.get("use_redis") == True else "memory")
+    if name not in _context_store_classes:
+        raise ValueError(f"Unknown context store {name}, available context stores are {list(_context_store_classes.keys())}")
+    return _context_store_classes[name](config)
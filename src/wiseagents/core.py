@@ -1,24 +1,31 @@
-import copy
+import asyncio
 import json
 import logging
 import os
-import pickle
+import socket
+import threading
+import time
+import uuid
 
 from abc import abstractmethod
+from contextlib import contextmanager
 from enum import StrEnum, auto
-from typing import Any, Callable, Dict, Iterable, List, Optional
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import yaml
 from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageParam
 
-import redis
-
 from wiseagents import enforce_no_abstract_class_instances
 from wiseagents.graphdb import WiseAgentGraphDB
 from wiseagents.llm import OpenaiAPIWiseAgentLLM, WiseAgentLLM
 from wiseagents.yaml import WiseAgentsYAMLObject
 from wiseagents.vectordb import WiseAgentVectorDB
-from wiseagents.wise_agent_messaging import WiseAgentMessage, WiseAgentMessageType, WiseAgentTransport, WiseAgentEvent
+from wiseagents.wise_agent_messaging import (AsyncWiseAgentTransport, WiseAgentMessage, WiseAgentMessageType,
+                                             WiseAgentTransport, WiseAgentEvent)
+from wiseagents.context_stores import WiseAgentContextStore, create_context_store
+from wiseagents.wise_agent_history import WiseAgentHistoryPolicy
+from wiseagents.wise_agent_redis import WiseAgentRedisConnectionManager
 
 from wiseagents.utils import log_messages_exchanged
 
@@ -115,53 +122,15 @@ class WiseAgentTool(WiseAgentsYAMLObject):
 class WiseAgentContext():
     
     ''' A WiseAgentContext is a class that represents a context in which agents can communicate with each other.
+    The data of the context is kept by the context store of the registry, see WiseAgentRegistry.get_context_store.
     '''
     
-    _message_trace : List[str] = []
-    
-    # A list of chat completion messages
-    _llm_chat_completion : List[ChatCompletionMessageParam] = []
-    
-    # A list of tool names that need to be executed
-    _llm_required_tool_call : List[str] = []
-    
-    # A list of available tools in chat
-    _llm_available_tools_in_chat : List[ChatCompletionToolParam] = []
-
-    # A list of agent names that need to be executed in sequence
-    # Used by a sequential coordinator
-    _agents_sequence : List[str] = []
-
-    # The agent where the final response should be routed to
-    # Used by both a sequential coordinator and a phased coordinator
-    _route_response_to : str = None
-
-    # A list that contains a list of agent names to be executed for each phase
-    # Used by a phased coordinator
-    _agent_phase_assignments : List[List[str]] = []
-
-    # Maps a chat uuid to the current phase. Used by a phased coordinator.
-    _current_phase :  int = None
-
-    # A list of agent names that need to be executed for the current phase
-    # Used by a phased coordinator
-    _required_agents_for_current_phase : List[str] = []
-
-    # A list containing the queries attempted for each iteration executed by
-    # the phased coordinator or sequential memory coordinator
-    _queries : List[str] = []
-
-    # The collaboration type
-    _collaboration_type: WiseAgentCollaborationType = None
-
-    # A boolean value indicating whether to restart a sequence of agents
-    _restart_sequence: bool = False
-
-    _redis_db : redis.Redis = None
-    _use_redis : bool = False
     _config : Dict[str, Any] = {}
     _trace_enabled : bool = False
 
+    # The default number of messages kept in the message trace
+    DEFAULT_TRACE_MAX_LENGTH = 1000
+
 
     def __init__(self, name: str, config : Optional[Dict[str,Any]] = {"use_redis": False}):
         ''' Initialize the context with the given name.
@@ -170,12 +139,9 @@ class WiseAgentContext():
             name (str): the name of the context'''
         self._name = name
         self._config = config
-        WiseAgentRegistry.register_context(self)
-        if config.get("use_redis") == True and self._redis_db is None:
-            self._redis_db = redis.Redis(host=self._config["redis_host"], port=self._config["redis_port"])
-            self._use_redis = True
         if (config.get("trace_enabled") == True):
             self._trace_enabled = True
+        WiseAgentRegistry.register_context(self)
         
     
     def __repr__(self) -> str:
@@ -183,77 +149,49 @@ class WiseAgentContext():
         return (f"{self.__class__.__name__}(name={self.name}, message_trace={self.message_trace},"
                 f"llm_chat_completion={self.llm_chat_completion}, collaboration_type={self.collaboration_type},"
                 f"llm_required_tool_call={self.llm_required_tool_call}, llm_available_tools_in_chat={self.llm_available_tools_in_chat},"
-                f"agents_sequence={self._agents_sequence}, route_response_to={self._route_response_to},"
-                f"agent_phase_assignments={self._agent_phase_assignments}, current_phase={self._current_phase},"
-                f"required_agents_for_current_phase={self._required_agents_for_current_phase}, queries={self._queries})")
+                f"agents_sequence={self.get_agents_sequence()}, route_response_to={self.get_route_response_to()},"
+                f"agent_phase_assignments={self.get_agent_phase_assignments()}, current_phase={self.get_current_phase()},"
+                f"required_agents_for_current_phase={self.get_required_agents_for_current_phase()}, queries={self.get_queries()})")
     def __eq__(self, value: object) -> bool:
         return isinstance(value, WiseAgentContext) and self.__repr__() == value.__repr__()
-    
-    def __getstate__(self) -> object:
-        '''Get the state of the context.'''
-        state = super().__getstate__()
-        if '_redis_db' in state:
-            del state['_redis_db']
-            del state['_use_redis']
-        return state
-    
-    def __setstate__(self, state: object):
-        '''Set the state of the context.'''
-        self.__dict__.update(state)
-        if self._config.get("use_redis") == True and self._redis_db is None:
-            self._redis_db = redis.Redis(host=self._config["redis_host"], port=self._config["redis_port"])
-            self._use_redis = True
-
-    def _append_to_redis_list(self, key: str, value: Any):
-        '''Append a value to a list in redis.'''
-        pipe = self._redis_db.pipeline(transaction=True)
-        while True:
-            pipe.watch(self.name)
-            try:
-                if(pipe.hexists(self.name, key) == False):
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps([value]))
-                    pipe.execute()
-                    return
-                else:
-                    redis_stored_messages = pipe.hget(self.name, key)
-                    stored_messages : List  = pickle.loads(redis_stored_messages)
-                    stored_messages.append(value)
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps(stored_messages))
-                    pipe.execute()
-                    return
-            except redis.WatchError:
-                logging.debug("WatchError in append_to_redis_list for {key}")
-                continue
-    def _remove_from_redis_list(self, key: str, value: Any):
-        '''Remove a value to a list in redis.'''
-        pipe = self._redis_db.pipeline(transaction=True)
-        while True:
-            pipe.watch(self.name)
-            try:
-                if(pipe.hexists(self.name, key) == False):
-                    pipe.unwatch()
-                    return
-                else:
-                    redis_stored_messages = pipe.hget(self.name, key)
-                    stored_messages : List  = pickle.loads(redis_stored_messages)
-                    stored_messages.remove(value)
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps(stored_messages))
-                    pipe.execute()
-                    return
-            except redis.WatchError:
-                logging.debug("WatchError in remove_from_redis_list for {key}")
-                continue
-
-    def _get_list_from_redis(self, key: str) -> List:
-        '''Get a list from redis.'''
-        redis_return =  self._redis_db.hget(self.name, key)
-        if (redis_return is not None):
-            return pickle.loads(redis_return)
-        else:
-            return []
+
+    @property
+    def _store(self) -> WiseAgentContextStore:
+        '''Get the store keeping the data of the context.'''
+        return WiseAgentRegistry.get_context_store()
+
+    @contextmanager
+    def batch(self) -> Iterator["WiseAgentContext"]:
+        '''
+        Apply the changes made to the context within the with block atomically, e.g.
+
+            with context.batch():
+                context.set_collaboration_type(WiseAgentCollaborationType.PHASED)
+                context.set_route_response_to(agent_name)
+
+        When redis is used, the changes are buffered and sent to redis as a single transactional pipeline
+        when the block exits, reads within the block see the buffered changes and nothing is sent to redis
+        if the block raises an exception. When sqlite is used, the block runs in a single transaction. When
+        the contexts are kept in memory, the changes are applied immediately, while holding the lock of the
+        context, so that other threads see either none or all of them. A batch is only visible to the thread
+        that opened it and nested batches join the outermost one.
+        '''
+        with self._store.batch(self.name):
+            yield self
+
+    def snapshot(self) -> "WiseAgentContextSnapshot":
+        '''
+        Read all the fields of the context, along with its current query, at once. When redis is used, they are
+        read with a single round trip instead of one for each field, so handlers reading several fields, e.g. the
+        collaboration type, the agents sequence and the agent to route the response to, should read them from a
+        snapshot.
+
+        Returns:
+            WiseAgentContextSnapshot: an immutable view of the fields of the context as they were when the
+            snapshot was taken. Later changes to the context are not visible through it
+        '''
+        fields, last_elements = self._store.get_snapshot(self.name, ("queries",))
+        return WiseAgentContextSnapshot(self.name, fields, last_elements["queries"])
 
     @property   
     def name(self) -> str:
@@ -266,29 +204,58 @@ class WiseAgentContext():
         return self._trace_enabled
 
     @property
-    def message_trace(self) -> List[str]:
-        """Get the message trace of the context."""
-        if (self._use_redis == True):
-            return self._get_list_from_redis("message_trace")
-        else:
-            return self._message_trace
+    def trace_max_length(self) -> int:
+        """Get the maximum number of messages kept in the message trace of the context."""
+        return self._config.get("trace_max_length", self.DEFAULT_TRACE_MAX_LENGTH)
+
+    @property
+    def message_trace(self) -> List[Any]:
+        """Get the most recent messages traced in the context, up to trace_max_length messages, oldest first."""
+        return [message for _, message in self.get_message_trace_range()]
+
+    def get_message_trace_tail(self, count: int) -> List[Any]:
+        """
+        Get the last messages traced in the context.
+
+        Args:
+            count (int): the maximum number of messages to return
+
+        Returns:
+            List[Any]: the last count messages, oldest first. When redis or sqlite is used, the messages are
+            represented as strings, otherwise they are the traced WiseAgentMessage instances
+        """
+        if count <= 0:
+            return []
+        return self._store.get_trace_tail(self.name, count)
+
+    def get_message_trace_range(self, start: str = "-", end: str = "+",
+                                count: Optional[int] = None) -> List[Tuple[str, Any]]:
+        """
+        Get the messages traced in the context between the given trace ids, e.g. to read only the messages
+        traced after the last one already read by passing its id prefixed by "(" as start.
+
+        Args:
+            start (str): the id of the first message, "-" for the oldest message. The id is excluded if prefixed by "("
+            end (str): the id of the last message, "+" for the most recent message. The id is excluded if prefixed by "("
+            count (Optional[int]): the maximum number of messages to return
+
+        Returns:
+            List[Tuple[str, Any]]: the ids and the messages, oldest first. When redis is used, the ids are the redis
+            stream ids. When redis or sqlite is used, the messages are represented as strings, otherwise they are
+            the traced WiseAgentMessage instances
+        """
+        return self._store.get_trace_range(self.name, start, end, count)
 
     def trace(self, message : WiseAgentMessage):
-        '''Trace the message.'''
+        '''Trace the message, keeping only the most recent trace_max_length messages.'''
         if (self.trace_enabled):
-            if (self._use_redis == True):
-                self._append_to_redis_list("message_trace", message.__repr__())
-            else:
-                self._message_trace.append(message)   
+            self._store.trace(self.name, message, self.trace_max_length)
                 
     
     @property
     def llm_chat_completion(self) -> List[ChatCompletionMessageParam]:
         """Get the LLM chat completion of the context."""
-        if (self._use_redis == True):
-            return self._get_list_from_redis("llm_chat_completion")
-        else:
-            return self._llm_chat_completion   
+        return self._store.get_list(self.name, "llm_chat_completion")
             
     
     def append_chat_completion(self, messages: Iterable[ChatCompletionMessageParam]):
@@ -296,59 +263,43 @@ class WiseAgentContext():
 
         Args:
             messages (Iterable[ChatCompletionMessageParam]): the messages to append'''
-            
-        if (self._use_redis == True):
-            self._append_to_redis_list("llm_chat_completion", messages)
-        else:
-            self._llm_chat_completion.append(messages)
+        self._store.append_to_list(self.name, "llm_chat_completion", messages)
 
 
     @property
     def llm_required_tool_call(self) -> List[str]:
         """Get the LLM required tool call of the context.
         return List[str]"""
-        if (self._use_redis == True):
-            return self._get_list_from_redis("llm_required_tool_call")
-        else:
-            return self._llm_required_tool_call
+        return self._store.get_list(self.name, "llm_required_tool_call")
     
     def append_required_tool_call(self, tool_name: str):
         '''Append required tool call to the context.
 
         Args:
             tool_name (str): the tool name to append'''
-        if (self._use_redis == True):
-            self._append_to_redis_list("llm_required_tool_call", tool_name)
-        else:
-            self._llm_required_tool_call.append(tool_name)
+        self._store.append_to_list(self.name, "llm_required_tool_call", tool_name)
     
-    def remove_required_tool_call(self, tool_name: str):
+    def remove_required_tool_call(self, tool_name: str) -> int:
         '''Remove required tool call from the context.
 
         Args:
-            tool_name (str): the tool name to remove'''
-        if (self._use_redis == True):
-            self._remove_from_redis_list("llm_required_tool_call", tool_name) #remove first occurence of tool_name
-        else:
-            self._llm_required_tool_call.remove(tool_name) #remove first occurence of tool_name
+            tool_name (str): the tool name to remove
+
+        Returns:
+            int: the number of tool calls still required, read atomically with the removal'''
+        return self._store.remove_from_list(self.name, "llm_required_tool_call", tool_name) #remove first occurence of tool_name
         
     @property
     def llm_available_tools_in_chat(self) -> List[ChatCompletionToolParam]:
         """Get the LLM available tools in chat of the context."""
-        if (self._use_redis == True):
-            return self._get_list_from_redis("llm_available_tools_in_chat")
-        else:
-            return self._llm_available_tools_in_chat
+        return self._store.get_list(self.name, "llm_available_tools_in_chat")
     
     def append_available_tool_in_chat(self, tools: Iterable[ChatCompletionToolParam]):
         '''Append available tool in chat to the context.
 
         Args:
             tools (Iterable[ChatCompletionToolParam]): the tools to append'''
-        if (self._use_redis == True):
-            self._append_to_redis_list("llm_available_tools_in_chat", tools)
-        else:
-            self._llm_available_tools_in_chat.append(tools)
+        self._store.append_to_list(self.name, "llm_available_tools_in_chat", tools)
     
     def get_agents_sequence(self) -> List[str]:
         """
@@ -360,10 +311,7 @@ class WiseAgentContext():
         Returns:
             List[str]: the sequence of agents names or an empty list if no sequence has been set for this context
         """
-        if (self._use_redis == True):
-            return self._get_list_from_redis("agents_sequence")
-        else:
-            return self._agents_sequence
+        return self._store.get_field(self.name, "agents_sequence", [])
 
     def set_agents_sequence(self, agents_sequence: List[str]):
         """
@@ -374,10 +322,7 @@ class WiseAgentContext():
         Args:
             agents_sequence (List[str]): the sequence of agent names
         """
-        if (self._use_redis == True):
-            self._redis_db.hset(self.name, "agents_sequence", pickle.dumps(agents_sequence))
-        else:
-            self._agents_sequence = agents_sequence
+        self._store.set_field(self.name, "agents_sequence", agents_sequence)
 
     def get_route_response_to(self) -> Optional[str]:
         """
@@ -387,10 +332,7 @@ class WiseAgentContext():
         Returns:
             Optional[str]: the name of the agent where the final response should be routed to or None if no agent is set
         """
-        if (self._use_redis == True):
-            return self._redis_db.hget(self.name, "route_response_to").decode("utf-8")
-        else: 
-            return self._route_response_to
+        return self._store.get_field(self.name, "route_response_to")
             
     def set_route_response_to(self, agent: str):
         """
@@ -400,10 +342,7 @@ class WiseAgentContext():
         Args:
             agent (str): the name of the agent where the final response should be routed to
         """
-        if (self._use_redis == True):
-            self._redis_db.hset(self.name, "route_response_to", agent)
-        else:
-            self._route_response_to = agent
+        self._store.set_field(self.name, "route_response_to", agent)
 
     def get_next_agent_in_sequence(self, current_agent: str):
         """
@@ -417,13 +356,7 @@ class WiseAgentContext():
             str: the name of the next agent in the sequence after the current agent or None if there are no remaining
             agents in the sequence after the current agent
         """
-        agents_sequence = self.get_agents_sequence()
-        if current_agent in agents_sequence:
-            current_agent_index = agents_sequence.index(current_agent)
-            next_agent_index = current_agent_index + 1
-            if next_agent_index < len(agents_sequence):
-                return agents_sequence[next_agent_index]
-        return None
+        return _next_agent_in_sequence(self.get_agents_sequence(), current_agent)
 
     def get_agent_phase_assignments(self) -> List[List[str]]:
         """
@@ -438,10 +371,7 @@ class WiseAgentContext():
             agent names for that phase. An empty list is returned if no phases have been set for the
             given chat uuid
         """
-        if (self._use_redis == True):
-            return self._get_list_from_redis("agent_phase_assignments")
-        else:
-            return self._agent_phase_assignments
+        return self._store.get_field(self.name, "agent_phase_assignments", [])
 
 
     def set_agent_phase_assignments(self, agent_phase_assignments: List[List[str]]):
@@ -454,10 +384,7 @@ class WiseAgentContext():
             list of lists, where the size of the outer list corresponds to the number of phases and each element
             in the list is a list of agent names for that phase.
         """
-        if (self._use_redis == True):
-            self._redis_db.hset(self.name, "agent_phase_assignments", value=pickle.dumps(agent_phase_assignments))
-        else:
-            self._agent_phase_assignments = agent_phase_assignments
+        self._store.set_field(self.name, "agent_phase_assignments", agent_phase_assignments)
 
     def get_current_phase(self) -> int:
         """
@@ -469,14 +396,7 @@ class WiseAgentContext():
         Returns:
             int: the current phase, represented as an integer in the zero-indexed list of phases
         """
-        if (self._use_redis == True):
-            redis_return = self._redis_db.hget(self.name, "current_phase")
-            if redis_return is not None:
-                return pickle.loads(redis_return)
-            else:
-                return None
-        else:
-            return self._current_phase
+        return self._store.get_field(self.name, "current_phase")
 
     def set_current_phase(self, phase: int):
         """
@@ -486,14 +406,10 @@ class WiseAgentContext():
         Args:
             phase (int): the current phase, represented as an integer in the zero-indexed list of phases
         """
-        if (self._use_redis == True):
-            pipeline=self._redis_db.pipeline(transaction=True)
-            pipeline.hset(self.name, "current_phase", pickle.dumps(phase))
-            pipeline.hset(self.name, "required_agents_for_current_phase", value=pickle.dumps(self.get_agent_phase_assignments()[phase]))
-            pipeline.execute()
-        else:
-            self._current_phase = phase
-            self._required_agents_for_current_phase = copy.deepcopy(self._agent_phase_assignments[phase])
+        with self.batch():
+            self._store.set_field(self.name, "current_phase", phase)
+            self._store.replace_list(self.name, "required_agents_for_current_phase",
+                                     self.get_agent_phase_assignments()[phase])
 
     def get_agents_for_next_phase(self) -> Optional[List]:
         """
@@ -505,11 +421,13 @@ class WiseAgentContext():
         Returns:
             Optional[List[str]]: the list of agent names for the next phase or None if there are no more phases
         """
-        current_phase = self.get_current_phase()
-        next_phase = current_phase + 1
-        if next_phase < len(self.get_agent_phase_assignments()):
-            self.set_current_phase(next_phase)
-            return self.get_agent_phase_assignments()[next_phase]
+        with self.batch():
+            current_phase = self.get_current_phase()
+            next_phase = current_phase + 1
+            agent_phase_assignments = self.get_agent_phase_assignments()
+            if next_phase < len(agent_phase_assignments):
+                self.set_current_phase(next_phase)
+                return agent_phase_assignments[next_phase]
         return None
 
     def get_required_agents_for_current_phase(self) -> List[str]:
@@ -523,24 +441,21 @@ class WiseAgentContext():
             List[str]: the list of agent names that still need to be executed for the current phase or an empty list
             if there are no remaining agents that need to be executed for the current phase
         """
-        if (self._use_redis == True):
-            return self._get_list_from_redis("required_agents_for_current_phase")
-        else:
-            return self._required_agents_for_current_phase
+        return self._store.get_list(self.name, "required_agents_for_current_phase")
 
-    def remove_required_agent_for_current_phase(self, agent_name: str):
+    def remove_required_agent_for_current_phase(self, agent_name: str) -> int:
         """
         Remove the given agent from the list of required agents for the current phase for this
         context. This is used by a phased coordinator.
 
         Args:
-            chat_uuid (str): the chat uuid
             agent_name (str): the name of the agent to remove
+
+        Returns:
+            int: the number of agents still required for the current phase, read atomically with the removal,
+            so that only the caller removing the last agent sees 0
         """
-        if (self._use_redis == True):
-            self._remove_from_redis_list("required_agents_for_current_phase", agent_name)
-        else:
-            self._required_agents_for_current_phase.remove(agent_name)
+        return self._store.remove_from_list(self.name, "required_agents_for_current_phase", agent_name)
 
     def get_current_query(self) -> Optional[str]:
         """
@@ -552,14 +467,8 @@ class WiseAgentContext():
         Returns:
             Optional[str]: the current query or None if there is no current query
         """
-        if (self._use_redis == True):
-            return self._get_list_from_redis("queries")[0]
-        else:
-            if self._queries:
-                # return the last query
-                return self._queries[-1]
-            else:
-                return None
+        # return the last query
+        return self._store.get_last_list_element(self.name, "queries")
 
     def add_query(self, query: str):
         """
@@ -569,10 +478,7 @@ class WiseAgentContext():
         Args:
             query (str): the current query
         """
-        if (self._use_redis == True):
-            self._append_to_redis_list("queries", query)
-        else:
-            self._queries.append(query)
+        self._store.append_to_list(self.name, "queries", query)
 
     def get_queries(self) -> List[str]:
         """
@@ -582,22 +488,13 @@ class WiseAgentContext():
         Returns:
             List[str]: the queries attempted for the given chat uuid for this context
         """
-        if (self._use_redis == True):
-            return self._get_list_from_redis("queries")
-        else:
-            return self._queries
+        return self._store.get_list(self.name, "queries")
         
     @property
     def collaboration_type(self) -> WiseAgentCollaborationType:
         """Get the collaboration type for this context."""
-        if (self._use_redis == True):
-            collaboration_type = self._redis_db.hget(self.name, "collaboration_type")
-            if (collaboration_type is not None):
-                return WiseAgentCollaborationType(collaboration_type.decode("utf-8"))
-            else:
-                return WiseAgentCollaborationType.INDEPENDENT   
-        else:
-            return self._collaboration_type
+        return WiseAgentCollaborationType(self._store.get_field(self.name, "collaboration_type",
+                                                                WiseAgentCollaborationType.INDEPENDENT.value))
 
     def set_collaboration_type(self, collaboration_type: WiseAgentCollaborationType):
         """
@@ -606,11 +503,7 @@ class WiseAgentContext():
         Args:
             collaboration_type (WiseAgentCollaborationType): the collaboration type
         """
-            
-        if (self._use_redis == True):
-            self._redis_db.hset(self.name, "collaboration_type", value=collaboration_type.value)
-        else:
-            self._collaboration_type = collaboration_type
+        self._store.set_field(self.name, "collaboration_type", collaboration_type.value)
     
     def set_restart_sequence(self, restart_sequence: bool):
         """
@@ -620,10 +513,7 @@ class WiseAgentContext():
         Args:
             restart_sequence(bool): whether to restart a sequence of agents
         """
-        if (self._use_redis == True):
-            self._redis_db.hset(self.name, "restart_sequence", value=pickle.dumps(restart_sequence))
-        else:
-            self._restart_sequence = restart_sequence
+        self._store.set_field(self.name, "restart_sequence", restart_sequence)
     
     def get_restart_sequence(self) -> bool:
         """
@@ -635,15 +525,106 @@ class WiseAgentContext():
         Returns:
             bool: whether to restart the sequence for the chat uuid for this context
         """
-        if (self._use_redis == True):
-            restart = self._redis_db.hget(self.name, "restart_sequence")
-            if restart is not None:
-                return pickle.loads(restart)
-            else:
-                return False
-        else:
-            return self._restart_sequence
-        
+        return self._store.get_field(self.name, "restart_sequence", False)
+
+    def get_history_policy(self) -> Optional[WiseAgentHistoryPolicy]:
+        """
+        Get the policy selecting the conversation history passed to the LLMs of the agents for this context.
+
+        Returns:
+            Optional[WiseAgentHistoryPolicy]: the history policy, overriding the policy of each agent, or None
+            if no policy is set
+        """
+        return self._store.get_field(self.name, "history_policy")
+
+    def set_history_policy(self, history_policy: Optional[WiseAgentHistoryPolicy]):
+        """
+        Set the policy selecting the conversation history passed to the LLMs of the agents for this context.
+
+        Args:
+            history_policy (Optional[WiseAgentHistoryPolicy]): the history policy, overriding the policy of
+            each agent, or None to use the policy of each agent
+        """
+        self._store.set_field(self.name, "history_policy", history_policy)
+
+
+class WiseAgentContextSnapshot():
+    ''' An immutable view of the fields of a WiseAgentContext, as returned by WiseAgentContext.snapshot.
+    It has the same getters as the context for the fields it holds. '''
+
+    __slots__ = ("_name", "_fields", "_current_query")
+
+    def __init__(self, name: str, fields: Dict[str, Any], current_query: Optional[str]):
+        ''' Initialize the snapshot.
+
+        Args:
+            name (str): the name of the context
+            fields (Dict[str, Any]): the fields of the context
+            current_query (Optional[str]): the current query of the context'''
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_fields", MappingProxyType(dict(fields)))
+        object.__setattr__(self, "_current_query", current_query)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __repr__(self) -> str:
+        '''Return a string representation of the snapshot.'''
+        return (f"{self.__class__.__name__}(name={self.name}, fields={dict(self._fields)}, "
+                f"current_query={self._current_query})")
+
+    @property
+    def name(self) -> str:
+        """Get the name of the context."""
+        return self._name
+
+    @property
+    def collaboration_type(self) -> WiseAgentCollaborationType:
+        """Get the collaboration type of the context."""
+        return WiseAgentCollaborationType(self._fields.get("collaboration_type", WiseAgentCollaborationType.INDEPENDENT.value))
+
+    def get_agents_sequence(self) -> List[str]:
+        """Get a copy of the sequence of agents of the context, see WiseAgentContext.get_agents_sequence."""
+        return list(self._fields.get("agents_sequence", []))
+
+    def get_next_agent_in_sequence(self, current_agent: str) -> Optional[str]:
+        """Get the name of the next agent in the sequence of agents, see WiseAgentContext.get_next_agent_in_sequence."""
+        return _next_agent_in_sequence(self._fields.get("agents_sequence", []), current_agent)
+
+    def get_route_response_to(self) -> Optional[str]:
+        """Get the name of the agent where the final response should be routed to."""
+        return self._fields.get("route_response_to")
+
+    def get_agent_phase_assignments(self) -> List[List[str]]:
+        """Get a copy of the agents to be executed in each phase, see WiseAgentContext.get_agent_phase_assignments."""
+        return [list(agents) for agents in self._fields.get("agent_phase_assignments", [])]
+
+    def get_current_phase(self) -> Optional[int]:
+        """Get the current phase."""
+        return self._fields.get("current_phase")
+
+    def get_restart_sequence(self) -> bool:
+        """Get whether to restart the sequence of agents."""
+        return self._fields.get("restart_sequence", False)
+
+    def get_current_query(self) -> Optional[str]:
+        """Get the current query."""
+        return self._current_query
+
+    def get_history_policy(self) -> Optional[WiseAgentHistoryPolicy]:
+        """Get the policy selecting the conversation history passed to the LLMs of the agents."""
+        return self._fields.get("history_policy")
+
+
+def _next_agent_in_sequence(agents_sequence: List[str], current_agent: str) -> Optional[str]:
+    '''Get the agent following the given agent in the given sequence, None if it is the last one or isn't in the sequence.'''
+    if current_agent in agents_sequence:
+        current_agent_index = agents_sequence.index(current_agent)
+        next_agent_index = current_agent_index + 1
+        if next_agent_index < len(agents_sequence):
+            return agents_sequence[next_agent_index]
+    return None
+
 
 class WiseAgentMetaData(WiseAgentsYAMLObject):
     ''' A WiseAgentMetaData is a class that represents metadata associated with an agent.
@@ -716,12 +697,15 @@ class WiseAgent(WiseAgentsYAMLObject):
         obj._vector_db = None
         obj._graph_db = None
         obj._collection_name = "wise-agent-collection"
+        obj._history_policy = None
+        obj._instance_id = None
         return obj
 
     def __init__(self, name: str, metadata: WiseAgentMetaData, transport: WiseAgentTransport, llm: Optional[WiseAgentLLM] = None,
                  vector_db: Optional[WiseAgentVectorDB] = None,
                  collection_name: Optional[str] = "wise-agent-collection",
-                 graph_db: Optional[WiseAgentGraphDB] = None):
+                 graph_db: Optional[WiseAgentGraphDB] = None,
+                 history_policy: Optional[WiseAgentHistoryPolicy] = None):
         ''' 
         Initialize the agent with the given name, metadata, transport, LLM, vector DB, collection name, and graph DB.
 
@@ -734,6 +718,8 @@ class WiseAgent(WiseAgentsYAMLObject):
             vector_db (Optional[WiseAgentVectorDB]): the vector DB associated with the agent
             collection_name (Optional[str]) = "wise-agent-collection": the vector DB collection name associated with the agent
             graph_db (Optional[WiseAgentGraphDB]): the graph DB associated with the agent
+            history_policy (Optional[WiseAgentHistoryPolicy]): the policy selecting the conversation history
+            passed to the LLM, by default the whole history is passed
         '''
         self._name = name
         self._metadata = metadata
@@ -741,6 +727,7 @@ class WiseAgent(WiseAgentsYAMLObject):
         self._vector_db = vector_db
         self._collection_name = collection_name
         self._graph_db = graph_db
+        self._history_policy = history_policy
         self._transport = transport
         self.start_agent()
 
@@ -752,12 +739,12 @@ class WiseAgent(WiseAgentsYAMLObject):
         self.transport.set_call_backs(self.handle_request, self.process_event, self.process_error,
                                       self.process_response)
         self.transport.start()
-        WiseAgentRegistry.register_agent(self.name, self.metadata)
+        WiseAgentRegistry.register_agent(self.name, self.metadata, self.instance_id)
 
     def stop_agent(self):
         ''' Stop the agent by stopping the transport and removing the agent from the registry.'''
         self.transport.stop()
-        WiseAgentRegistry.unregister_agent(self.name)
+        WiseAgentRegistry.unregister_agent(self.name, self.instance_id)
 
     def __repr__(self):
         '''Return a string representation of the agent.'''
@@ -776,6 +763,14 @@ class WiseAgent(WiseAgentsYAMLObject):
     def metadata(self) -> WiseAgentMetaData:
         """Get the metadata associated with the agent."""
         return self._metadata
+
+    @property
+    def instance_id(self) -> str:
+        """Get the id of this instance of the agent, distinguishing it from the other replicas of the agent
+        consuming the messages of its queues."""
+        if self._instance_id is None:
+            self._instance_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        return self._instance_id
     
     @property
     def llm(self) -> Optional[WiseAgentLLM]:
@@ -802,6 +797,18 @@ class WiseAgent(WiseAgentsYAMLObject):
         """Get the transport associated with the agent."""
         return self._transport
 
+    @property
+    def history_policy(self) -> Optional[WiseAgentHistoryPolicy]:
+        """Get the policy selecting the conversation history passed to the LLM."""
+        return self._history_policy
+
+    def set_history_policy(self, history_policy: Optional[WiseAgentHistoryPolicy]):
+        '''Set the policy selecting the conversation history passed to the LLM.
+
+        Args:
+            history_policy (Optional[WiseAgentHistoryPolicy]): the history policy, or None to pass the whole history'''
+        self._history_policy = history_policy
+
     def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
         '''Send a request message to the destination agent with the given name.
 
@@ -842,17 +849,27 @@ class WiseAgent(WiseAgentsYAMLObject):
         Returns:
             True if the message was processed successfully, False otherwise
         """
-        context = WiseAgentRegistry.get_context(request.context_name)
-        logging.debug(f"Agent {self.name} received request in ctx: {context}")
-        collaboration_type = context.collaboration_type
-        conversation_history = self.get_conversation_history_if_needed(context, collaboration_type)
+        context, collaboration_type, conversation_history = self._prepare_request(request)
         initial_conversation_history_size = len(conversation_history)
         response_str = self.process_request(request, conversation_history)
-        if len(conversation_history) > initial_conversation_history_size:
+        self._save_conversation_history(context, conversation_history, initial_conversation_history_size)
+        return self.handle_response(response_str, request, context, collaboration_type)
+
+    def _prepare_request(self, request: WiseAgentMessage) -> Tuple[WiseAgentContext, str, List[ChatCompletionMessageParam]]:
+        '''Get the context of the given request, the type of collaboration and the conversation history to process it.'''
+        context = WiseAgentRegistry.get_context(request.context_name)
+        # the representation of the context is only built if debug logging is enabled, since it reads the whole context
+        logging.debug("Agent %s received request in ctx: %s", self.name, context)
+        collaboration_type = context.collaboration_type
+        return context, collaboration_type, self.get_conversation_history_if_needed(context, collaboration_type)
+
+    def _save_conversation_history(self, context: WiseAgentContext,
+                                   conversation_history: List[ChatCompletionMessageParam], initial_size: int):
+        '''Append to the context the messages added to the conversation history while processing a request.'''
+        if len(conversation_history) > initial_size:
             # the conversation history has been updated
-            for message in conversation_history[initial_conversation_history_size:]:
+            for message in conversation_history[initial_size:]:
                 context.append_chat_completion(message)
-        return self.handle_response(response_str, request, context, collaboration_type)
 
     def get_conversation_history_if_needed(self, context: WiseAgentContext,
                                            collaboration_type: str) -> List[
@@ -874,10 +891,28 @@ class WiseAgent(WiseAgentsYAMLObject):
                 or collaboration_type == WiseAgentCollaborationType.CHAT
                 or collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY):
             # this agent is involved in phased collaboration or a chat, so it needs the conversation history
-            return context.llm_chat_completion
+            return self.get_chat_completion_history(context)
         # for sequential collaboration and independent agents, the shared history is not needed
         return []
 
+    def get_chat_completion_history(self, context: WiseAgentContext) -> List[ChatCompletionMessageParam]:
+        """
+        Get the chat completion messages of the given context to pass to the LLM, selected by the history
+        policy of the context if set, or by the history policy of this agent otherwise.
+
+        Args:
+            context (WiseAgentContext): the shared context
+
+        Returns:
+            List[ChatCompletionMessageParam]: the selected messages, or all the messages of the context if
+            no history policy is set
+        """
+        history = context.llm_chat_completion
+        history_policy = context.get_history_policy() or self.history_policy
+        if history_policy is not None:
+            return history_policy.apply(history)
+        return history
+
     @abstractmethod
     def process_request(self, request: WiseAgentMessage,
                         conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
@@ -912,6 +947,25 @@ class WiseAgent(WiseAgentsYAMLObject):
         Returns:
             True if the message was processed successfully, False otherwise
         """
+        for is_request, message, dest_agent_name in self._route_response(response_str, request, context,
+                                                                         collaboration_type):
+            if is_request:
+                self.send_request(message, dest_agent_name)
+            else:
+                self.send_response(message, dest_agent_name)
+        return True
+
+    def _route_response(self, response_str: str, request: WiseAgentMessage, context: WiseAgentContext,
+                        collaboration_type: str) -> List[Tuple[bool, WiseAgentMessage, str]]:
+        '''
+        Update the shared context with the given string response if necessary and determine the messages to send,
+        depending on the type of collaboration the agent is involved in, see handle_response.
+
+        Returns:
+            List[Tuple[bool, WiseAgentMessage, str]]: the messages to send, in order, each with whether it is a
+            request rather than a response and the name of the destination agent
+        '''
+        messages = []
         if response_str:
             if (collaboration_type == WiseAgentCollaborationType.PHASED
                     or collaboration_type == WiseAgentCollaborationType.CHAT):
@@ -919,41 +973,41 @@ class WiseAgent(WiseAgentsYAMLObject):
                 context.append_chat_completion(messages={"role": "assistant", "content": response_str})
 
                 # let the sender know that this agent has finished processing the request
-                self.send_response(
-                    WiseAgentMessage(message=response_str, message_type=WiseAgentMessageType.ACK, sender=self.name,
-                                     context_name=context.name), request.sender)
+                messages.append((False, WiseAgentMessage(message=response_str, message_type=WiseAgentMessageType.ACK,
+                                                         sender=self.name, context_name=context.name),
+                                 request.sender))
             elif (collaboration_type == WiseAgentCollaborationType.SEQUENTIAL 
                     or collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY):
                 if collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY:
                     # add this agent's response to the shared context
                     context.append_chat_completion(messages={"role": "assistant", "content": response_str})
                     log_messages_exchanged(context.llm_chat_completion, self.name, context.name)
-                next_agent = context.get_next_agent_in_sequence(self.name)
+                # read all the fields needed to route the response at once
+                snapshot = context.snapshot()
+                next_agent = snapshot.get_next_agent_in_sequence(self.name)
                 if next_agent is None:
-                    if context.get_restart_sequence():
-                        next_agent = context.get_agents_sequence()[0]
+                    if snapshot.get_restart_sequence():
+                        next_agent = snapshot.get_agents_sequence()[0]
                         logging.debug(f"Sequential coordination restarting")
-                        self.send_request(
-                            WiseAgentMessage(message=context.get_current_query(), sender=self.name,
-                                             context_name=context.name), next_agent)
+                        messages.append((True, WiseAgentMessage(message=snapshot.get_current_query(), sender=self.name,
+                                                                context_name=context.name), next_agent))
                         # clear the restart state for the context
                         context.set_restart_sequence(False)
                     else:
                         logging.debug(f"Sequential coordination complete - sending response from " + self.name + " to "
-                                      + context.get_route_response_to())
-                        self.send_response(WiseAgentMessage(message=response_str, sender=self.name,
-                                                            context_name=context.name),
-                                           context.get_route_response_to())
+                                      + snapshot.get_route_response_to())
+                        messages.append((False, WiseAgentMessage(message=response_str, sender=self.name,
+                                                                 context_name=context.name),
+                                         snapshot.get_route_response_to()))
                 else:
                     logging.debug(f"Sequential coordination continuing - sending response from " + self.name
                                   + " to " + next_agent)
-                    self.send_request(
-                        WiseAgentMessage(message=response_str, sender=self.name, context_name=context.name), next_agent)
+                    messages.append((True, WiseAgentMessage(message=response_str, sender=self.name,
+                                                            context_name=context.name), next_agent))
             else:
-                self.send_response(WiseAgentMessage(message=response_str, sender=self.name,
-                                                    context_name=context.name),
-                                   request.sender)
-        return True
+                messages.append((False, WiseAgentMessage(message=response_str, sender=self.name,
+                                                         context_name=context.name), request.sender))
+        return messages
 
     @abstractmethod
     def process_response(self, message: WiseAgentMessage) -> bool:
@@ -999,18 +1053,212 @@ class WiseAgent(WiseAgentsYAMLObject):
 
 
 
+class AsyncWiseAgent(WiseAgent):
+    '''
+    A WiseAgent whose call backs are coroutines, awaited on an asyncio event loop by an AsyncWiseAgentTransport,
+    so that a single event loop can host many agents whose work is dominated by the LLM and database I/O, without
+    a thread for each of them. The calls to the registry and the context store, which may be round trips to redis
+    or writes to SQLite, run in the default executor of the event loop, so that an agent waiting for the store
+    doesn't block the other agents of the event loop. The agent is started by awaiting start_agent, after being
+    created.
+    '''
+
+    def __new__(cls, *args, **kwargs):
+        '''Create a new instance of the class, setting default values for the instance variables.'''
+        obj = super().__new__(cls)
+        enforce_no_abstract_class_instances(cls, AsyncWiseAgent)
+        return obj
+
+    def __init__(self, name: str, metadata: WiseAgentMetaData, transport: AsyncWiseAgentTransport,
+                 llm: Optional[WiseAgentLLM] = None, vector_db: Optional[WiseAgentVectorDB] = None,
+                 collection_name: Optional[str] = "wise-agent-collection", graph_db: Optional[WiseAgentGraphDB] = None,
+                 history_policy: Optional[WiseAgentHistoryPolicy] = None):
+        '''
+        Initialize the agent with the given name, metadata, transport, LLM, vector DB, collection name, and graph DB.
+        Unlike WiseAgent, the agent is not started, await start_agent to start it.
+
+        Args:
+            name (str): the name of the agent
+            metadata (WiseAgentMetaData): the metadata for the agent
+            transport (AsyncWiseAgentTransport): the transport to use for sending and receiving messages
+            llm (Optional[WiseAgentLLM]): the LLM associated with the agent
+            vector_db (Optional[WiseAgentVectorDB]): the vector DB associated with the agent
+            collection_name (Optional[str]) = "wise-agent-collection": the vector DB collection name associated with the agent
+            graph_db (Optional[WiseAgentGraphDB]): the graph DB associated with the agent
+            history_policy (Optional[WiseAgentHistoryPolicy]): the policy selecting the conversation history passed
+            to the LLM, when the context doesn't set one
+        '''
+        self._name = name
+        self._metadata = metadata
+        self._llm = llm
+        self._vector_db = vector_db
+        self._collection_name = collection_name
+        self._graph_db = graph_db
+        self._history_policy = history_policy
+        self._transport = transport
+
+    async def start_agent(self):
+        ''' Start the agent by setting the call backs and starting the transport.'''
+        if self._llm is not None:
+            self._llm.set_agent_name(self._name)
+        self.transport.set_call_backs(self.handle_request, self.process_event, self.process_error,
+                                      self.process_response)
+        await self.transport.start()
+        await asyncio.to_thread(WiseAgentRegistry.register_agent, self.name, self.metadata, self.instance_id)
+
+    async def stop_agent(self):
+        ''' Stop the agent by stopping the transport and removing the agent from the registry.'''
+        await self.transport.stop()
+        await asyncio.to_thread(WiseAgentRegistry.unregister_agent, self.name, self.instance_id)
+
+    async def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a request message to the destination agent with the given name.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the name of the destination agent'''
+        message.sender = self.name
+        context = await asyncio.to_thread(WiseAgentRegistry.get_context, message.context_name)
+        await self.transport.send_request(message, dest_agent_name)
+        if context is not None:
+            await asyncio.to_thread(context.trace, message)
+        else:
+            logging.warning(f"Context {message.context_name} not found")
+
+    async def send_response(self, message: WiseAgentMessage, dest_agent_name):
+        '''Send a response message to the destination agent with the given name.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the name of the destination agent'''
+        message.sender = self.name
+        context = await asyncio.to_thread(WiseAgentRegistry.get_context, message.context_name)
+        await self.transport.send_response(message, dest_agent_name)
+        await asyncio.to_thread(context.trace, message)
+
+    async def handle_request(self, request: WiseAgentMessage) -> bool:
+        """
+        Callback coroutine handling the given request for this agent, see WiseAgent.handle_request.
+
+        Args:
+            request (WiseAgentMessage): the request message to be processed
+
+        Returns:
+            True if the message was processed successfully, False otherwise
+        """
+        context, collaboration_type, conversation_history = await asyncio.to_thread(self._prepare_request, request)
+        initial_conversation_history_size = len(conversation_history)
+        response_str = await self.process_request(request, conversation_history)
+        await asyncio.to_thread(self._save_conversation_history, context, conversation_history,
+                                initial_conversation_history_size)
+        return await self.handle_response(response_str, request, context, collaboration_type)
+
+    async def handle_response(self, response_str: str, request: WiseAgentMessage,
+                              context: WiseAgentContext, collaboration_type: str) -> bool:
+        """
+        Handles the given string response, see WiseAgent.handle_response.
+
+        Args:
+            response_str (str): the string response to be handled
+            request (WiseAgentMessage): the request message that generated the response
+            context (WiseAgentContext): the shared context
+            collaboration_type (str): the type of collaboration this agent is involved in
+
+        Returns:
+            True if the message was processed successfully, False otherwise
+        """
+        for is_request, message, dest_agent_name in await asyncio.to_thread(self._route_response, response_str,
+                                                                            request, context, collaboration_type):
+            if is_request:
+                await self.send_request(message, dest_agent_name)
+            else:
+                await self.send_response(message, dest_agent_name)
+        return True
+
+    @abstractmethod
+    async def process_request(self, request: WiseAgentMessage,
+                              conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
+        """
+        Process the given request message to generate a response string, see WiseAgent.process_request.
+        The LLM can be awaited with WiseAgentLLM.aprocess_chat_completion.
+
+        Args:
+            request (WiseAgentMessage): the request message to be processed
+            conversation_history (List[ChatCompletionMessageParam]): The conversation history that
+            can be used while processing the request
+
+        Returns:
+            Optional[str]: the response to the request message as a string or None if there is
+            no string response yet
+        """
+        ...
+
+    @abstractmethod
+    async def process_response(self, message: WiseAgentMessage) -> bool:
+        """
+        Callback coroutine processing the response received from another agent which processed a request from this agent.
+
+        Args:
+            message (WiseAgentMessage): the message to be processed
+
+        Returns:
+            True if the message was processed successfully, False otherwise
+        """
+        ...
+
+    @abstractmethod
+    async def process_event(self, event: WiseAgentEvent) -> bool:
+        """
+        Callback coroutine processing the given event.
+
+        Args:
+            event (WiseAgentEvent): the event to be processed
+
+        Returns:
+           True if the event was processed successfully, False otherwise
+        """
+        ...
+
+    @abstractmethod
+    async def process_error(self, error: Exception) -> bool:
+        """
+        Callback coroutine processing the given error.
+
+        Args:
+            error (Exception): the error to be processed
+
+        Returns:
+            True if the error was processed successfully, False otherwise
+        """
+        ...
+
+
 class WiseAgentRegistry:
 
     """
-    A Registry to get available agents and running contexts
+    A Registry to get available agents and running contexts.
+    The agents, the tools and the contexts are kept by the context store selected with the context_store key
+    of the configuration, see WiseAgentContextStore.
     """
-    agents_metadata_dict : dict[str, WiseAgentMetaData] = {}
-    contexts : dict[str, WiseAgentContext] = {}
-    tools: dict[str, WiseAgentTool] = {}
-    
     config: dict[str, Any] = {}
-    
-    redis_db : redis.Redis = None
+
+    context_store : Optional[WiseAgentContextStore] = None
+    context_store_lock : threading.Lock = threading.Lock()
+
+    # The last time this process recorded an access to each sub context
+    context_touched_at : dict[str, float] = {}
+    context_sweeper_thread : Optional[threading.Thread] = None
+
+    DEFAULT_CONTEXT_SWEEP_INTERVAL = 60
+
+    # The agent instances registered by this process, as (agent name, instance id), and the metadata of their agents
+    local_agent_instances : dict[Tuple[str, str], WiseAgentMetaData] = {}
+    agent_heartbeat_thread : Optional[threading.Thread] = None
+    agent_heartbeat_lock : threading.Lock = threading.Lock()
+
+    DEFAULT_AGENT_HEARTBEAT_INTERVAL = 10
+    # The number of heartbeat intervals after which an instance is expired, unless agent_instance_timeout is set
+    AGENT_INSTANCE_TIMEOUT_HEARTBEATS = 3
     
     
     @classmethod
@@ -1035,7 +1283,7 @@ class WiseAgentRegistry:
     @classmethod
     def get_config(cls) -> dict[str, Any]:
         """
-        Get the configuration and initialize the redis database
+        Get the configuration and initialize the context store
         for more information see 
         https://wise-agents.github.io/wise_agents_architecture/#distributed-architecture
         """
@@ -1043,114 +1291,169 @@ class WiseAgentRegistry:
             if cls.config is None or cls.config == {}:
                 file_name = cls.find_file(file_name="registry_config.yaml", config_directory=".wise-agents")
                 cls.config : Dict[str, Any] = yaml.load(open(file_name), Loader=yaml.FullLoader)
-            if cls.config.get("use_redis") == True and cls.redis_db is None:
-                if (cls.config.get("redis_ssl") is True):
-                    cls.redis_db = redis.Redis(
-                    host=cls.config["redis_host"], port=cls.config["redis_port"],
-                    username=cls.config["redis_username"], # use your Redis user. More info https://redis.io/docs/latest/operate/oss_and_stack/management/security/acl/
-                    password=cls.config["redis_password"], # use your Redis password
-                    ssl=True,
-                    ssl_certfile=cls.config["redis_ssl_certfile"],
-                    ssl_keyfile=cls.config["redis_ssl_keyfile"],
-                    ssl_ca_certs=cls.config["redis_ssl_ca_certs"])
-
-                else:
-                    cls.redis_db = redis.Redis(host=cls.config["redis_host"], port=cls.config["redis_port"])
+            if cls.context_store is None:
+                with cls.context_store_lock:
+                    if cls.context_store is None:
+                        cls.context_store = create_context_store(cls.config)
+            cls._start_context_sweeper()
             return cls.config
         except Exception as e:
             logging.error(e)
             exit(1)
+
+    @classmethod
+    def get_context_store(cls) -> WiseAgentContextStore:
+        """
+        Get the store keeping the agents, the tools and the contexts, created from the configuration.
+
+        Returns:
+            WiseAgentContextStore: the context store
+        """
+        if cls.context_store is None:
+            cls.get_config()
+        return cls.context_store
     
     @classmethod
-    def register_agent(cls, agent_name : str, agent_metadata :WiseAgentMetaData):
-        """
-        Register an agent with the registry
-        """
-        if (cls.get_config().get("use_redis") == True):
-            pipe = cls.redis_db.pipeline(transaction=True)
-            while True:
-                pipe.watch("agents")
-                try:
-                    if(pipe.hexists("agents", agent_name) == True):
-                        pipe.unwatch()
-                        raise NameError(f"Agent with name {agent_name} already exists")
-                    else:
-                        pipe.multi()
-                        pipe.hset("agents", key=agent_name, value=pickle.dumps(agent_metadata))
-                        pipe.execute()
-                    return
-                except redis.WatchError:
-                    logging.debug("WatchError in register_agent")
-                    continue
-        else:
-            if cls.agents_metadata_dict.get(agent_name) is not None:
-                raise NameError(f"Agent with name {agent_name} already exists")
-        cls.agents_metadata_dict[agent_name] = agent_metadata
+    def get_redis_pool_stats(cls) -> dict[str, Any]:
+        """
+        Get the usage statistics of the redis connection pool shared by the registry and the contexts.
+
+        Returns:
+            dict[str, Any]: the statistics of the pool or an empty dict if redis is not used
+        """
+        return WiseAgentRedisConnectionManager.get_pool_stats()
+
+    @classmethod
+    def _start_context_sweeper(cls):
+        """
+        Start the background thread removing the expired sub contexts, if context_ttl or
+        context_idle_timeout is configured.
+        """
+        if cls.context_sweeper_thread is not None:
+            return
+        if cls.config.get("context_ttl") is None and cls.config.get("context_idle_timeout") is None:
+            return
+        cls.context_sweeper_thread = threading.Thread(target=cls._run_context_sweeper, name="wiseagents-context-sweeper",
+                                                      daemon=True)
+        cls.context_sweeper_thread.start()
+
+    @classmethod
+    def _run_context_sweeper(cls):
+        """
+        Periodically remove the expired sub contexts.
+        """
+        while True:
+            time.sleep(cls.config.get("context_sweep_interval", cls.DEFAULT_CONTEXT_SWEEP_INTERVAL))
+            try:
+                cls.sweep_contexts()
+            except Exception as e:
+                logging.warning(f"Error removing expired contexts: {e}")
+
+    @classmethod
+    def sweep_contexts(cls, now: Optional[float] = None) -> List[str]:
+        """
+        Remove, along with their data, the sub contexts created more than context_ttl seconds ago
+        and the ones not accessed in the last context_idle_timeout seconds.
+        First level contexts are never expired, they are removed by the clients which created them.
+
+        Args:
+            now (Optional[float]): the current time, in seconds since the epoch, time.time() if None
+
+        Returns:
+            List[str]: the names of the removed contexts
+        """
+        store = cls.get_context_store()
+        expired = store.get_expired_context_names(cls.config.get("context_ttl"), cls.config.get("context_idle_timeout"),
+                                                  time.time() if now is None else now)
+        for context_name in expired:
+            logging.info(f"Context {context_name} expired")
+            cls.remove_context(context_name)
+        return expired
+
+    @classmethod
+    def _touch_context(cls, context_name: str):
+        """
+        Record an access to the sub context with the given name, at most once every tenth of
+        the idle timeout for each process.
+        """
+        idle_timeout = cls.config.get("context_idle_timeout")
+        if idle_timeout is None or "_" not in context_name:
+            return
+        now = time.time()
+        if now - cls.context_touched_at.get(context_name, 0) < idle_timeout / 10:
+            return
+        cls.context_touched_at[context_name] = now
+        cls.get_context_store().touch_context(context_name, now)
+
+    @classmethod
+    def get_context_stats(cls) -> dict[str, int]:
+        """
+        Get statistics about the contexts in the registry.
+
+        Returns:
+            dict[str, int]: the number of live contexts and the number of bytes used to store them
+        """
+        return cls.get_context_store().get_context_stats()
+
+    @classmethod
+    def register_agent(cls, agent_name : str, agent_metadata :WiseAgentMetaData, instance_id: Optional[str] = None) -> int:
+        """
+        Register an agent with the registry.
+        Without an instance id, a NameError is raised if an agent with the same name is already registered.
+        With an instance id, the agent is registered as one of the instances, or replicas, of the agent with the
+        given name, which consume the messages of its queues as competing consumers: a NameError is only raised
+        if the agent is already registered with different metadata. The instances registered by this process
+        send a heartbeat to the registry every agent_heartbeat_interval seconds, see get_agent_instances.
+
+        Args:
+            agent_name (str): the name of the agent
+            agent_metadata (WiseAgentMetaData): the metadata of the agent
+            instance_id (Optional[str]): the id of the instance, unique among the instances of the agent
+
+        Returns:
+            int: the number of registered instances of the agent
+        """
+        if instance_id is None:
+            cls.get_context_store().register_agent(agent_name, agent_metadata)
+            return 1
+        count = cls.get_context_store().register_agent_instance(agent_name, instance_id, agent_metadata, time.time())
+        with cls.agent_heartbeat_lock:
+            cls.local_agent_instances[(agent_name, instance_id)] = agent_metadata
+        cls._start_agent_heartbeat()
+        return count
     @classmethod    
     def register_context(cls, context : WiseAgentContext):
         """
         Register a context with the registry
         """
-        if (cls.does_context_exist(context.name) == True):
-            raise NameError(f"Context with name {context.name} already exists")
-        if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hset("contexts", key=context.name, value=pickle.dumps(context))
-        else:
-            cls.contexts[context.name] = context
+        cls.get_context_store().register_context(context, time.time())
     @classmethod    
     def fetch_agents_metadata_dict(cls) -> dict [str, WiseAgentMetaData]:
         """
         Get the dict with the agent names as keys and metadata as values
         """
-        if (cls.get_config().get("use_redis") == True):
-            redis_dict = cls.redis_db.hgetall("agents")
-            return_dictionary : Dict[str, WiseAgentMetaData]= {}
-            for key in redis_dict:
-                return_dictionary[key.decode('utf-8')] = pickle.loads(redis_dict[key])
-            return return_dictionary
-        else:
-            return cls.agents_metadata_dict
+        return cls.get_context_store().get_agents()
     
     @classmethod
     def get_contexts(cls) -> dict [str, WiseAgentContext]:
         """
         Get the list of contexts
         """
-        if (cls.get_config().get("use_redis") == True):
-            dictionary = cls.redis_db.hgetall("contexts")
-            return_dictionary : Dict[str, WiseAgentContext]= {}
-            for key in dictionary:
-                 return_dictionary[key] = pickle.loads(dictionary.get(key))
-            return return_dictionary
-        else:
-            return cls.contexts
+        return cls.get_context_store().get_contexts()
     
     @classmethod
     def get_agent_metadata(cls, agent_name: str) -> WiseAgentMetaData:
         """
         Get the agent metadata for the agent with the given name
         """
-        if (cls.get_config().get("use_redis") == True):
-            return_byte = cls.redis_db.hget("agents", key=agent_name)
-            if return_byte is not None:
-                return pickle.loads(return_byte)
-            else:  
-                return None
-        else:
-            return cls.agents_metadata_dict.get(agent_name) 
+        return cls.get_context_store().get_agent(agent_name)
     
     @classmethod
     def get_context(cls, context_name: str) -> WiseAgentContext:
         """ Get the context with the given name """
-        context : WiseAgentContext = None
-        if (cls.get_config().get("use_redis") == True):
-            ctx = cls.redis_db.hget("contexts", key=context_name)
-            if ctx is not None:
-                context : WiseAgentContext = pickle.loads(ctx)
-            else:
-                context = None
-        else:
-            context = cls.contexts.get(context_name)
+        context = cls.get_context_store().get_context(context_name)
+        if context is not None:
+            cls._touch_context(context_name)
         return context
 
     @classmethod
@@ -1176,9 +1479,8 @@ class WiseAgentRegistry:
         if ('_' in sub_context_name):
             raise NameError(f"Sub Context name {sub_context_name} cannot contain an underscore")
         if cls.does_context_exist(parent_context_name):
-            logging.debug(f"set_collaboration_type (0.0) cls.config: {cls.config}")
             sub_context = WiseAgentContext(f'{parent_context_name}_{sub_context_name}', cls.config)
-            logging.debug(f"set_collaboration_type (0.1) sub_context: {sub_context} _use_redis: {sub_context._use_redis}")
+            logging.debug(f"Created sub context {sub_context.name}")
     
             return sub_context
         else:
@@ -1187,13 +1489,20 @@ class WiseAgentRegistry:
 
 
     @classmethod
-    def remove_context(cls, context_name: str, merge_chat_to_parent: Optional[bool] = False) -> Optional[WiseAgentContext]:
+    def remove_context(cls, context_name: str, merge_chat_to_parent: Optional[bool] = False,
+                       chat_summarizer: Optional[Callable[[List[ChatCompletionMessageParam]],
+                                                          List[ChatCompletionMessageParam]]] = None) -> Optional[WiseAgentContext]:
         """
         Remove the context from the registry
 
         Args:
             context_name (str): the name of the context
-            merge_chat_to_parent (Optional[bool]): whether to merge the chat completion of the context to the parent context
+            merge_chat_to_parent (Optional[bool]): whether to merge the chat completion of the context to the parent context.
+            The messages are appended to the chat completion of the parent context as individual messages, within the
+            context store, so the cost of the merge doesn't depend on the length of the chat completion of the parent
+            chat_summarizer (Optional[Callable[[List[ChatCompletionMessageParam]], List[ChatCompletionMessageParam]]]): an
+            optional function called with the chat completion messages of the context when they are merged, returning
+            the messages to append to the chat completion of the parent context instead, e.g. a summary of the messages
         Returns:
             Optional[WiseAgentContext]: the parent context if it exists and merge_chat_to_parent = True. Otherwise return None
 
@@ -1201,82 +1510,188 @@ class WiseAgentRegistry:
         parent_context_name = None
         parent_context = None
         if ("_" in context_name and merge_chat_to_parent): # it has a parent context
-            parent_context_name = "_".join(context_name.split("_")[:-1])
+            parent_context_name = cls.get_parent_context_name(context_name)
             parent_context = cls.get_context(parent_context_name)
-            context = cls.get_context(context_name)
-            if parent_context is not None and context is not None:
-                parent_context.append_chat_completion(context.llm_chat_completion)
-            else:
+            if parent_context is None or not cls.does_context_exist(context_name):
                 raise NameError(f"Parent context with name {parent_context_name} or context with name {context_name} does not exist")
+            if chat_summarizer is not None:
+                messages = chat_summarizer(cls.get_context(context_name).llm_chat_completion)
+                with parent_context.batch():
+                    for message in messages:
+                        parent_context.append_chat_completion(message)
+            else:
+                merged = cls.get_context_store().merge_list(context_name, parent_context_name, "llm_chat_completion")
+                logging.debug(f"Merged {merged} chat completion messages of {context_name} into {parent_context_name}")
         logging.info(f"Removing context {context_name}")    
-        if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hdel("contexts", context_name)
-        else:
-            cls.contexts.pop(context_name)
+        cls.get_context_store().remove_context(context_name)
+        cls.context_touched_at.pop(context_name, None)
         return parent_context
+
+    @classmethod
+    def get_parent_context_name(cls, context_name: str) -> Optional[str]:
+        """
+        Get the name of the parent of the context with the given name.
+
+        Args:
+            context_name (str): the name of the context
+
+        Returns:
+            Optional[str]: the name of the parent context or None if the context is a first level context
+        """
+        if "_" not in context_name:
+            return None
+        return "_".join(context_name.split("_")[:-1])
     
     @classmethod
     def does_context_exist(cls, context_name: str) -> bool:
         """
         Get the context with the given name
         """
-        if (cls.get_config().get("use_redis") == True):
-            return cls.redis_db.hexists("contexts", key=context_name)
-        else:
-            if  cls.contexts.get(context_name) is None:
-                return False
-            else:
-                return True
+        return cls.get_context_store().context_exists(context_name)
     
     @classmethod
-    def unregister_agent(cls, agent_name: str):
+    def unregister_agent(cls, agent_name: str, instance_id: Optional[str] = None) -> int:
         """
-        Remove the agent from the registry this should be used only on agents which already stopped transport connection
+        Remove the agent from the registry this should be used only on agents which already stopped transport connection.
+        With an instance id, only the given instance is removed, the agent being removed along with its last instance.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (Optional[str]): the id of the instance to remove, None to remove all the instances
+
+        Returns:
+            int: the number of instances of the agent left
+        """
+        if instance_id is None:
+            with cls.agent_heartbeat_lock:
+                cls.local_agent_instances = {instance: metadata
+                                             for instance, metadata in cls.local_agent_instances.items()
+                                             if instance[0] != agent_name}
+            cls.get_context_store().unregister_agent(agent_name)
+            return 0
+        with cls.agent_heartbeat_lock:
+            cls.local_agent_instances.pop((agent_name, instance_id), None)
+        return cls.get_context_store().unregister_agent_instance(agent_name, instance_id)
+
+    @classmethod
+    def get_agent_instances(cls, agent_name: str, include_expired: bool = False) -> dict[str, float]:
         """
-        if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hdel("agents", agent_name)
-        else:
-            if cls.agents_metadata_dict.get(agent_name) is not None:
-                cls.agents_metadata_dict.pop(agent_name)
+        Get the instances, or replicas, of the agent with the given name.
+        An instance is expired when it didn't send a heartbeat for agent_instance_timeout seconds,
+        e.g. because its process died without unregistering it.
+
+        Args:
+            agent_name (str): the name of the agent
+            include_expired (bool): whether to include the expired instances
+
+        Returns:
+            dict[str, float]: the ids of the instances as keys and the time of their last heartbeat as values
+        """
+        instances = cls.get_context_store().get_agent_instances().get(agent_name, {})
+        if include_expired:
+            return instances
+        expired_before = time.time() - cls._get_agent_instance_timeout()
+        return {instance_id: last_heartbeat for instance_id, last_heartbeat in instances.items()
+                if last_heartbeat >= expired_before}
+
+    @classmethod
+    def get_agent_replica_counts(cls) -> dict[str, int]:
+        """
+        Get the number of live instances of each registered agent. The agents registered without an instance id
+        count as a single instance.
+
+        Returns:
+            dict[str, int]: the agent names as keys and the number of their live instances as values
+        """
+        instances = cls.get_context_store().get_agent_instances()
+        expired_before = time.time() - cls._get_agent_instance_timeout()
+        return {agent_name: (sum(1 for last_heartbeat in instances[agent_name].values() if last_heartbeat >= expired_before)
+                             if agent_name in instances else 1)
+                for agent_name in cls.get_context_store().get_agents()}
+
+    @classmethod
+    def sweep_agent_instances(cls) -> List[Tuple[str, str]]:
+        """
+        Remove the expired agent instances, see get_agent_instances.
+
+        Returns:
+            List[Tuple[str, str]]: the agent names and the ids of the removed instances
+        """
+        store = cls.get_context_store()
+        expired_before = time.time() - cls._get_agent_instance_timeout()
+        expired = [(agent_name, instance_id) for agent_name, instances in store.get_agent_instances().items()
+                   for instance_id, last_heartbeat in instances.items() if last_heartbeat < expired_before]
+        removed = []
+        for agent_name, instance_id in expired:
+            # checked again by the store, since the instance may have sent a heartbeat meanwhile
+            if store.expire_agent_instance(agent_name, instance_id, expired_before):
+                logging.info(f"Instance {instance_id} of agent {agent_name} expired")
+                removed.append((agent_name, instance_id))
+        return removed
+
+    @classmethod
+    def _get_agent_instance_timeout(cls) -> float:
+        """
+        Get the number of seconds without heartbeat after which an agent instance is expired.
+        """
+        return cls.get_config().get("agent_instance_timeout",
+                                    cls.AGENT_INSTANCE_TIMEOUT_HEARTBEATS * cls._get_agent_heartbeat_interval())
+
+    @classmethod
+    def _get_agent_heartbeat_interval(cls) -> float:
+        """
+        Get the number of seconds between two heartbeats of the agent instances.
+        """
+        return cls.get_config().get("agent_heartbeat_interval", cls.DEFAULT_AGENT_HEARTBEAT_INTERVAL)
+
+    @classmethod
+    def _start_agent_heartbeat(cls):
+        """
+        Start the background thread sending the heartbeats of the agent instances registered by this process.
+        """
+        with cls.agent_heartbeat_lock:
+            if cls.agent_heartbeat_thread is not None:
+                return
+            cls.agent_heartbeat_thread = threading.Thread(target=cls._run_agent_heartbeat,
+                                                          name="wiseagents-agent-heartbeat", daemon=True)
+            cls.agent_heartbeat_thread.start()
+
+    @classmethod
+    def _run_agent_heartbeat(cls):
+        """
+        Periodically record a heartbeat of the agent instances registered by this process, registering them again if
+        they were expired meanwhile, and remove the expired ones.
+        """
+        while True:
+            time.sleep(cls._get_agent_heartbeat_interval())
+            try:
+                with cls.agent_heartbeat_lock:
+                    instances = dict(cls.local_agent_instances)
+                cls.get_context_store().touch_agent_instances(instances, time.time())
+                cls.sweep_agent_instances()
+            except Exception as e:
+                logging.warning(f"Error sending the heartbeat of the agent instances: {e}")
         
     @classmethod
     def register_tool(cls, tool : WiseAgentTool):
         """
         Register a tool with the registry
         """
-        if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hset("tools", key=tool.name, value=pickle.dumps(tool))
-        else:
-            cls.tools[tool.name] = tool
+        cls.get_context_store().register_tool(tool)
     
     @classmethod
     def get_tools(cls) -> dict[str, WiseAgentTool]:
         """
         Get the list of tools
         """
-        if (cls.get_config().get("use_redis") == True):
-            dictionary = cls.redis_db.hgetall("tools")
-            return_dictionary : Dict[str, WiseAgentTool]= {}
-            for key in dictionary:
-                 return_dictionary[key] = pickle.loads(dictionary.get(key))
-            return return_dictionary
-        else:
-            return cls.tools
+        return cls.get_context_store().get_tools()
     
     @classmethod
     def get_tool(cls, tool_name: str) -> WiseAgentTool:
         """
         Get the tool with the given name
         """
-        if (cls.get_config().get("use_redis") == True):
-            pipe = cls.redis_db.pipeline(transaction=True)
-            piped_res= pipe.hexists("tools", key=tool_name).hget("tools", key=tool_name).execute()
-            if piped_res[0]:
-                return pickle.loads(piped_res[1])
-            else:
-                return None
-        else:
-            return cls.tools.get(tool_name)
+        return cls.get_context_store().get_tool(tool_name)
 
     @classmethod
     def get_agent_names_and_descriptions(cls) -> List[str]:
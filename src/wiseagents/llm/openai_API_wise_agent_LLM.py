@@ -12,6 +12,7 @@ from wiseagents.llm.wise_agent_remote_LLM import WiseAgentRemoteLLM
 class OpenaiAPIWiseAgentLLM(WiseAgentRemoteLLM):
     '''A class to define a WiseAgentLLM that uses the OpenAI API.'''
     client = None
+    async_client = None
     yaml_tag = u'!wiseagents.llm.OpenaiAPIWiseAgentLLM'
 
 
@@ -50,6 +51,8 @@ class OpenaiAPIWiseAgentLLM(WiseAgentRemoteLLM):
         state = super().__getstate__()
         if 'client' in state.keys():
             del state['client']
+        if 'async_client' in state.keys():
+            del state['async_client']
         return state 
     
     def connect(self):
@@ -57,6 +60,11 @@ class OpenaiAPIWiseAgentLLM(WiseAgentRemoteLLM):
         logging.getLogger(__name__).info(f"Connecting to {self._agent_name} on remote machine at {self.remote_address} with API key ***********")
         self.client = openai.OpenAI(base_url=self.remote_address, 
                 api_key=self.api_key)
+
+    def connect_async(self):
+        '''Create the client used to call the remote machine from an asyncio event loop.'''
+        logging.getLogger(__name__).info(f"Connecting {self._agent_name} asynchronously to remote machine at {self.remote_address} with API key ***********")
+        self.async_client = openai.AsyncOpenAI(base_url=self.remote_address, api_key=self.api_key)
     
    
     def process_single_prompt(self, prompt):
@@ -112,6 +120,53 @@ class OpenaiAPIWiseAgentLLM(WiseAgentRemoteLLM):
             )
         return response
         
+    async def aprocess_single_prompt(self, prompt):
+        '''Process a single prompt, awaiting the remote machine with the asynchronous OpenAI client.
+        See process_single_prompt.
+
+        Args:
+            prompt (str): the prompt to process'''
+        logging.getLogger(__name__).info(f"Executing {self._agent_name} on remote machine at {self.remote_address}")
+        if (self.async_client is None):
+            self.connect_async()
+        messages = []
+        if self.system_message:
+            messages.append({"role": "system", "content": self.system_message})
+        messages.append({"role": "user", "content": prompt})
+        response = await self.async_client.chat.completions.create(
+            messages=messages,
+            model=self.model_name,
+            tool_choice="auto",  # auto is default, but we'll be explicit
+            **self.openai_config
+            )
+        return response.choices[0].message
+
+    async def aprocess_chat_completion(self,
+                                       messages: Iterable[ChatCompletionMessageParam],
+                                       tools: Iterable[ChatCompletionToolParam],
+                                       max_tokens : Optional[int] | NotGiven = NOT_GIVEN, response_format : Optional[completion_create_params.ResponseFormat] | NotGiven = NOT_GIVEN) -> ChatCompletion:
+        '''Process a chat completion, awaiting the remote machine with the asynchronous OpenAI client.
+        See process_chat_completion.
+
+        Args:
+            messages (Iterable[ChatCompletionMessageParam]): the messages to process
+            tools (Iterable[ChatCompletionToolParam]): the tools to use
+
+        Returns:
+                ChatCompletion: the chat completion result'''
+        logging.getLogger(__name__).info(f"Executing {self._agent_name} on remote machine at {self.remote_address}")
+        if (self.async_client is None):
+            self.connect_async()
+        return await self.async_client.chat.completions.create(
+            messages=messages,
+            model=self.model_name,
+            tools=tools,
+            tool_choice="auto",  # auto is default, but we'll be explicit
+            max_tokens=max_tokens,
+            response_format=response_format,
+            **self.openai_config
+            )
+
     @property
     def api_key(self):
         '''Get the API key.'''
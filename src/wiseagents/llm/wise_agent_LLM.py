@@ -1,3 +1,4 @@
+import asyncio
 from abc import abstractmethod
 from typing import Iterable, Optional
 
@@ -64,4 +65,26 @@ class WiseAgentLLM(WiseAgentsYAMLObject):
         
         Returns:
                 ChatCompletion: the chat completion result'''
-        ...
\ No newline at end of file
+        ...
+
+    async def aprocess_single_prompt(self, prompt):
+        '''Process a single prompt from an asyncio event loop. By default process_single_prompt is run in a
+        worker thread, subclasses calling a remote LLM should override it to await the LLM without a thread.
+
+        Args:
+            prompt (str): the prompt to process'''
+        return await asyncio.to_thread(self.process_single_prompt, prompt)
+
+    async def aprocess_chat_completion(self,
+                                       messages: Iterable[ChatCompletionMessageParam],
+                                       tools: Iterable[ChatCompletionToolParam], **kwargs) -> ChatCompletion:
+        '''Process a chat completion from an asyncio event loop. By default process_chat_completion is run in a
+        worker thread, subclasses calling a remote LLM should override it to await the LLM without a thread.
+
+        Args:
+            messages (Iterable[ChatCompletionMessageParam]): the messages to process
+            tools (Iterable[ChatCompletionToolParam]): the tools to use
+
+        Returns:
+                ChatCompletion: the chat completion result'''
+        return await asyncio.to_thread(self.process_chat_completion, messages, tools, **kwargs)
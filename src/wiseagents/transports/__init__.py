@@ -5,7 +5,14 @@
 # Define any necessary initialization code here
 
 from wiseagents.transports.stomp import StompWiseAgentTransport
+from wiseagents.transports.stomp_connection import WiseAgentStompConnection, WiseAgentStompConnectionManager
+from wiseagents.transports.in_process import InProcessWiseAgentTransport
+from wiseagents.transports.async_stomp import AsyncStompWiseAgentTransport, AsyncWiseAgentStompConnectionManager
+from wiseagents.transports.redis_streams import RedisStreamsWiseAgentTransport
 
 
 # Optionally, you can define __all__ to specify the public interface of the package
-__all__ = ['StompWiseAgentTransport']
+__all__ = ['StompWiseAgentTransport', 'InProcessWiseAgentTransport', 'AsyncStompWiseAgentTransport',
+           'RedisStreamsWiseAgentTransport',
+           'AsyncWiseAgentStompConnectionManager', 'WiseAgentStompConnection',
+           'WiseAgentStompConnectionManager']
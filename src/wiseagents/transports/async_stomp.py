@@ -0,0 +1,605 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from wiseagents import WiseAgentMessage
+from wiseagents.wise_agent_messaging import AsyncWiseAgentTransport
+from wiseagents.transports.claim_check import CLAIM_CHECK_HEADER, REDIS_CLAIM_CHECK_STORE, check_in, claim
+from wiseagents.transports.wire_format import (CONTENT_ENCODING_HEADER, DEFAULT_COMPRESSION_THRESHOLD, JSON_WIRE_FORMAT,
+                                               ZLIB_COMPRESSION, compress_body, decode_message, decompress_body,
+                                               encode_message)
+
+# The escaping of the header names and values of STOMP 1.2 frames
+_HEADER_ESCAPES = (("\\", "\\\\"), ("\r", "\\r"), ("\n", "\\n"), (":", "\\c"))
+_HEADER_UNESCAPES = {"\\\\": "\\", "\\r": "\r", "\\n": "\n", "\\c": ":"}
+
+
+def _escape(value: str) -> str:
+    for character, escaped in _HEADER_ESCAPES:
+        value = value.replace(character, escaped)
+    return value
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    unescaped = []
+    i = 0
+    while i < len(value):
+        if value[i] == "\\" and value[i:i + 2] in _HEADER_UNESCAPES:
+            unescaped.append(_HEADER_UNESCAPES[value[i:i + 2]])
+            i += 2
+        else:
+            unescaped.append(value[i])
+            i += 1
+    return "".join(unescaped)
+
+
+def encode_frame(command: str, headers: Dict[str, str], body: bytes = b"") -> bytes:
+    '''
+    Encode a STOMP 1.2 frame.
+
+    Args:
+        command (str): the command of the frame
+        headers (Dict[str, str]): the headers of the frame
+        body (bytes): the body of the frame
+
+    Returns:
+        bytes: the encoded frame
+    '''
+    lines = [command]
+    for name, value in headers.items():
+        if command in ("CONNECT", "CONNECTED"):
+            # the headers of the CONNECT and CONNECTED frames are never escaped
+            lines.append(f"{name}:{value}")
+        else:
+            lines.append(f"{_escape(name)}:{_escape(str(value))}")
+    if body:
+        lines.append(f"content-length:{len(body)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8") + body + b"\x00"
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[str, Dict[str, str], bytes]:
+    '''
+    Read a STOMP 1.2 frame, skipping the heart beats.
+
+    Args:
+        reader (asyncio.StreamReader): the stream to read from
+
+    Returns:
+        Tuple[str, Dict[str, str], bytes]: the command, the headers and the body of the frame
+    '''
+    command = ""
+    while not command:
+        command = (await reader.readuntil(b"\n")).decode("utf-8").rstrip("\r\n")
+    headers = {}
+    while True:
+        line = (await reader.readuntil(b"\n")).decode("utf-8").rstrip("\r\n")
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if command != "CONNECTED":
+            name, value = _unescape(name), _unescape(value)
+        # the first occurrence of a repeated header is the one to use
+        headers.setdefault(name, value)
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+        await reader.readexactly(1)
+    else:
+        body = (await reader.readuntil(b"\x00"))[:-1]
+    return command, headers, body
+
+
+class _AsyncStompSubscription():
+    '''A subscription of a shared asyncio connection, whose frames are handed to its handler by a task of its own.'''
+
+    def __init__(self, subscription_id: str, destination: str, handler: Callable[[Dict[str, str], bytes], Awaitable],
+                 ack: str, headers: Dict[str, str]):
+        self.id = subscription_id
+        self.destination = destination
+        self.handler = handler
+        self.ack = ack
+        self.headers = headers
+        # The frames received and not handled yet, along with the writer of the connection they were received from.
+        # Unless the ack mode is auto, the broker stops sending frames once its window is full, which bounds them.
+        self.frames : asyncio.Queue = asyncio.Queue()
+
+    def subscribe_frame(self) -> bytes:
+        '''Encode the SUBSCRIBE frame of the subscription.'''
+        return encode_frame("SUBSCRIBE", {**self.headers, "destination": self.destination, "id": self.id,
+                                          "ack": self.ack})
+
+
+class AsyncWiseAgentStompConnection():
+    '''
+    A connection to a STOMP broker, implemented on asyncio streams, shared by the transports of all the agents
+    running on an event loop. The frames received are dispatched to the handler of their subscription by a task
+    of the subscription, so the frames of each subscription are handled in order, one at a time, while the
+    frames of different subscriptions are handled concurrently. Unless the ack mode of the subscription is auto,
+    each frame is acknowledged once its handler returns, or rejected if it raises an exception. When the connection
+    is lost, it is reestablished and all the subscriptions are renewed.
+    '''
+
+    # The delays between the attempts to reconnect, the last one being repeated until the connection succeeds
+    RECONNECT_DELAYS = (0.1, 0.5, 1, 2, 5, 10, 30)
+    # The interval between the heart beats sent to the broker, in milliseconds
+    HEARTBEAT_INTERVAL = 60000
+    # The maximum size of a header line, or of a body sent without content-length header, in bytes
+    READ_LIMIT = 16 * 1024 * 1024
+
+    def __init__(self, host: str, port: int):
+        '''Initialize the connection, which is established on the first subscription.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker'''
+        self._host = host
+        self._port = port
+        self._writer : Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._connect_lock = asyncio.Lock()
+        self._closed = False
+        self._tasks : set = set()
+        self._subscriptions : Dict[str, _AsyncStompSubscription] = {}
+        self._next_subscription_id = 0
+
+    def __repr__(self) -> str:
+        return f"host={self._host}, port={self._port}, subscriptions={len(self._subscriptions)}"
+
+    def _start_task(self, coroutine) -> asyncio.Task:
+        '''Start a task, keeping a reference to it until it is done.'''
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _connect(self):
+        '''Connect to the broker if not connected, renewing all the subscriptions.'''
+        async with self._connect_lock:
+            if self._connected.is_set():
+                return
+            reader, writer = await asyncio.open_connection(self._host, self._port, limit=self.READ_LIMIT)
+            writer.write(encode_frame("CONNECT", {"accept-version": "1.2", "host": self._host,
+                                                  "login": os.getenv("STOMP_USER", ""),
+                                                  "passcode": os.getenv("STOMP_PASSWORD", ""),
+                                                  "heart-beat": f"{self.HEARTBEAT_INTERVAL},0"}))
+            await writer.drain()
+            command, headers, body = await read_frame(reader)
+            if command != "CONNECTED":
+                writer.close()
+                raise ConnectionError(f"Connection to {self._host}:{self._port} refused: "
+                                      f"{headers.get('message')} {body.decode('utf-8', 'replace')}")
+            self._writer = writer
+            for subscription in self._subscriptions.values():
+                writer.write(subscription.subscribe_frame())
+            await writer.drain()
+            self._connected.set()
+            self._start_task(self._receive(reader, writer))
+            heartbeat = int(headers.get("heart-beat", "0,0").split(",")[1])
+            if heartbeat > 0:
+                self._start_task(self._send_heartbeats(writer, max(heartbeat, self.HEARTBEAT_INTERVAL) / 1000))
+
+    async def _send_heartbeats(self, writer: asyncio.StreamWriter, interval: float):
+        '''Send heart beats to the broker while connected through the given writer.'''
+        while self._writer is writer and not writer.is_closing():
+            await asyncio.sleep(interval)
+            try:
+                writer.write(b"\n")
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''Receive the frames from the broker, reconnecting when the connection is lost.'''
+        try:
+            while True:
+                command, headers, body = await read_frame(reader)
+                if command == "MESSAGE":
+                    subscription = self._subscriptions.get(headers.get("subscription"))
+                    if subscription is None:
+                        logging.getLogger(__name__).warning(f"Dropping a message for {headers.get('destination')}, "
+                                                            f"which has no subscription")
+                        continue
+                    subscription.frames.put_nowait((headers, body, writer))
+                elif command == "ERROR":
+                    logging.getLogger(__name__).error(f"Error from {self._host}:{self._port}: "
+                                                      f"{headers.get('message')} {body.decode('utf-8', 'replace')}")
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logging.getLogger(__name__).warning(f"Connection to {self._host}:{self._port} lost: {e}")
+        except Exception as e:
+            # e.g. a malformed frame, after which the stream can't be read any further
+            logging.getLogger(__name__).warning(f"Error reading from {self._host}:{self._port}, reconnecting: {e!r}")
+        finally:
+            if self._writer is writer:
+                self._writer = None
+                self._connected.clear()
+            writer.close()
+        if not self._closed:
+            self._start_task(self._reconnect())
+
+    async def _reconnect(self):
+        '''Try to reconnect, with increasing delays, until connected or closed.'''
+        attempt = 0
+        while not self._closed and not self._connected.is_set():
+            await asyncio.sleep(self.RECONNECT_DELAYS[min(attempt, len(self.RECONNECT_DELAYS) - 1)])
+            try:
+                await self._connect()
+                logging.getLogger(__name__).info(f"Reconnected to {self._host}:{self._port}")
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Reconnection to {self._host}:{self._port} failed: {e!r}")
+            attempt += 1
+
+    async def _deliver(self, subscription: _AsyncStompSubscription):
+        '''Hand the frames of a subscription to its handler, in order, acknowledging them once handled unless the
+        ack mode is auto, until the subscription is removed.'''
+        while True:
+            frame = await subscription.frames.get()
+            if frame is None:
+                return
+            headers, body, writer = frame
+            handled = False
+            try:
+                await subscription.handler(headers, body)
+                handled = True
+            except Exception:
+                logging.getLogger(__name__).exception(f"Error handling a message of subscription {subscription.id}")
+            if subscription.ack != "auto":
+                await self._acknowledge(headers, writer, handled)
+
+    async def _acknowledge(self, headers: Dict[str, str], writer: asyncio.StreamWriter, ack: bool):
+        '''Acknowledge, or reject, a message received through the given writer. If the connection was lost since
+        the message was received, the broker delivers the message again.'''
+        if self._writer is not writer or writer.is_closing():
+            logging.getLogger(__name__).warning(f"Not connected to {self._host}:{self._port} any more, message "
+                                                f"{headers.get('message-id')} will be delivered again")
+            return
+        try:
+            writer.write(encode_frame("ACK" if ack else "NACK", {"id": headers.get("ack", headers.get("message-id"))}))
+            await writer.drain()
+        except ConnectionError as e:
+            logging.getLogger(__name__).warning(f"Error acknowledging message {headers.get('message-id')}: {e}")
+
+    async def _write(self, frame: bytes):
+        '''Write a frame, waiting for the connection to be reestablished if it was lost.'''
+        while True:
+            if not self._connected.is_set():
+                if self._closed:
+                    raise ConnectionError(f"Connection to {self._host}:{self._port} closed")
+                await self._connect()
+                continue
+            writer = self._writer
+            try:
+                writer.write(frame)
+                await writer.drain()
+                return
+            except ConnectionError:
+                # the connection was lost meanwhile
+                await asyncio.sleep(self.RECONNECT_DELAYS[0])
+
+    async def subscribe(self, destination: str, handler: Callable[[Dict[str, str], bytes], Awaitable],
+                        ack: str = "auto", headers: Optional[Dict[str, str]] = None) -> str:
+        '''
+        Subscribe to a destination.
+
+        Args:
+            destination (str): the destination
+            handler (Callable[[Dict[str, str], bytes], Awaitable]): the coroutine function called with the headers
+            and the body of the messages received from the destination
+            ack (str): the ack mode of the subscription, auto or client-individual to acknowledge each message once
+            the handler returns, or reject it if the handler raises an exception
+            headers (Optional[Dict[str, str]]): additional headers of the subscription, e.g. to limit the number
+            of messages the broker sends before they are acknowledged
+
+        Returns:
+            str: the id of the subscription
+        '''
+        self._closed = False
+        self._next_subscription_id += 1
+        subscription = _AsyncStompSubscription(str(self._next_subscription_id), destination, handler, ack,
+                                               headers or {})
+        self._subscriptions[subscription.id] = subscription
+        self._start_task(self._deliver(subscription))
+        if self._connected.is_set():
+            await self._write(subscription.subscribe_frame())
+        else:
+            await self._connect()
+        return subscription.id
+
+    async def unsubscribe(self, subscription_id: str) -> int:
+        '''
+        Remove a subscription.
+
+        Args:
+            subscription_id (str): the id returned by subscribe
+
+        Returns:
+            int: the number of subscriptions left
+        '''
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is not None:
+            subscription.frames.put_nowait(None)
+            if self._connected.is_set():
+                await self._write(encode_frame("UNSUBSCRIBE", {"id": subscription_id}))
+        return len(self._subscriptions)
+
+    async def send(self, destination: str, body: Union[str, bytes], content_type: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None):
+        '''Send a message to a destination.
+
+        Args:
+            destination (str): the destination
+            body (Union[str, bytes]): the body of the message
+            content_type (Optional[str]): the content type of the body
+            headers (Optional[Dict[str, str]]): additional headers of the message'''
+        frame_headers = {"destination": destination}
+        if content_type is not None:
+            frame_headers["content-type"] = content_type
+        frame_headers.update(headers or {})
+        await self._write(encode_frame("SEND", frame_headers, body.encode("utf-8") if isinstance(body, str) else body))
+
+    async def close(self):
+        '''Disconnect from the broker, without reconnecting.'''
+        self._closed = True
+        for subscription in self._subscriptions.values():
+            subscription.frames.put_nowait(None)
+        self._subscriptions.clear()
+        writer = self._writer
+        self._writer = None
+        self._connected.clear()
+        if writer is not None:
+            try:
+                writer.write(encode_frame("DISCONNECT", {}))
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+
+class AsyncWiseAgentStompConnectionManager:
+    """
+    Manager of the asyncio STOMP connections shared by the transports of all the agents running on the same event
+    loop: there is a single connection for each broker and event loop, whatever the number of agents. The connection
+    to a broker is closed once all the subscriptions made through it are removed.
+    """
+    connections : Dict[Tuple[asyncio.AbstractEventLoop, str, int], AsyncWiseAgentStompConnection] = {}
+
+    @classmethod
+    def get_connection(cls, host: str, port: int) -> AsyncWiseAgentStompConnection:
+        """
+        Get the connection to the given broker of the running event loop, creating it if needed.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+
+        Returns:
+            AsyncWiseAgentStompConnection: the connection
+        """
+        key = (asyncio.get_running_loop(), host, port)
+        connection = cls.connections.get(key)
+        if connection is None:
+            connection = AsyncWiseAgentStompConnection(host, port)
+            cls.connections[key] = connection
+        return connection
+
+    @classmethod
+    async def unsubscribe(cls, host: str, port: int, subscription_id: str):
+        """
+        Remove a subscription, closing the connection to the broker if it was the last one.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            subscription_id (str): the id returned by AsyncWiseAgentStompConnection.subscribe
+        """
+        key = (asyncio.get_running_loop(), host, port)
+        connection = cls.connections.get(key)
+        if connection is not None and await connection.unsubscribe(subscription_id) == 0:
+            cls.connections.pop(key, None)
+            await connection.close()
+
+
+class AsyncStompWiseAgentTransport(AsyncWiseAgentTransport):
+    '''
+    A transport for sending messages between agents using the STOMP protocol from an asyncio event loop, without
+    any thread: the messages are received and sent by a connection implemented on asyncio streams, shared by all the
+    agents of the event loop, and the call backs are awaited on the event loop. As with StompWiseAgentTransport,
+    the messages are acknowledged once handled by default.
+    '''
+
+    yaml_tag = u'!wiseagents.transports.AsyncStompWiseAgentTransport'
+    request_subscription : Optional[str] = None
+    response_subscription : Optional[str] = None
+    _wire_format : str = JSON_WIRE_FORMAT
+    _ack_mode : str = 'client-individual'
+    _prefetch : int = 10
+    _consumer_window_size : Optional[int] = None
+    _compression_threshold : Optional[int] = DEFAULT_COMPRESSION_THRESHOLD
+    _compression : str = ZLIB_COMPRESSION
+    _claim_check_threshold : Optional[int] = None
+    _claim_check_store : str = REDIS_CLAIM_CHECK_STORE
+    _claim_check_directory : Optional[str] = None
+
+    def __init__(self, host: str, port: int, agent_name: str, wire_format: str = JSON_WIRE_FORMAT,
+                 ack_mode: str = 'client-individual', prefetch: int = 10, consumer_window_size: Optional[int] = None,
+                 compression_threshold: Optional[int] = DEFAULT_COMPRESSION_THRESHOLD,
+                 compression: str = ZLIB_COMPRESSION, claim_check_threshold: Optional[int] = None,
+                 claim_check_store: str = REDIS_CLAIM_CHECK_STORE, claim_check_directory: Optional[str] = None):
+        '''Initialize the transport.
+
+        Args:
+            host (str): the host
+            port (int): the port
+            agent_name (str): the agent name
+            wire_format (str): the format of the messages sent, json or yaml to send messages to agents
+            predating the JSON wire format. The messages received are decoded according to their content type
+            ack_mode (str): client-individual, the default, to acknowledge each message once it is handled, or
+            reject it if the call back raises an exception, or auto, see StompWiseAgentTransport
+            prefetch (int): the maximum number of messages of each queue ActiveMQ Classic sends to the agent before
+            they are acknowledged, which bounds the messages waiting to be handled
+            consumer_window_size (Optional[int]): the size, in bytes, of the messages of each queue ActiveMQ Artemis
+            sends to the agent before they are acknowledged, None to use the window of the acceptor of the broker,
+            see StompWiseAgentTransport
+            compression_threshold (Optional[int]): the size, in bytes, above which the messages sent are compressed,
+            None to never compress them
+            compression (str): the compression algorithm, zlib or zstd, see StompWiseAgentTransport
+            claim_check_threshold (Optional[int]): the size, in bytes, above which the contents of the messages sent
+            are left in the claim check store, None to always send them, see StompWiseAgentTransport
+            claim_check_store (str): the claim check store, redis or file
+            claim_check_directory (Optional[str]): the directory of the file claim check store'''
+        self._host = host
+        self._port = port
+        self._agent_name = agent_name
+        self._wire_format = wire_format
+        self._ack_mode = ack_mode
+        self._prefetch = prefetch
+        self._consumer_window_size = consumer_window_size
+        self._compression_threshold = compression_threshold
+        self._compression = compression
+        self._claim_check_threshold = claim_check_threshold
+        self._claim_check_store = claim_check_store
+        self._claim_check_directory = claim_check_directory
+
+    def __repr__(self) -> str:
+        return f"host={self._host}, port={self._port}, agent_name={self._agent_name}"
+
+    def __getstate__(self) -> object:
+        '''Return the state of the transport. Removing the subscriptions to avoid they are serialized/deserialized by pyyaml.'''
+        state = super().__getstate__()
+        state.pop('request_subscription', None)
+        state.pop('response_subscription', None)
+        return state
+
+    async def _decode(self, headers: Dict[str, str], body: bytes) -> WiseAgentMessage:
+        '''Decode the message of a frame received. Unlike StompWiseAgentTransport, the contents left in the claim
+        check store are loaded before the message is handed to the call back, in the default executor of the event
+        loop, since loading them lazily, when first accessed by the call back, would block the event loop.'''
+        message = decode_message(decompress_body(body, headers.get(CONTENT_ENCODING_HEADER)), headers.get("content-type"))
+        reference = headers.get(CLAIM_CHECK_HEADER)
+        message = claim(message, reference, self.claim_check_directory)
+        if reference is not None:
+            await asyncio.to_thread(lambda: message.message)
+        return message
+
+    async def _on_request(self, headers: Dict[str, str], body: bytes):
+        await self.request_receiver(await self._decode(headers, body))
+
+    async def _on_response(self, headers: Dict[str, str], body: bytes):
+        await self.response_receiver(await self._decode(headers, body))
+
+    async def _send(self, message: WiseAgentMessage, destination: str):
+        '''Encode a message, leaving its contents in the claim check store, in the default executor of the event
+        loop, or compressing it when large, and send it.'''
+        reference = None
+        if self.claim_check_threshold is not None:
+            message, reference = await asyncio.to_thread(check_in, message, self.claim_check_threshold,
+                                                         self.claim_check_store, self.claim_check_directory)
+        body, content_type = encode_message(message, self.wire_format)
+        body, content_encoding = compress_body(body, self.compression_threshold, self.compression)
+        headers = {}
+        if reference is not None:
+            headers[CLAIM_CHECK_HEADER] = reference
+        if content_encoding is not None:
+            headers[CONTENT_ENCODING_HEADER] = content_encoding
+        await AsyncWiseAgentStompConnectionManager.get_connection(self.host, self.port).send(destination, body,
+                                                                                             content_type, headers)
+
+    async def start(self):
+        '''
+        Start the transport, subscribing to the queues of the agent.
+        require the environment variables STOMP_USER and STOMP_PASSWORD to be set'''
+        if self.request_subscription is not None and self.response_subscription is not None:
+            return
+        # activemq.prefetchSize is honoured by ActiveMQ Classic and consumer-window-size by ActiveMQ Artemis
+        headers = {} if self.ack_mode == 'auto' else {'activemq.prefetchSize': str(self.prefetch)}
+        if self.consumer_window_size is not None:
+            headers['consumer-window-size'] = str(self.consumer_window_size)
+        connection = AsyncWiseAgentStompConnectionManager.get_connection(self.host, self.port)
+        self.request_subscription = await connection.subscribe(self.request_queue, self._on_request, self.ack_mode,
+                                                               headers)
+        self.response_subscription = await connection.subscribe(self.response_queue, self._on_response,
+                                                                self.ack_mode, headers)
+
+    async def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a request message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        request_destination = '/queue/request/' + dest_agent_name
+        logging.getLogger(__name__).debug("Sending request %s to %s", message, request_destination)
+        await self._send(message, request_destination)
+
+    async def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a response message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        await self._send(message, '/queue/response/' + dest_agent_name)
+
+    async def stop(self):
+        '''Stop the transport, unsubscribing from the queues of the agent.'''
+        for subscription in (self.request_subscription, self.response_subscription):
+            if subscription is not None:
+                await AsyncWiseAgentStompConnectionManager.unsubscribe(self.host, self.port, subscription)
+        self.request_subscription = None
+        self.response_subscription = None
+
+    @property
+    def host(self) -> str:
+        '''Get the host.'''
+        return self._host
+    @property
+    def port(self) -> int:
+        '''Get the port.'''
+        return self._port
+    @property
+    def wire_format(self) -> str:
+        '''Get the format of the messages sent.'''
+        return self._wire_format
+    @property
+    def ack_mode(self) -> str:
+        '''Get the ack mode of the subscriptions.'''
+        return self._ack_mode
+    @property
+    def prefetch(self) -> int:
+        '''Get the maximum number of messages the broker sends before they are acknowledged.'''
+        return self._prefetch
+    @property
+    def consumer_window_size(self) -> Optional[int]:
+        '''Get the size, in bytes, of the messages ActiveMQ Artemis sends before they are acknowledged.'''
+        return self._consumer_window_size
+    @property
+    def compression_threshold(self) -> Optional[int]:
+        '''Get the size, in bytes, above which the messages sent are compressed.'''
+        return self._compression_threshold
+    @property
+    def compression(self) -> str:
+        '''Get the compression algorithm of the messages sent.'''
+        return self._compression
+    @property
+    def claim_check_threshold(self) -> Optional[int]:
+        '''Get the size, in bytes, above which the contents of the messages sent are left in the claim check store.'''
+        return self._claim_check_threshold
+    @property
+    def claim_check_store(self) -> str:
+        '''Get the claim check store.'''
+        return self._claim_check_store
+    @property
+    def claim_check_directory(self) -> Optional[str]:
+        '''Get the directory of the file claim check store.'''
+        return self._claim_check_directory
+    @property
+    def agent_name(self) -> str:
+        '''Get the agent name.'''
+        return self._agent_name
+    @property
+    def request_queue(self) -> str:
+        '''Get the request queue.'''
+        return '/queue/request/' + self.agent_name
+    @property
+    def response_queue(self) -> str:
+        '''Get the response queue.'''
+        return '/queue/response/' + self.agent_name
@@ -0,0 +1,206 @@
+import copy
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from abc import abstractmethod
+from typing import Dict, Optional, Tuple
+
+from wiseagents import WiseAgentMessage, WiseAgentRegistry
+from wiseagents.wise_agent_redis import WiseAgentRedisConnectionManager
+
+# The header of the frames whose message contents were left in a claim check store, set to the reference of the
+# contents, <store name>:<key>
+CLAIM_CHECK_HEADER = "wiseagents-claim-check"
+
+REDIS_CLAIM_CHECK_STORE = "redis"
+FILE_CLAIM_CHECK_STORE = "file"
+DEFAULT_CLAIM_CHECK_DIRECTORY = ".wise-agents/claim_checks"
+# The number of seconds the message contents are kept, which must be longer than the messages may wait in the queues
+DEFAULT_CLAIM_CHECK_TTL = 24 * 3600
+# The keys generated by the stores, the only ones accepted from the frames received, so that a reference can't
+# point to any other file or redis key
+_CLAIM_CHECK_KEY = re.compile("[0-9a-f]{32}")
+
+
+class WiseAgentClaimCheckStore():
+    '''
+    A store keeping the contents of the large messages on the side, so that only a reference to the contents is sent
+    through the broker. The contents are kept until they expire, rather than removed once read, since a message
+    rejected by an agent is delivered again.
+    '''
+
+    name : str
+
+    def __init__(self, ttl: int = DEFAULT_CLAIM_CHECK_TTL):
+        '''Initialize the store.
+
+        Args:
+            ttl (int): the number of seconds the contents are kept'''
+        self._ttl = ttl
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        '''Store the given contents, returning their key.'''
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        '''Get the contents with the given key, raising a KeyError if they expired.'''
+        ...
+
+
+class RedisWiseAgentClaimCheckStore(WiseAgentClaimCheckStore):
+    '''A claim check store keeping the contents in the redis server of the registry, as claim_check:<key> keys.'''
+
+    name = REDIS_CLAIM_CHECK_STORE
+
+    def put(self, data: bytes) -> str:
+        key = uuid.uuid4().hex
+        self._redis().set(f"claim_check:{key}", data, ex=self._ttl)
+        return key
+
+    def get(self, key: str) -> bytes:
+        data = self._redis().get(f"claim_check:{key}")
+        if data is None:
+            raise KeyError(f"The claim check {key} expired or doesn't exist")
+        return data
+
+    def _redis(self):
+        return WiseAgentRedisConnectionManager.get_redis(WiseAgentRegistry.get_config())
+
+
+class FileWiseAgentClaimCheckStore(WiseAgentClaimCheckStore):
+    '''
+    A claim check store keeping the contents in the files of a directory, which must be shared by all the agents,
+    e.g. a volume mounted by all of them. The expired files are removed by the agents writing new ones.
+    '''
+
+    name = FILE_CLAIM_CHECK_STORE
+
+    def __init__(self, directory: str = DEFAULT_CLAIM_CHECK_DIRECTORY, ttl: int = DEFAULT_CLAIM_CHECK_TTL):
+        '''Initialize the store.
+
+        Args:
+            directory (str): the directory of the files
+            ttl (int): the number of seconds the contents are kept'''
+        super().__init__(ttl)
+        self._directory = directory
+        self._last_cleanup = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, data: bytes) -> str:
+        key = uuid.uuid4().hex
+        path = os.path.join(self._directory, key)
+        # written to a temporary file first, so that the contents are never read partially written
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+        self._remove_expired()
+        return key
+
+    def get(self, key: str) -> bytes:
+        if _CLAIM_CHECK_KEY.fullmatch(key) is None:
+            raise KeyError(f"Invalid claim check {key}")
+        try:
+            with open(os.path.join(self._directory, key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            raise KeyError(f"The claim check {key} expired or doesn't exist")
+
+    def _remove_expired(self):
+        '''Remove the expired files, at most once every tenth of the ttl.'''
+        now = time.time()
+        if now - self._last_cleanup < self._ttl / 10:
+            return
+        self._last_cleanup = now
+        for entry in os.scandir(self._directory):
+            try:
+                if entry.stat().st_mtime < now - self._ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+_stores : Dict[Tuple[str, Optional[str]], WiseAgentClaimCheckStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_claim_check_store(store: str = REDIS_CLAIM_CHECK_STORE,
+                          directory: Optional[str] = None) -> WiseAgentClaimCheckStore:
+    """
+    Get the claim check store with the given name, shared by all the transports of the process.
+
+    Args:
+        store (str): redis, to keep the contents in the redis server of the registry, or file
+        directory (Optional[str]): the directory of the file store, .wise-agents/claim_checks by default
+
+    Returns:
+        WiseAgentClaimCheckStore: the store
+    """
+    with _stores_lock:
+        claim_check_store = _stores.get((store, directory))
+        if claim_check_store is None:
+            if store == REDIS_CLAIM_CHECK_STORE:
+                claim_check_store = RedisWiseAgentClaimCheckStore()
+            elif store == FILE_CLAIM_CHECK_STORE:
+                claim_check_store = FileWiseAgentClaimCheckStore(directory or DEFAULT_CLAIM_CHECK_DIRECTORY)
+            else:
+                raise ValueError(f"Unknown claim check store {store}")
+            _stores[(store, directory)] = claim_check_store
+        return claim_check_store
+
+
+def check_in(message: WiseAgentMessage, threshold: Optional[int], store: str = REDIS_CLAIM_CHECK_STORE,
+             directory: Optional[str] = None) -> Tuple[WiseAgentMessage, Optional[str]]:
+    """
+    Leave the contents of a message to be sent in the claim check store, if larger than the threshold.
+
+    Args:
+        message (WiseAgentMessage): the message
+        threshold (Optional[int]): the size, in bytes, above which the contents are left in the store, None to
+        always send them
+        store (str): the name of the store, see get_claim_check_store
+        directory (Optional[str]): the directory of the file store
+
+    Returns:
+        Tuple[WiseAgentMessage, Optional[str]]: the message to send, without contents if they were left in the
+        store, and the reference to send in the CLAIM_CHECK_HEADER header, None if the contents are sent
+    """
+    contents = message.message
+    if threshold is None or not isinstance(contents, str) or len(contents) <= threshold // 4:
+        return message, None
+    data = contents.encode("utf-8")
+    if len(data) <= threshold:
+        return message, None
+    claim_check_store = get_claim_check_store(store, directory)
+    reference = f"{claim_check_store.name}:{claim_check_store.put(data)}"
+    logging.getLogger(__name__).debug(f"Left {len(data)} bytes of the message to {message.context_name} as {reference}")
+    checked_in = copy.copy(message)
+    checked_in._message = None
+    return checked_in, reference
+
+
+def claim(message: WiseAgentMessage, reference: Optional[str], directory: Optional[str] = None) -> WiseAgentMessage:
+    """
+    Set the message received to load its contents from the claim check store the first time they are accessed.
+    A ValueError is raised if the reference was not generated by a claim check store.
+
+    Args:
+        message (WiseAgentMessage): the message received
+        reference (Optional[str]): the value of the CLAIM_CHECK_HEADER header, None if the contents were sent
+        directory (Optional[str]): the directory of the file store
+
+    Returns:
+        WiseAgentMessage: the message
+    """
+    if reference is None:
+        return message
+    store, _, key = reference.partition(":")
+    if _CLAIM_CHECK_KEY.fullmatch(key) is None:
+        raise ValueError(f"Invalid claim check reference {reference}")
+    claim_check_store = get_claim_check_store(store, directory)
+    message.set_message_loader(lambda: claim_check_store.get(key).decode("utf-8"))
+    return message
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from wiseagents import WiseAgentMessage, WiseAgentTransport
+from wiseagents.wise_agent_dispatcher import WiseAgentDispatcher
+
+
+# Put in a queue to stop a thread delivering its messages. As the replicas of an agent consume the same queues,
+# the thread taking it stops only if its transport is stopping, otherwise it puts it back for the other threads
+_STOP = object()
+
+
+class InProcessWiseAgentTransport(WiseAgentTransport):
+    '''
+    A transport for sending messages between agents running in the same process. The messages are delivered as
+    they are, without being serialized, through in-memory queues named as the STOMP queues of the agents. As with
+    a broker, the messages sent to an agent which is not started yet wait in its queues until it starts, and each
+    queue is consumed by a thread of its own, handing the messages to the dispatcher of the transport, so the call
+    backs are never called by the thread sending the message. Several transports with the same agent name, the
+    replicas of the agent, consume the same queues as competing consumers.
+    '''
+
+    yaml_tag = u'!wiseagents.transports.InProcessWiseAgentTransport'
+
+    # The queues of all the agents, by destination, shared by all the transports of the process
+    _queues : Dict[str, queue.Queue] = {}
+    _queues_lock = threading.Lock()
+
+    _request_thread : threading.Thread = None
+    _response_thread : threading.Thread = None
+
+    def __init__(self, agent_name: str, workers: int = WiseAgentDispatcher.DEFAULT_WORKERS,
+                 max_queue_size: int = WiseAgentDispatcher.DEFAULT_MAX_QUEUE_SIZE):
+        '''Initialize the transport.
+
+        Args:
+            agent_name (str): the agent name
+            workers (int): the number of messages of different contexts handled at the same time
+            max_queue_size (int): the maximum number of messages received waiting to be handled'''
+        self._agent_name = agent_name
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+
+    def __repr__(self) -> str:
+        return f"agent_name={self._agent_name}"
+
+    def __getstate__(self) -> object:
+        '''Return the state of the transport. Removing the threads to avoid they are serialized/deserialized by pyyaml.'''
+        state = super().__getstate__()
+        state.pop('request_thread', None)
+        state.pop('response_thread', None)
+        return state
+
+    @classmethod
+    def _get_queue(cls, destination: str) -> queue.Queue:
+        '''Get the queue of the given destination, creating it if needed.'''
+        with cls._queues_lock:
+            return cls._queues.setdefault(destination, queue.Queue())
+
+    def _start_thread(self, destination: str, receiver: Callable[[], Optional[Callable]]) -> threading.Thread:
+        '''Start a thread delivering the messages of the given destination to the call back returned by receiver.'''
+        destination_queue = self._get_queue(destination)
+
+        stopping = threading.Event()
+
+        def deliver():
+            while True:
+                message = destination_queue.get()
+                if message is _STOP:
+                    if stopping.is_set():
+                        return
+                    destination_queue.put(_STOP)
+                    time.sleep(0.001)
+                    continue
+                try:
+                    self.dispatch(receiver(), message)
+                except Exception as e:
+                    logging.getLogger(__name__).exception(f"Error delivering {message} to {destination}")
+                    if self.error_receiver is not None:
+                        self.error_receiver(e)
+
+        thread = threading.Thread(target=deliver, name=f"InProcessWiseAgentTransport-{destination}", daemon=True)
+        thread.stopping = stopping
+        thread.start()
+        return thread
+
+    def start(self):
+        '''Start the transport, delivering the messages of the queues of the agent to its call backs.'''
+        if self._request_thread is not None and self._request_thread.is_alive():
+            return
+        self._request_thread = self._start_thread(self.request_queue, lambda: self.request_receiver)
+        self._response_thread = self._start_thread(self.response_queue, lambda: self.response_receiver)
+
+    def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a request message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        request_destination = '/queue/request/' + dest_agent_name
+        logging.getLogger(__name__).debug("Sending request %s to %s", message, request_destination)
+        self._get_queue(request_destination).put(message)
+
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a response message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        self._get_queue('/queue/response/' + dest_agent_name).put(message)
+
+    def stop(self):
+        '''Stop the transport. The messages sent to the agent afterwards wait in its queues until it starts again.'''
+        for destination, thread in ((self.request_queue, self._request_thread),
+                                    (self.response_queue, self._response_thread)):
+            if thread is not None and thread.is_alive():
+                thread.stopping.set()
+                self._get_queue(destination).put(_STOP)
+                if thread is not threading.current_thread():
+                    thread.join()
+        self._request_thread = None
+        self._response_thread = None
+        self.stop_dispatcher()
+
+    @property
+    def agent_name(self) -> str:
+        '''Get the agent name.'''
+        return self._agent_name
+    @property
+    def request_queue(self) -> str:
+        '''Get the request queue.'''
+        return '/queue/request/' + self.agent_name
+    @property
+    def response_queue(self) -> str:
+        '''Get the response queue.'''
+        return '/queue/response/' + self.agent_name
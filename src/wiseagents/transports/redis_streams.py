@@ -0,0 +1,374 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+
+import redis
+
+from wiseagents import WiseAgentMessage, WiseAgentRegistry, WiseAgentTransport
+from wiseagents.wise_agent_dispatcher import WiseAgentDispatcher
+from wiseagents.wise_agent_redis import WiseAgentRedisConnectionManager
+from wiseagents.transports.wire_format import (DEFAULT_COMPRESSION_THRESHOLD, JSON_WIRE_FORMAT, ZLIB_COMPRESSION,
+                                               compress_body, decode_message, decompress_body, encode_message)
+
+
+class RedisStreamsWiseAgentTransport(WiseAgentTransport):
+    '''
+    A transport for sending messages between agents through Redis streams, using the redis server of the registry
+    instead of a STOMP broker. The requests and the responses sent to an agent are added to the
+    wiseagents:request:<agent name> and wiseagents:response:<agent name> streams, which are read by the consumer
+    group named after the agent: the replicas of an agent are the consumers of its group, so each message is handled
+    by exactly one of them. A thread reads both streams at once, up to batch_size messages at a time, and the
+    messages are acknowledged once handled. The messages left pending by a consumer which died, or whose handling
+    failed, are claimed by another consumer once idle for claim_idle_time seconds, and moved to the
+    <stream>:dead stream once delivered max_deliveries times. The idle time of the messages read and not
+    acknowledged yet by a live consumer is reset every half claim_idle_time, so that they are never claimed by
+    another consumer while waiting for a worker or being handled.
+
+    The thread reading the streams holds a connection of the redis pool of the process while waiting for messages,
+    so redis_max_connections must be larger than the number of agents started in the process.
+    '''
+
+    yaml_tag = u'!wiseagents.transports.RedisStreamsWiseAgentTransport'
+
+    STREAM_PREFIX = "wiseagents:"
+
+    _wire_format : str = JSON_WIRE_FORMAT
+    _batch_size : int = 10
+    _block_timeout : float = 1.0
+    _max_in_flight : int = 10
+    _claim_idle_time : float = 60.0
+    _max_deliveries : int = 5
+    _max_length : int = 10000
+    _compression_threshold : Optional[int] = DEFAULT_COMPRESSION_THRESHOLD
+    _compression : str = ZLIB_COMPRESSION
+
+    _reader_thread : Optional[threading.Thread] = None
+    _running : bool = False
+    _consumer_name : Optional[str] = None
+    _next_refresh : float = 0.0
+
+    def __init__(self, agent_name: str, wire_format: str = JSON_WIRE_FORMAT,
+                 workers: int = WiseAgentDispatcher.DEFAULT_WORKERS,
+                 max_queue_size: int = WiseAgentDispatcher.DEFAULT_MAX_QUEUE_SIZE,
+                 batch_size: int = 10, block_timeout: float = 1.0, max_in_flight: int = 10,
+                 claim_idle_time: float = 60.0, max_deliveries: int = 5, max_length: int = 10000,
+                 compression_threshold: Optional[int] = DEFAULT_COMPRESSION_THRESHOLD,
+                 compression: str = ZLIB_COMPRESSION):
+        '''Initialize the transport.
+
+        Args:
+            agent_name (str): the agent name
+            wire_format (str): the format of the messages sent, json or yaml
+            workers (int): the number of messages of different contexts handled at the same time
+            max_queue_size (int): the maximum number of messages received waiting to be handled
+            batch_size (int): the maximum number of messages read from the streams at once
+            block_timeout (float): the maximum number of seconds to wait for messages at each read, which bounds
+            the time taken to stop the transport
+            max_in_flight (int): the maximum number of messages read and not acknowledged yet
+            claim_idle_time (float): the number of seconds after which a message left pending by another consumer,
+            e.g. because it died, is claimed, which must be longer than block_timeout
+            max_deliveries (int): the number of deliveries after which a message is moved to the dead stream
+            max_length (int): the approximate maximum number of messages kept in each stream
+            compression_threshold (Optional[int]): the size, in bytes, above which the messages sent are compressed,
+            None to never compress them
+            compression (str): the compression algorithm, zlib or zstd'''
+        self._agent_name = agent_name
+        self._wire_format = wire_format
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._batch_size = batch_size
+        self._block_timeout = block_timeout
+        self._max_in_flight = max_in_flight
+        self._claim_idle_time = claim_idle_time
+        self._max_deliveries = max_deliveries
+        self._max_length = max_length
+        self._compression_threshold = compression_threshold
+        self._compression = compression
+
+    def __repr__(self) -> str:
+        return f"agent_name={self._agent_name}"
+
+    def __getstate__(self) -> object:
+        '''Return the state of the transport. Removing the reader thread to avoid it is serialized/deserialized by pyyaml.'''
+        state = super().__getstate__()
+        for key in ('reader_thread', 'running', 'consumer_name', 'in_flight', 'in_flight_ids', 'in_flight_lock',
+                    'claim_cursors', 'next_refresh'):
+            state.pop(key, None)
+        return state
+
+    def _redis(self) -> redis.Redis:
+        '''Get the client of the redis server of the registry.'''
+        return WiseAgentRedisConnectionManager.get_redis(WiseAgentRegistry.get_config())
+
+    @classmethod
+    def stream_name(cls, kind: str, agent_name: str) -> str:
+        '''Get the name of the request or response stream of an agent.
+
+        Args:
+            kind (str): request or response
+            agent_name (str): the agent name'''
+        return f"{cls.STREAM_PREFIX}{kind}:{agent_name}"
+
+    def start(self):
+        '''Start the transport, creating the consumer group of the agent if needed and starting the thread reading
+        the streams of the agent.'''
+        if self._running:
+            return
+        redis_db = self._redis()
+        for stream in (self.request_stream, self.response_stream):
+            try:
+                # from the first message, so that the messages sent before the agent first started are handled
+                redis_db.xgroup_create(stream, self.agent_name, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._consumer_name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        # The streams and the ids of the messages read and not acknowledged yet, which are not claimed again by
+        # this consumer and whose idle time is reset every half claim_idle_time
+        self._in_flight_ids : Set[Tuple[str, Any]] = set()
+        self._in_flight_lock = threading.Lock()
+        # The id from which the next claim of idle messages scans each stream, so that successive claims go through
+        # the whole pending entries list rather than its first batch_size entries
+        self._claim_cursors : Dict[str, Any] = {self.request_stream: "0-0", self.response_stream: "0-0"}
+        self._next_refresh = 0.0
+        self._running = True
+        self._reader_thread = threading.Thread(target=self._read, name=f"RedisStreamsWiseAgentTransport-{self.agent_name}",
+                                               daemon=True)
+        self._reader_thread.start()
+
+    def _read(self):
+        '''Read the streams of the agent, resetting the idle time of the messages in flight and claiming the idle
+        pending messages every half claim_idle_time, until the transport is stopped.'''
+        streams = {self.request_stream: ">", self.response_stream: ">"}
+        next_claim = 0.0
+        while self._running:
+            try:
+                self._refresh_in_flight_messages()
+                if time.monotonic() >= next_claim:
+                    next_claim = time.monotonic() + self.claim_idle_time / 2
+                    for stream in streams:
+                        self._claim_idle_messages(stream)
+                entries = self._redis().xreadgroup(self.agent_name, self._consumer_name, streams,
+                                                   count=self.batch_size, block=int(self.block_timeout * 1000))
+                for stream, messages in entries or []:
+                    stream = self._decode_key(stream)
+                    # tracked at once, since the last messages of the batch may wait for the first ones to be handled
+                    with self._in_flight_lock:
+                        self._in_flight_ids.update((stream, entry_id) for entry_id, _ in messages)
+                    for index, (entry_id, fields) in enumerate(messages):
+                        try:
+                            self._receive(stream, entry_id, fields)
+                        except Exception:
+                            # the messages not handed to the dispatcher are left pending, to be claimed once idle
+                            for remaining_id, _ in messages[index:]:
+                                self._untrack(stream, remaining_id)
+                            raise
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Error reading the streams of {self.agent_name}: {e}")
+                if self.error_receiver is not None:
+                    self.error_receiver(e)
+                time.sleep(self.block_timeout)
+
+    def _refresh_in_flight_messages(self):
+        '''Reset the idle time of the messages read and not acknowledged yet, at most every half claim_idle_time,
+        so that they are not claimed by another consumer. XCLAIM with JUSTID doesn't increment their delivery
+        count.'''
+        if time.monotonic() < self._next_refresh:
+            return
+        self._next_refresh = time.monotonic() + self.claim_idle_time / 2
+        with self._in_flight_lock:
+            in_flight_ids = list(self._in_flight_ids)
+        for stream in (self.request_stream, self.response_stream):
+            entry_ids = [entry_id for in_flight_stream, entry_id in in_flight_ids if in_flight_stream == stream]
+            if entry_ids:
+                self._redis().xclaim(stream, self.agent_name, self._consumer_name, min_idle_time=0,
+                                     message_ids=entry_ids, justid=True)
+
+    def _claim_idle_messages(self, stream: str):
+        '''Claim the messages of the given stream idle for claim_idle_time seconds, moving the ones already
+        delivered max_deliveries times to the dead stream. Each call claims up to batch_size messages, starting
+        where the previous call stopped.'''
+        redis_db = self._redis()
+        claimed = redis_db.xautoclaim(stream, self.agent_name, self._consumer_name,
+                                      min_idle_time=int(self.claim_idle_time * 1000),
+                                      start_id=self._claim_cursors[stream], count=self.batch_size)
+        self._claim_cursors[stream] = claimed[0]
+        for entry_id, fields in claimed[1]:
+            with self._in_flight_lock:
+                if (stream, entry_id) in self._in_flight_ids:
+                    continue
+                self._in_flight_ids.add((stream, entry_id))
+            handed = False
+            try:
+                if not fields:
+                    # trimmed from the stream while pending
+                    redis_db.xack(stream, self.agent_name, entry_id)
+                    continue
+                # the delivery count includes the delivery made by the claim
+                pending = redis_db.xpending_range(stream, self.agent_name, min=entry_id, max=entry_id, count=1)
+                if pending and pending[0]["times_delivered"] > self.max_deliveries:
+                    self._move_to_dead_stream(stream, entry_id)
+                    continue
+                logging.getLogger(__name__).info(f"Claimed message {self._decode_key(entry_id)} of {stream}")
+                self._receive(stream, entry_id, fields)
+                handed = True
+            finally:
+                if not handed:
+                    self._untrack(stream, entry_id)
+
+    def _move_to_dead_stream(self, stream: str, entry_id: Any):
+        '''Acknowledge a message which can't be handled, copying it to the dead stream of its stream.'''
+        entries = self._redis().xrange(stream, min=entry_id, max=entry_id)
+        pipeline = self._redis().pipeline(transaction=True)
+        if entries:
+            pipeline.xadd(f"{stream}:dead", entries[0][1], maxlen=self.max_length, approximate=True)
+        pipeline.xack(stream, self.agent_name, entry_id)
+        pipeline.execute()
+        logging.getLogger(__name__).warning(f"Moved message {self._decode_key(entry_id)} of {stream} to {stream}:dead")
+
+    @staticmethod
+    def _decode_key(key: Any) -> str:
+        return key.decode("utf-8") if isinstance(key, bytes) else key
+
+    def _untrack(self, stream: str, entry_id: Any):
+        '''Forget a message read and no longer in flight.'''
+        with self._in_flight_lock:
+            self._in_flight_ids.discard((stream, entry_id))
+
+    def _receive(self, stream: str, entry_id: Any, fields: Dict[bytes, bytes]):
+        '''Hand a message read from a stream, already tracked as in flight, to the call back of the stream through
+        the dispatcher, acknowledging it once the call back returns. The message is left pending if the call back
+        raises an exception, to be claimed again once idle. Blocks while max_in_flight messages are waiting to be
+        acknowledged, still resetting the idle time of the messages in flight meanwhile.'''
+        receiver = self.request_receiver if stream == self.request_stream else self.response_receiver
+        content_encoding = fields.get(b"content_encoding")
+        content_type = fields.get(b"content_type")
+        try:
+            message = decode_message(decompress_body(fields[b"body"], self._decode_key(content_encoding)),
+                                     self._decode_key(content_type))
+        except Exception:
+            logging.getLogger(__name__).exception(f"Error decoding message {self._decode_key(entry_id)} of {stream}")
+            self._move_to_dead_stream(stream, entry_id)
+            self._untrack(stream, entry_id)
+            return
+        while not self._in_flight.acquire(timeout=self.block_timeout):
+            self._refresh_in_flight_messages()
+
+        def release():
+            self._untrack(stream, entry_id)
+            self._in_flight.release()
+
+        def handle_and_ack(message: WiseAgentMessage):
+            try:
+                receiver(message)
+                self._redis().xack(stream, self.agent_name, entry_id)
+            finally:
+                release()
+
+        try:
+            self.dispatch(handle_and_ack, message)
+        except Exception:
+            release()
+            raise
+
+    def _send(self, message: WiseAgentMessage, stream: str):
+        '''Encode a message, compressing it when large, and add it to the given stream.'''
+        body, content_type = encode_message(message, self.wire_format)
+        body, content_encoding = compress_body(body, self.compression_threshold, self.compression)
+        fields = {"body": body, "content_type": content_type}
+        if content_encoding is not None:
+            fields["content_encoding"] = content_encoding
+        # approximate trimming lets redis drop whole nodes of the stream, keeping XADD O(1)
+        self._redis().xadd(stream, fields, maxlen=self.max_length, approximate=True)
+
+    def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a request message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        logging.getLogger(__name__).debug("Sending request %s to %s", message, dest_agent_name)
+        self._send(message, self.stream_name("request", dest_agent_name))
+
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a response message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        self._send(message, self.stream_name("response", dest_agent_name))
+
+    def stop(self):
+        '''Stop the transport once the messages already read are handled. The messages sent to the agent afterwards
+        wait in its streams until it starts again.'''
+        self._running = False
+        if self._reader_thread is not None and self._reader_thread is not threading.current_thread():
+            self._reader_thread.join()
+        self._reader_thread = None
+        self.stop_dispatcher()
+
+    def get_pending_counts(self) -> Dict[str, int]:
+        '''Get the number of messages of the streams of the agent read and not acknowledged yet by its replicas.
+
+        Returns:
+            Dict[str, int]: the stream names as keys and the number of pending messages as values'''
+        return {stream: self._redis().xpending(stream, self.agent_name)["pending"]
+                for stream in (self.request_stream, self.response_stream)}
+
+    @property
+    def agent_name(self) -> str:
+        '''Get the agent name.'''
+        return self._agent_name
+    @property
+    def wire_format(self) -> str:
+        '''Get the format of the messages sent.'''
+        return self._wire_format
+    @property
+    def batch_size(self) -> int:
+        '''Get the maximum number of messages read from the streams at once.'''
+        return self._batch_size
+    @property
+    def block_timeout(self) -> float:
+        '''Get the maximum number of seconds to wait for messages at each read.'''
+        return self._block_timeout
+    @property
+    def max_in_flight(self) -> int:
+        '''Get the maximum number of messages read and not acknowledged yet.'''
+        return self._max_in_flight
+    @property
+    def claim_idle_time(self) -> float:
+        '''Get the number of seconds after which a pending message is claimed by another consumer.'''
+        return self._claim_idle_time
+    @property
+    def max_deliveries(self) -> int:
+        '''Get the number of deliveries after which a message is moved to the dead stream.'''
+        return self._max_deliveries
+    @property
+    def max_length(self) -> int:
+        '''Get the approximate maximum number of messages kept in each stream.'''
+        return self._max_length
+    @property
+    def compression_threshold(self) -> Optional[int]:
+        '''Get the size, in bytes, above which the messages sent are compressed.'''
+        return self._compression_threshold
+    @property
+    def compression(self) -> str:
+        '''Get the compression algorithm of the messages sent.'''
+        return self._compression
+    @property
+    def consumer_name(self) -> Optional[str]:
+        '''Get the name of the consumer of the transport in the consumer group of the agent, None if not started.'''
+        return self._consumer_name
+    @property
+    def request_stream(self) -> str:
+        '''Get the request stream.'''
+        return self.stream_name("request", self.agent_name)
+    @property
+    def response_stream(self) -> str:
+        '''Get the response stream.'''
+        return self.stream_name("response", self.agent_name)
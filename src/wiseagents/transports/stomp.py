@@ -1,11 +1,17 @@
 import logging
-import os
+import threading
+from typing import Callable, Optional
 
 import stomp
 import stomp.utils
-import yaml
 
 from wiseagents import WiseAgentMessage, WiseAgentTransport
+from wiseagents.wise_agent_dispatcher import WiseAgentDispatcher
+from wiseagents.transports.stomp_connection import WiseAgentStompConnectionManager
+from wiseagents.transports.claim_check import CLAIM_CHECK_HEADER, REDIS_CLAIM_CHECK_STORE, check_in, claim
+from wiseagents.transports.wire_format import (CONTENT_ENCODING_HEADER, DEFAULT_COMPRESSION_THRESHOLD, JSON_WIRE_FORMAT,
+                                               ZLIB_COMPRESSION, compress_body, decode_message, decompress_body,
+                                               encode_message)
 
 
 class WiseAgentRequestQueueListener(stomp.ConnectionListener):
@@ -15,8 +21,10 @@ class WiseAgentRequestQueueListener(stomp.ConnectionListener):
         '''Initialize the listener.
 
         Args:
-            '''
+            transport (WiseAgentTransport): the transport'''
         self.transport = transport
+        # Bounds the number of requests received and not acknowledged yet
+        self.in_flight = threading.BoundedSemaphore(transport.max_in_flight)
     
     def on_event(self, event):
         '''Handle an event.'''
@@ -26,9 +34,13 @@ class WiseAgentRequestQueueListener(stomp.ConnectionListener):
         '''Handle an error.'''
         self.transport.error_receiver(error)
 
-    def on_message(self, message: stomp.utils.Frame):
-        '''Handle a message.'''
-        self.transport.request_receiver(yaml.load(message.body, yaml.Loader))
+    def on_message(self, message: stomp.utils.Frame) -> bool:
+        '''Handle a message, returning False if it must be delivered again once resume is called.'''
+        return self.transport.receive(message, self.transport.request_receiver, self.in_flight, self.resume)
+
+    def resume(self):
+        '''Deliver again the message refused by on_message.'''
+        WiseAgentStompConnectionManager.resume(self.transport.host, self.transport.port, self)
 
 class WiseAgentResponseQueueListener(stomp.ConnectionListener):
     '''A listener for the response queue.'''
@@ -38,65 +50,199 @@ class WiseAgentResponseQueueListener(stomp.ConnectionListener):
         Args:
             transport (WiseAgentTransport): the transport'''
         self.transport = transport
+        # Bounds the number of responses received and not acknowledged yet
+        self.in_flight = threading.BoundedSemaphore(transport.max_in_flight)
             
     def on_error(self, error):
         '''Handle an error.'''
         self.transport.error_receiver(error)
 
-    def on_message(self, message: stomp.utils.Frame):
-        '''Handle a message.'''
-        self.transport.response_receiver(yaml.load(message.body, yaml.Loader))
+    def on_message(self, message: stomp.utils.Frame) -> bool:
+        '''Handle a message, returning False if it must be delivered again once resume is called.'''
+        return self.transport.receive(message, self.transport.response_receiver, self.in_flight, self.resume)
+
+    def resume(self):
+        '''Deliver again the message refused by on_message.'''
+        WiseAgentStompConnectionManager.resume(self.transport.host, self.transport.port, self)
 
 
 class StompWiseAgentTransport(WiseAgentTransport):
     '''A transport for sending messages between agents using the STOMP protocol.'''
     
     yaml_tag = u'!wiseagents.transports.StompWiseAgentTransport'
-    request_conn : stomp.Connection = None
-    response_conn : stomp.Connection = None
-    
-    def __init__(self, host: str, port: int, agent_name: str):
+    request_subscription : Optional[str] = None
+    response_subscription : Optional[str] = None
+    _wire_format : str = JSON_WIRE_FORMAT
+    _ack_mode : str = 'client-individual'
+    _prefetch : int = 10
+    _consumer_window_size : Optional[int] = None
+    _max_in_flight : int = 10
+    _compression_threshold : Optional[int] = DEFAULT_COMPRESSION_THRESHOLD
+    _compression : str = ZLIB_COMPRESSION
+    _claim_check_threshold : Optional[int] = None
+    _claim_check_store : str = REDIS_CLAIM_CHECK_STORE
+    _claim_check_directory : Optional[str] = None
+
+    def __init__(self, host: str, port: int, agent_name: str, wire_format: str = JSON_WIRE_FORMAT,
+                 workers: int = WiseAgentDispatcher.DEFAULT_WORKERS,
+                 max_queue_size: int = WiseAgentDispatcher.DEFAULT_MAX_QUEUE_SIZE,
+                 ack_mode: str = 'client-individual', prefetch: int = 10, consumer_window_size: Optional[int] = None,
+                 max_in_flight: int = 10,
+                 compression_threshold: Optional[int] = DEFAULT_COMPRESSION_THRESHOLD,
+                 compression: str = ZLIB_COMPRESSION, claim_check_threshold: Optional[int] = None,
+                 claim_check_store: str = REDIS_CLAIM_CHECK_STORE, claim_check_directory: Optional[str] = None):
         '''Initialize the transport.
 
         Args:
             host (str): the host
             port (int): the port
-            agent_name (str): the agent name'''
+            agent_name (str): the agent name
+            wire_format (str): the format of the messages sent, json or yaml to send messages to agents
+            predating the JSON wire format. The messages received are decoded according to their content type
+            workers (int): the number of messages of different contexts handled at the same time
+            max_queue_size (int): the maximum number of messages received waiting to be handled
+            ack_mode (str): client-individual, the default, to acknowledge each message once it is handled, so that
+            the broker delivers it again if the agent dies meanwhile, or auto to let the broker consider the
+            messages acknowledged as soon as they are sent
+            prefetch (int): the maximum number of messages of each queue the broker sends to the agent before they
+            are acknowledged, so that the broker balances the messages across the replicas of the agent. Sent as
+            the activemq.prefetchSize header, which is only honoured by ActiveMQ Classic
+            consumer_window_size (Optional[int]): the size, in bytes rather than messages, of the messages of each
+            queue ActiveMQ Artemis sends to the agent before they are acknowledged, sent as the consumer-window-size
+            header: 0 to send a message at a time, -1 for no limit, None, the default, to use the window of the
+            acceptor of the broker
+            max_in_flight (int): the maximum number of messages of each queue received and not acknowledged yet,
+            further messages are left queued in the connection, up to the broker window, until a message is
+            acknowledged
+            compression_threshold (Optional[int]): the size, in bytes, above which the messages sent are compressed,
+            None to never compress them, e.g. to send messages to agents predating the compression
+            compression (str): the compression algorithm, zlib or zstd, which requires the zstandard package on the
+            receiving agents as well. The messages received are decompressed according to their
+            wiseagents-content-encoding header
+            claim_check_threshold (Optional[int]): the size, in bytes, above which the contents of the messages sent
+            are left in the claim check store and only a reference to them is sent, None, the default, to always
+            send them. The contents of the messages received are loaded from the store when first accessed
+            claim_check_store (str): the claim check store, redis, the redis server of the registry, or file,
+            a directory shared by all the agents
+            claim_check_directory (Optional[str]): the directory of the file claim check store, used to load the
+            contents of the messages received as well, .wise-agents/claim_checks by default'''
         self._host = host
         self._port = port
         self._agent_name = agent_name
+        self._wire_format = wire_format
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._ack_mode = ack_mode
+        self._prefetch = prefetch
+        self._consumer_window_size = consumer_window_size
+        self._max_in_flight = max_in_flight
+        self._compression_threshold = compression_threshold
+        self._compression = compression
+        self._claim_check_threshold = claim_check_threshold
+        self._claim_check_store = claim_check_store
+        self._claim_check_directory = claim_check_directory
         
 
     def __repr__(self) -> str:
         return f"host={self._host}, port={self._port}, agent_name={self._agent_name}"
 
     def __getstate__(self) -> object:
-        '''Return the state of the transport. Removing the instance variable chain to avoid it is serialized/deserialized by pyyaml.'''
+        '''Return the state of the transport. Removing the subscriptions to avoid they are serialized/deserialized by pyyaml.'''
         state = super().__getstate__()
-        del state['request_conn']
-        del state['response_conn']
+        state.pop('request_subscription', None)
+        state.pop('response_subscription', None)
         return state
 
 
     def start(self):
         '''
-        Start the transport.
+        Start the transport, subscribing to the queues of the agent through the connection to the broker shared
+        with the other agents of the process (see WiseAgentStompConnectionManager).
         require the environment variables STOMP_USER and STOMP_PASSWORD to be set'''
-        if (self.request_conn is not None and self.request_conn.is_connected()) and (self.response_conn is not None and self.response_conn.is_connected()):
+        if self.request_subscription is not None and self.response_subscription is not None:
             return
-        hosts = [(self.host, self.port)] 
-        self.request_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000))
-        self.request_conn.set_listener('WiseAgentRequestTopicListener', WiseAgentRequestQueueListener(self))
-        self.request_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
-        self.request_conn.subscribe(destination=self.request_queue, id=id(self), ack='auto')
-        
-        self.response_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000))
-        
-        self.response_conn.set_listener('WiseAgentResponseQueueListener', WiseAgentResponseQueueListener(self))
-        self.response_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
-        
-        self.response_conn.subscribe(destination=self.response_queue, id=id(self) + 1 , ack='auto')
+        # activemq.prefetchSize is honoured by ActiveMQ Classic and consumer-window-size by ActiveMQ Artemis,
+        # max_in_flight bounds the messages handed to the agent whatever the broker, the broker window the messages
+        # queued by the connection while the agent has no room for them
+        headers = {} if self.ack_mode == 'auto' else {'activemq.prefetchSize': str(self.prefetch)}
+        if self.consumer_window_size is not None:
+            headers['consumer-window-size'] = str(self.consumer_window_size)
+        self.request_subscription = WiseAgentStompConnectionManager.subscribe(self.host, self.port, self.request_queue,
+                                                                              WiseAgentRequestQueueListener(self),
+                                                                              self.ack_mode, headers)
+        self.response_subscription = WiseAgentStompConnectionManager.subscribe(self.host, self.port,
+                                                                               self.response_queue,
+                                                                               WiseAgentResponseQueueListener(self),
+                                                                               self.ack_mode, headers)
+
+    def receive(self, frame: stomp.utils.Frame, receiver: Callable[[WiseAgentMessage], None],
+                in_flight: threading.BoundedSemaphore, resume: Callable[[], None]) -> bool:
+        '''Hand a message received to the given call back through the dispatcher of the transport. Unless the
+        ack mode is auto, the message is acknowledged once the call back returns, or rejected if it raises an
+        exception. The message is refused, without blocking the thread delivering it, while max_in_flight messages
+        are waiting to be acknowledged or the queue of the dispatcher is full, and resume is called once there
+        is room for it.
+
+        Args:
+            frame (stomp.utils.Frame): the frame of the message
+            receiver (Callable[[WiseAgentMessage], None]): the call back
+            in_flight (threading.BoundedSemaphore): the semaphore bounding the messages not acknowledged yet
+            resume (Callable[[], None]): the function delivering the message again once there is room for it
+
+        Returns:
+            bool: True if the message was handed to the dispatcher, False if it was refused'''
+        if self.ack_mode == 'auto':
+            return self.try_dispatch(receiver, self._decode(frame), resume)
+        if not in_flight.acquire(blocking=False):
+            # resume is called when one of the messages in flight is acknowledged
+            return False
+        try:
+            message = self._decode(frame)
+        except Exception:
+            in_flight.release()
+            WiseAgentStompConnectionManager.ack(self.host, self.port, frame, False)
+            raise
+
+        def handle_and_ack(message: WiseAgentMessage):
+            handled = False
+            try:
+                receiver(message)
+                handled = True
+            finally:
+                try:
+                    WiseAgentStompConnectionManager.ack(self.host, self.port, frame, handled)
+                finally:
+                    in_flight.release()
+                    resume()
 
+        try:
+            if self.try_dispatch(handle_and_ack, message, resume):
+                return True
+        except Exception:
+            in_flight.release()
+            WiseAgentStompConnectionManager.ack(self.host, self.port, frame, False)
+            raise
+        in_flight.release()
+        return False
+
+    def _decode(self, frame: stomp.utils.Frame) -> WiseAgentMessage:
+        '''Decode the message of a frame received, decompressing its body if needed.'''
+        message = decode_message(decompress_body(frame.body, frame.headers.get(CONTENT_ENCODING_HEADER)),
+                                 frame.headers.get('content-type'))
+        return claim(message, frame.headers.get(CLAIM_CHECK_HEADER), self.claim_check_directory)
+
+    def _send(self, message: WiseAgentMessage, destination: str):
+        '''Encode a message, leaving its contents in the claim check store or compressing it when large, and send it.'''
+        message, reference = check_in(message, self.claim_check_threshold, self.claim_check_store,
+                                      self.claim_check_directory)
+        body, content_type = encode_message(message, self.wire_format)
+        body, content_encoding = compress_body(body, self.compression_threshold, self.compression)
+        headers = {}
+        if reference is not None:
+            headers[CLAIM_CHECK_HEADER] = reference
+        if content_encoding is not None:
+            headers[CONTENT_ENCODING_HEADER] = content_encoding
+        WiseAgentStompConnectionManager.send(self.host, self.port, destination, body, content_type, headers)
 
     def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
         '''Send a request message to an agent.
@@ -105,15 +251,11 @@ class StompWiseAgentTransport(WiseAgentTransport):
             message (WiseAgentMessage): the message to send
             dest_agent_name (str): the destination agent name'''
         # Send the message using the STOMP protocol
-        if self.request_conn is None or self.response_conn is None:
+        if self.request_subscription is None or self.response_subscription is None:
             self.start()
-        if self.request_conn.is_connected() == False:
-            self.request_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
-        if self.response_conn.is_connected() == False:
-            self.response_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
         request_destination = '/queue/request/' + dest_agent_name
-        logging.getLogger(__name__).debug(f"Sending request {message} to {request_destination}")
-        self.request_conn.send(body=yaml.dump(message), destination=request_destination)
+        logging.getLogger(__name__).debug("Sending request %s to %s", message, request_destination)
+        self._send(message, request_destination)
         
     def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
         '''Send a response message to an agent.
@@ -122,23 +264,21 @@ class StompWiseAgentTransport(WiseAgentTransport):
             message (WiseAgentMessage): the message to send
             dest_agent_name (str): the destination agent name'''
         # Send the message using the STOMP protocol
-        if self.request_conn is None or self.response_conn is None:
+        if self.request_subscription is None or self.response_subscription is None:
             self.start()
         response_destination = '/queue/response/' + dest_agent_name    
-        self.response_conn.send(body=yaml.dump(message), destination=response_destination)
+        self._send(message, response_destination)
 
     def stop(self):
-        '''Stop the transport.'''
-        if self.request_conn is not None and self.request_conn.is_connected():
-            #unsubscribe from the request topic
-            self.request_conn.unsubscribe(destination=self.request_queue, id=id(self))
-            # Disconnect request from the STOMP server
-            self.request_conn.disconnect()
-        if self.response_conn is not None and self.response_conn.is_connected():
-            #unsubscribe from the response queue
-            self.response_conn.unsubscribe(destination=self.response_queue, id=id(self) + 1)
-            # Disconnect response from the STOMP server
-            self.response_conn.disconnect()
+        '''Stop the transport, unsubscribing from the queues of the agent. The connection to the broker is closed
+        once all the agents using it are stopped.'''
+        if self.request_subscription is not None:
+            WiseAgentStompConnectionManager.unsubscribe(self.host, self.port, self.request_subscription)
+            self.request_subscription = None
+        if self.response_subscription is not None:
+            WiseAgentStompConnectionManager.unsubscribe(self.host, self.port, self.response_subscription)
+            self.response_subscription = None
+        self.stop_dispatcher()
             
         
     @property
@@ -150,6 +290,46 @@ class StompWiseAgentTransport(WiseAgentTransport):
         '''Get the port.'''
         return self._port
     @property
+    def wire_format(self) -> str:
+        '''Get the format of the messages sent.'''
+        return self._wire_format
+    @property
+    def compression_threshold(self) -> Optional[int]:
+        '''Get the size, in bytes, above which the messages sent are compressed.'''
+        return self._compression_threshold
+    @property
+    def compression(self) -> str:
+        '''Get the compression algorithm of the messages sent.'''
+        return self._compression
+    @property
+    def claim_check_threshold(self) -> Optional[int]:
+        '''Get the size, in bytes, above which the contents of the messages sent are left in the claim check store.'''
+        return self._claim_check_threshold
+    @property
+    def claim_check_store(self) -> str:
+        '''Get the claim check store.'''
+        return self._claim_check_store
+    @property
+    def claim_check_directory(self) -> Optional[str]:
+        '''Get the directory of the file claim check store.'''
+        return self._claim_check_directory
+    @property
+    def ack_mode(self) -> str:
+        '''Get the ack mode of the subscriptions.'''
+        return self._ack_mode
+    @property
+    def prefetch(self) -> int:
+        '''Get the maximum number of messages the broker sends before they are acknowledged.'''
+        return self._prefetch
+    @property
+    def consumer_window_size(self) -> Optional[int]:
+        '''Get the size, in bytes, of the messages ActiveMQ Artemis sends before they are acknowledged.'''
+        return self._consumer_window_size
+    @property
+    def max_in_flight(self) -> int:
+        '''Get the maximum number of messages of each queue received and not acknowledged yet.'''
+        return self._max_in_flight
+    @property
     def agent_name(self) -> str:
         '''Get the agent name.'''
         return self._agent_name
@@ -0,0 +1,394 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+
+import stomp
+import stomp.utils
+
+
+class _StompSubscription():
+    '''A subscription of a shared connection, delivering its frames one at a time, in order, to its listener.'''
+
+    def __init__(self, subscription_id: str, destination: str, listener: stomp.ConnectionListener, ack: str,
+                 headers: Dict[str, str]):
+        self.id = subscription_id
+        self.destination = destination
+        self.listener = listener
+        self.ack = ack
+        self.headers = headers
+        self.frames : deque = deque()
+        # Whether a task delivering the frames is submitted to the executor
+        self.delivering = False
+        # Whether the listener declined the first frame, which is delivered again once the listener resumes
+        self.paused = False
+        # Whether the listener resumed while its frame was being delivered
+        self.resumed = False
+        self.lock = threading.Lock()
+
+
+class WiseAgentStompConnection(stomp.ConnectionListener):
+    '''
+    A connection to a STOMP broker shared by the transports of all the agents of the process, multiplexing their
+    subscriptions. The frames received are dispatched to the listener of their subscription on a thread pool shared
+    by all the connections: the frames of each subscription are delivered in order, one at a time, while the frames
+    of different subscriptions are delivered concurrently, so that an agent busy handling a message doesn't hold
+    up the others. A listener which can't take a frame yet returns False from on_message instead of blocking a
+    thread of the pool: the frame is left queued, with the ones following it, until the listener calls resume.
+    When the connection is lost, it is reestablished and all the subscriptions are renewed.
+    '''
+
+    # The delays between the attempts to reconnect, the last one being repeated until the connection succeeds
+    RECONNECT_DELAYS = (0.1, 0.5, 1, 2, 5, 10, 30)
+
+    def __init__(self, host: str, port: int, executor: ThreadPoolExecutor):
+        '''Initialize the connection, which is established on the first subscription.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            executor (ThreadPoolExecutor): the executor delivering the frames'''
+        self._host = host
+        self._port = port
+        self._executor = executor
+        self._connection : Optional[stomp.Connection] = None
+        self._subscriptions : Dict[str, _StompSubscription] = {}
+        self._next_subscription_id = 0
+        self._closed = False
+        self._reconnecting = False
+        # Guards the connection and the subscriptions
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"host={self._host}, port={self._port}, subscriptions={len(self._subscriptions)}"
+
+    def _connect(self):
+        '''Connect to the broker if not connected, renewing all the subscriptions. Must be called holding the lock.'''
+        if self._connection is not None and self._connection.is_connected():
+            return
+        if self._connection is None:
+            # the bodies are kept as bytes, since the compressed ones are binary, see wire_format.compress_body
+            self._connection = stomp.Connection(host_and_ports=[(self._host, self._port)], heartbeats=(60000, 60000),
+                                                auto_decode=False)
+            self._connection.set_listener('WiseAgentStompConnection', self)
+        self._connection.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
+        for subscription in self._subscriptions.values():
+            self._connection.subscribe(destination=subscription.destination, id=subscription.id, ack=subscription.ack,
+                                       headers=subscription.headers)
+
+    def subscribe(self, destination: str, listener: stomp.ConnectionListener, ack: str = 'auto',
+                  headers: Optional[Dict[str, str]] = None) -> str:
+        '''
+        Subscribe to a destination.
+
+        Args:
+            destination (str): the destination
+            listener (stomp.ConnectionListener): the listener whose on_message is called with the frames received
+            from the destination, returning False to have a frame delivered again once it calls resume, and whose
+            on_error is called with the error frames sent by the broker
+            ack (str): the ack mode of the subscription, auto, client or client-individual
+            headers (Optional[Dict[str, str]]): additional headers of the subscription, e.g. to limit the number
+            of messages the broker sends before they are acknowledged
+
+        Returns:
+            str: the id of the subscription
+        '''
+        with self._lock:
+            self._closed = False
+            self._next_subscription_id += 1
+            subscription = _StompSubscription(str(self._next_subscription_id), destination, listener, ack,
+                                              headers or {})
+            self._subscriptions[subscription.id] = subscription
+            if self._connection is not None and self._connection.is_connected():
+                self._connection.subscribe(destination=destination, id=subscription.id, ack=ack,
+                                           headers=subscription.headers)
+            else:
+                self._connect()
+            return subscription.id
+
+    def unsubscribe(self, subscription_id: str) -> int:
+        '''
+        Remove a subscription.
+
+        Args:
+            subscription_id (str): the id returned by subscribe
+
+        Returns:
+            int: the number of subscriptions left
+        '''
+        with self._lock:
+            if self._subscriptions.pop(subscription_id, None) is not None and \
+                    self._connection is not None and self._connection.is_connected():
+                self._connection.unsubscribe(id=subscription_id)
+            return len(self._subscriptions)
+
+    def send(self, destination: str, body: Union[str, bytes], content_type: Optional[str] = None,
+             headers: Optional[Dict[str, str]] = None):
+        '''Send a message to a destination, reconnecting first if the connection was lost.
+
+        Args:
+            destination (str): the destination
+            body (Union[str, bytes]): the body of the message
+            content_type (Optional[str]): the content type of the body
+            headers (Optional[Dict[str, str]]): additional headers of the message'''
+        with self._lock:
+            self._connect()
+            connection = self._connection
+        connection.send(body=body, destination=destination, content_type=content_type, headers=headers)
+
+    def ack(self, frame: stomp.utils.Frame):
+        '''Acknowledge a message received from a subscription with the client or client-individual ack mode.
+        If the connection was lost since the message was received, the broker delivers the message again.
+
+        Args:
+            frame (stomp.utils.Frame): the frame of the message'''
+        self._acknowledge(frame, True)
+
+    def nack(self, frame: stomp.utils.Frame):
+        '''Reject a message received from a subscription with the client or client-individual ack mode, so that
+        the broker delivers it again or moves it to its dead letter queue.
+
+        Args:
+            frame (stomp.utils.Frame): the frame of the message'''
+        self._acknowledge(frame, False)
+
+    def _acknowledge(self, frame: stomp.utils.Frame, ack: bool):
+        with self._lock:
+            if self._connection is None or not self._connection.is_connected():
+                logging.getLogger(__name__).warning(f"Not connected to {self._host}:{self._port}, message "
+                                                    f"{frame.headers.get('message-id')} will be delivered again")
+                return
+            if ack:
+                self._connection.ack(frame.headers.get('message-id'), frame.headers.get('subscription'))
+            else:
+                self._connection.nack(frame.headers.get('message-id'), frame.headers.get('subscription'))
+
+    def close(self):
+        '''Disconnect from the broker, without reconnecting.'''
+        with self._lock:
+            self._closed = True
+            self._subscriptions.clear()
+            if self._connection is not None and self._connection.is_connected():
+                self._connection.disconnect()
+            self._connection = None
+
+    def on_message(self, frame: stomp.utils.Frame):
+        '''Dispatch a frame to the listener of its subscription.'''
+        subscription = self._subscriptions.get(frame.headers.get('subscription'))
+        if subscription is None:
+            # the broker may not echo the subscription id, fall back to the destination
+            destination = frame.headers.get('destination')
+            subscription = next((s for s in list(self._subscriptions.values()) if s.destination == destination), None)
+        if subscription is None:
+            logging.getLogger(__name__).warning(f"Dropping a message for {frame.headers.get('destination')}, "
+                                                f"which has no subscription")
+            return
+        with subscription.lock:
+            subscription.frames.append(frame)
+            if subscription.delivering or subscription.paused:
+                return
+            subscription.delivering = True
+        self._executor.submit(self._deliver, subscription)
+
+    def resume(self, listener: stomp.ConnectionListener):
+        '''Deliver again the frames declined by a listener, see subscribe.
+
+        Args:
+            listener (stomp.ConnectionListener): the listener'''
+        for subscription in list(self._subscriptions.values()):
+            if subscription.listener is not listener:
+                continue
+            with subscription.lock:
+                if subscription.delivering:
+                    # the frame being delivered is declined after the listener made room for it, deliver it again
+                    subscription.resumed = True
+                    continue
+                if not subscription.paused:
+                    continue
+                subscription.paused = False
+                subscription.delivering = True
+            self._executor.submit(self._deliver, subscription)
+
+    def _deliver(self, subscription: _StompSubscription):
+        '''Deliver the frames of a subscription until none is left or the listener declines one.'''
+        while True:
+            with subscription.lock:
+                if not subscription.frames:
+                    subscription.delivering = False
+                    return
+                frame = subscription.frames[0]
+                subscription.resumed = False
+            try:
+                accepted = subscription.listener.on_message(frame) is not False
+            except Exception:
+                accepted = True
+                logging.getLogger(__name__).exception(f"Error delivering a message from {subscription.destination}")
+            with subscription.lock:
+                if accepted:
+                    subscription.frames.popleft()
+                elif not subscription.resumed:
+                    subscription.paused = True
+                    subscription.delivering = False
+                    return
+
+    def on_error(self, frame: stomp.utils.Frame):
+        '''Notify the error sent by the broker to the listeners of all the subscriptions.'''
+        listeners = {id(s.listener): s.listener for s in list(self._subscriptions.values())}
+        for listener in listeners.values():
+            listener.on_error(frame)
+
+    def on_disconnected(self):
+        '''Reconnect in the background unless the connection was closed.'''
+        with self._lock:
+            if self._closed or self._reconnecting:
+                return
+            self._reconnecting = True
+        threading.Thread(target=self._reconnect, name=f"WiseAgentStompReconnect-{self._host}:{self._port}",
+                         daemon=True).start()
+
+    def _reconnect(self):
+        '''Try to reconnect, with increasing delays, until connected or closed.'''
+        attempt = 0
+        try:
+            while True:
+                time.sleep(self.RECONNECT_DELAYS[min(attempt, len(self.RECONNECT_DELAYS) - 1)])
+                with self._lock:
+                    if self._closed:
+                        return
+                    try:
+                        self._connect()
+                        logging.getLogger(__name__).info(f"Reconnected to {self._host}:{self._port}")
+                        return
+                    except Exception as e:
+                        logging.getLogger(__name__).warning(f"Reconnection to {self._host}:{self._port} failed: {e}")
+                attempt += 1
+        finally:
+            with self._lock:
+                self._reconnecting = False
+
+
+class WiseAgentStompConnectionManager:
+    """
+    Process wide manager of the STOMP connections shared by the transports of all the agents: there is a single
+    connection for each broker, whatever the number of agents, and a single pool of threads delivering the
+    messages received. The connection to a broker is closed once all the subscriptions made through it are removed.
+    """
+    connections : Dict[Tuple[str, int], WiseAgentStompConnection] = {}
+    executor : Optional[ThreadPoolExecutor] = None
+    lock : threading.Lock = threading.Lock()
+
+    # The maximum number of threads delivering the messages received, i.e. of messages handled at the same time
+    MAX_DELIVERY_THREADS = 64
+
+    @classmethod
+    def _get_connection(cls, host: str, port: int) -> WiseAgentStompConnection:
+        '''Get the connection to the given broker, creating it if needed. Must be called holding the lock.'''
+        connection = cls.connections.get((host, port))
+        if connection is None:
+            if cls.executor is None:
+                cls.executor = ThreadPoolExecutor(max_workers=cls.MAX_DELIVERY_THREADS,
+                                                  thread_name_prefix="WiseAgentStompDelivery")
+            connection = WiseAgentStompConnection(host, port, cls.executor)
+            cls.connections[(host, port)] = connection
+        return connection
+
+    @classmethod
+    def subscribe(cls, host: str, port: int, destination: str, listener: stomp.ConnectionListener, ack: str = 'auto',
+                  headers: Optional[Dict[str, str]] = None) -> str:
+        """
+        Subscribe to a destination of the given broker, through the connection shared with the other agents.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            destination (str): the destination
+            listener (stomp.ConnectionListener): the listener of the frames received from the destination
+            ack (str): the ack mode of the subscription, auto, client or client-individual
+            headers (Optional[Dict[str, str]]): additional headers of the subscription
+
+        Returns:
+            str: the id of the subscription
+        """
+        with cls.lock:
+            return cls._get_connection(host, port).subscribe(destination, listener, ack, headers)
+
+    @classmethod
+    def ack(cls, host: str, port: int, frame: stomp.utils.Frame, ack: bool = True):
+        """
+        Acknowledge, or reject, a message received from the given broker, see WiseAgentStompConnection.ack and
+        WiseAgentStompConnection.nack.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            frame (stomp.utils.Frame): the frame of the message
+            ack (bool): True to acknowledge the message, False to reject it
+        """
+        connection = cls.connections.get((host, port))
+        if connection is None:
+            return
+        if ack:
+            connection.ack(frame)
+        else:
+            connection.nack(frame)
+
+    @classmethod
+    def resume(cls, host: str, port: int, listener: stomp.ConnectionListener):
+        """
+        Deliver again the frames declined by a listener of the given broker, see WiseAgentStompConnection.resume.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            listener (stomp.ConnectionListener): the listener
+        """
+        connection = cls.connections.get((host, port))
+        if connection is not None:
+            connection.resume(listener)
+
+    @classmethod
+    def unsubscribe(cls, host: str, port: int, subscription_id: str):
+        """
+        Remove a subscription, closing the connection to the broker if it was the last one.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            subscription_id (str): the id returned by subscribe
+        """
+        with cls.lock:
+            connection = cls.connections.get((host, port))
+            if connection is not None and connection.unsubscribe(subscription_id) == 0:
+                connection.close()
+                del cls.connections[(host, port)]
+
+    @classmethod
+    def send(cls, host: str, port: int, destination: str, body: Union[str, bytes], content_type: Optional[str] = None,
+             headers: Optional[Dict[str, str]] = None):
+        """
+        Send a message to a destination of the given broker, through the connection shared with the other agents.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            destination (str): the destination
+            body (Union[str, bytes]): the body of the message
+            content_type (Optional[str]): the content type of the body
+            headers (Optional[Dict[str, str]]): additional headers of the message
+        """
+        with cls.lock:
+            connection = cls._get_connection(host, port)
+        connection.send(destination, body, content_type, headers)
+
+    @classmethod
+    def close(cls):
+        """
+        Close all the connections. New connections are created on the next subscription or message sent.
+        """
+        with cls.lock:
+            for connection in cls.connections.values():
+                connection.close()
+            cls.connections = {}
@@ -0,0 +1,158 @@
+import json
+import zlib
+from typing import Any, Dict, Optional, Tuple, Union
+
+import yaml
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+
+# The version of the JSON wire format. Fields may be added without changing it, decoders ignore the fields they
+# don't know, while removing or changing the meaning of a field requires a new version.
+WIRE_FORMAT_VERSION = 1
+
+JSON_CONTENT_TYPE = f"application/vnd.wiseagents.message+json;v={WIRE_FORMAT_VERSION}"
+# The content type of the messages dumped with yaml.dump, as sent by the agents predating the JSON wire format,
+# which don't set any content type
+YAML_CONTENT_TYPE = "application/x-yaml"
+
+JSON_WIRE_FORMAT = "json"
+YAML_WIRE_FORMAT = "yaml"
+
+# The header of the frames whose body is compressed, set to the compression algorithm
+CONTENT_ENCODING_HEADER = "wiseagents-content-encoding"
+ZLIB_COMPRESSION = "zlib"
+# Requires the zstandard package, on the agents sending and on the agents receiving the messages
+ZSTD_COMPRESSION = "zstd"
+# The size, in bytes, above which the bodies are compressed by default. Smaller bodies don't gain enough to pay for
+# the compression, and most messages exchanged by the agents are much smaller
+DEFAULT_COMPRESSION_THRESHOLD = 16 * 1024
+
+# The WiseAgentMessage attributes sent on the wire, by the key used in the JSON wire format
+_FIELDS = {"message": "_message", "context_name": "_context_name", "sender": "_sender",
+           "message_type": "_message_type", "tool_id": "_tool_id", "route_response_to": "_route_response_to"}
+
+
+class _LegacyMessageLoader(yaml.SafeLoader):
+    '''A safe YAML loader which only constructs WiseAgentMessage objects, on top of the standard YAML types.'''
+
+
+def _construct_legacy_message(loader: _LegacyMessageLoader, node: yaml.MappingNode) -> WiseAgentMessage:
+    state = {key: None for key in _FIELDS.values()}
+    state.update(loader.construct_mapping(node))
+    message = WiseAgentMessage.__new__(WiseAgentMessage)
+    message.__setstate__(state)
+    return message
+
+
+_LegacyMessageLoader.add_constructor(WiseAgentMessage.yaml_tag, _construct_legacy_message)
+
+
+def encode_message(message: WiseAgentMessage, wire_format: str = JSON_WIRE_FORMAT) -> Tuple[str, str]:
+    """
+    Encode a message to be sent by a transport.
+
+    Args:
+        message (WiseAgentMessage): the message to encode
+        wire_format (str): json, the default, or yaml to send the messages to agents predating the JSON wire format
+
+    Returns:
+        Tuple[str, str]: the encoded message and its content type
+    """
+    if wire_format == YAML_WIRE_FORMAT:
+        return yaml.dump(message), YAML_CONTENT_TYPE
+    if wire_format != JSON_WIRE_FORMAT:
+        raise ValueError(f"Unknown wire format {wire_format}")
+    payload : Dict[str, Any] = {"v": WIRE_FORMAT_VERSION}
+    state = message.__getstate__()
+    for key, attribute in _FIELDS.items():
+        value = state.get(attribute)
+        if value is not None:
+            payload[key] = value.value if isinstance(value, WiseAgentMessageType) else value
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False), JSON_CONTENT_TYPE
+
+
+def decode_message(body: Union[str, bytes], content_type: Optional[str] = None) -> WiseAgentMessage:
+    """
+    Decode a message received by a transport. The messages without content type are decoded as the YAML sent by
+    the agents predating the JSON wire format, with a safe loader which can't construct arbitrary objects.
+
+    Args:
+        body (Union[str, bytes]): the encoded message
+        content_type (Optional[str]): the content type of the message
+
+    Returns:
+        WiseAgentMessage: the decoded message
+    """
+    if content_type is None or content_type == YAML_CONTENT_TYPE:
+        message = yaml.load(body, _LegacyMessageLoader)
+        if not isinstance(message, WiseAgentMessage):
+            raise ValueError(f"The YAML body is not a WiseAgentMessage: {body!r}")
+        return message
+    if not content_type.startswith("application/vnd.wiseagents.message+json"):
+        raise ValueError(f"Unsupported content type {content_type}")
+    payload = json.loads(body)
+    message = WiseAgentMessage.__new__(WiseAgentMessage)
+    message.__setstate__({attribute: payload.get(key) for key, attribute in _FIELDS.items()})
+    return message
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("The zstd compression requires the zstandard package, install it with "
+                          "'pip install zstandard'") from e
+    return zstandard
+
+
+def compress_body(body: Union[str, bytes], threshold: Optional[int] = DEFAULT_COMPRESSION_THRESHOLD,
+                  compression: str = ZLIB_COMPRESSION) -> Tuple[Union[str, bytes], Optional[str]]:
+    """
+    Compress the body of a message to be sent by a transport, if it is larger than the threshold and the
+    compression makes it smaller.
+
+    Args:
+        body (Union[str, bytes]): the encoded message, as returned by encode_message
+        threshold (Optional[int]): the size, in bytes, above which the body is compressed, None to never compress it
+        compression (str): zlib, the default, or zstd
+
+    Returns:
+        Tuple[Union[str, bytes], Optional[str]]: the body, compressed or not, and the compression algorithm to
+        send in the CONTENT_ENCODING_HEADER header, None if the body is not compressed
+    """
+    if compression not in (ZLIB_COMPRESSION, ZSTD_COMPRESSION):
+        raise ValueError(f"Unknown compression {compression}")
+    data = body.encode("utf-8") if isinstance(body, str) else body
+    if threshold is None or len(data) <= threshold:
+        return body, None
+    if compression == ZSTD_COMPRESSION:
+        compressed = _zstd().ZstdCompressor().compress(data)
+    else:
+        # level 6 compresses text almost as well as level 9, in about half the time
+        compressed = zlib.compress(data, 6)
+    if len(compressed) >= len(data):
+        return body, None
+    return compressed, compression
+
+
+def decompress_body(body: Union[str, bytes], content_encoding: Optional[str]) -> Union[str, bytes]:
+    """
+    Decompress the body of a message received by a transport.
+
+    Args:
+        body (Union[str, bytes]): the body of the message
+        content_encoding (Optional[str]): the value of the CONTENT_ENCODING_HEADER header, None if the body is not
+        compressed
+
+    Returns:
+        Union[str, bytes]: the body to pass to decode_message
+    """
+    if content_encoding is None:
+        return body
+    if isinstance(body, str):
+        raise ValueError(f"The body of a message compressed with {content_encoding} must be received as bytes")
+    if content_encoding == ZLIB_COMPRESSION:
+        return zlib.decompress(body)
+    if content_encoding == ZSTD_COMPRESSION:
+        return _zstd().ZstdDecompressor().decompress(body)
+    raise ValueError(f"Unsupported content encoding {content_encoding}")
@@ -0,0 +1,171 @@
+import base64
+import importlib
+import json
+import logging
+import pickle
+import threading
+from abc import abstractmethod
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from wiseagents.yaml import WiseAgentsYAMLObject
+
+_TYPE_KEY = "__wiseagents_type__"
+_STATE_KEY = "state"
+_PICKLE_KEY = "__pickle__"
+
+
+class WiseAgentCodec:
+    ''' A codec used to encode and decode the values stored by the registry and the contexts (e.g. chat
+    completion messages and agent metadata). '''
+
+    name : str = None
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        """
+        Encode the given value.
+
+        Args:
+            value (Any): the value to encode
+
+        Returns:
+            bytes: the encoded value
+        """
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        """
+        Decode the given data.
+
+        Args:
+            data (bytes): the data produced by encode
+
+        Returns:
+            Any: the decoded value
+        """
+        ...
+
+
+class PickleWiseAgentCodec(WiseAgentCodec):
+    ''' A codec using pickle. It supports any picklable value, decoded as the same type. '''
+
+    name = "pickle"
+
+    def encode(self, value: Any) -> bytes:
+        '''Encode the given value with pickle.'''
+        return pickle.dumps(value)
+
+    def decode(self, data: bytes) -> Any:
+        '''Decode the given data with pickle.'''
+        return pickle.loads(data)
+
+
+class _StructuredWiseAgentCodec(WiseAgentCodec):
+    '''
+    Base class of the codecs storing values as plain structures (dicts, lists, strings, numbers, booleans and None).
+
+    Pydantic models, such as the ChatCompletionMessage returned by the LLMs, are stored as dicts, which the
+    OpenAI API accepts as chat completion messages. WiseAgentsYAMLObject instances, such as WiseAgentMetaData,
+    are stored along with their class and decoded as instances of the same class. Any other value is pickled.
+    '''
+
+    def _to_structure(self, value: Any) -> Any:
+        '''Convert a value which isn't a plain structure.'''
+        if isinstance(value, BaseModel):
+            return value.model_dump(mode="json", exclude_none=True)
+        if isinstance(value, WiseAgentsYAMLObject):
+            return {_TYPE_KEY: f"{value.__class__.__module__}.{value.__class__.__qualname__}",
+                    _STATE_KEY: value.__getstate__()}
+        logging.debug(f"Pickling value of type {type(value)} with the {self.name} codec")
+        return {_PICKLE_KEY: base64.b64encode(pickle.dumps(value)).decode("ascii")}
+
+    def _from_structure(self, value: Dict) -> Any:
+        '''Convert back a dict produced by _to_structure.'''
+        if _TYPE_KEY in value:
+            module_name, _, class_name = value[_TYPE_KEY].rpartition(".")
+            cls = getattr(importlib.import_module(module_name), class_name)
+            if not (isinstance(cls, type) and issubclass(cls, WiseAgentsYAMLObject)):
+                raise TypeError(f"{value[_TYPE_KEY]} is not a WiseAgentsYAMLObject")
+            obj = cls.__new__(cls)
+            obj.__setstate__(value[_STATE_KEY])
+            return obj
+        if _PICKLE_KEY in value:
+            return pickle.loads(base64.b64decode(value[_PICKLE_KEY]))
+        return value
+
+
+class JSONWiseAgentCodec(_StructuredWiseAgentCodec):
+    ''' A codec storing values as compact JSON. Values previously stored with pickle are still decoded. '''
+
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        '''Encode the given value as compact JSON.'''
+        return json.dumps(value, default=self._to_structure, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        '''Decode the given JSON data.'''
+        if data[:1] == b"\x80":
+            # pickle protocol marker, the value was stored before switching codec
+            return pickle.loads(data)
+        return json.loads(data, object_hook=self._from_structure)
+
+
+class MsgpackWiseAgentCodec(_StructuredWiseAgentCodec):
+    ''' A codec storing values with MessagePack. Requires the msgpack package. '''
+
+    name = "msgpack"
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError("The msgpack codec requires the msgpack package, install it with 'pip install msgpack'") from e
+        self._msgpack = msgpack
+
+    def encode(self, value: Any) -> bytes:
+        '''Encode the given value with MessagePack.'''
+        return self._msgpack.packb(value, default=self._to_structure, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        '''Decode the given MessagePack data.'''
+        return self._msgpack.unpackb(data, object_hook=self._from_structure, raw=False, strict_map_key=False)
+
+
+_codec_classes : Dict[str, type] = {codec.name: codec for codec in
+                                    (PickleWiseAgentCodec, JSONWiseAgentCodec, MsgpackWiseAgentCodec)}
+_codecs : Dict[str, WiseAgentCodec] = {}
+_codecs_lock = threading.Lock()
+
+
+def register_codec(codec_class: type):
+    """
+    Register a codec class, making it selectable by name with the serializer key of registry_config.yaml.
+
+    Args:
+        codec_class (type): the WiseAgentCodec subclass, whose name attribute is used as the codec name
+    """
+    _codec_classes[codec_class.name] = codec_class
+
+
+def get_codec(name: Optional[str] = None) -> WiseAgentCodec:
+    """
+    Get the codec with the given name.
+
+    Args:
+        name (Optional[str]): the name of the codec, defaults to pickle
+
+    Returns:
+        WiseAgentCodec: the codec, shared by all the callers in the process
+    """
+    name = name or PickleWiseAgentCodec.name
+    codec = _codecs.get(name)
+    if codec is None:
+        with _codecs_lock:
+            if name not in _codec_classes:
+                raise ValueError(f"Unknown serializer {name}, available serializers are {list(_codec_classes.keys())}")
+            codec = _codecs.setdefault(name, _codec_classes[name]())
+    return codec
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class WiseAgentDispatcher():
+    '''
+    A pool of worker threads handling the messages received by an agent. The messages of the same context are
+    handled one at a time, in the order they were submitted, while the messages of different contexts are handled
+    in parallel by up to workers threads. A context waiting for one of its messages to be handled doesn't hold up
+    the others: the workers take the oldest message of the contexts which have no message being handled.
+
+    The number of messages waiting to be handled is bounded by max_queue_size: once reached, submit blocks until
+    a message is taken by a worker, pushing back on the thread receiving the messages, while try_submit returns
+    False and notifies its caller once there is room, so that threads shared with other agents are not held.
+    '''
+
+    DEFAULT_WORKERS = 1
+    DEFAULT_MAX_QUEUE_SIZE = 100
+
+    def __init__(self, name: str, workers: int = DEFAULT_WORKERS, max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        '''Initialize the dispatcher, whose workers are started by the first message submitted.
+
+        Args:
+            name (str): the name of the dispatcher, used to name its threads
+            workers (int): the number of messages handled at the same time
+            max_queue_size (int): the maximum number of messages waiting to be handled'''
+        if workers < 1 or max_queue_size < 1:
+            raise ValueError(f"The number of workers ({workers}) and the queue size ({max_queue_size}) must be positive")
+        self._name = name
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # The messages waiting to be handled, by key, as (submission time, handler, args)
+        self._pending : Dict[Hashable, Deque[Tuple[float, Callable, Tuple]]] = {}
+        # The keys with messages waiting to be handled and no message being handled, in submission order
+        self._ready : Deque[Hashable] = deque()
+        # The keys with a message being handled
+        self._active : Set[Hashable] = set()
+        # The call backs of try_submit to call once a message is taken by a worker
+        self._on_available : List[Callable[[], None]] = []
+        self._queue_depth = 0
+        self._threads : List[threading.Thread] = []
+        self._running = True
+        self._handled_count = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._peak_queue_depth = 0
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(name={self._name}, workers={self._workers}, max_queue_size={self._max_queue_size})"
+
+    def submit(self, key: Hashable, handler: Callable, *args: Any):
+        '''
+        Submit a message to be handled, blocking while max_queue_size messages are already waiting.
+
+        Args:
+            key (Hashable): the key ordering the messages, usually the name of their context
+            handler (Callable): the function handling the message
+            args (Any): the arguments of handler
+        '''
+        with self._lock:
+            if not self._running:
+                raise RuntimeError(f"Dispatcher {self._name} is stopped")
+            while self._queue_depth >= self._max_queue_size:
+                self._not_full.wait()
+            self._enqueue(key, handler, args)
+
+    def try_submit(self, key: Hashable, handler: Callable, *args: Any,
+                   on_available: Optional[Callable[[], None]] = None) -> bool:
+        '''
+        Submit a message to be handled unless max_queue_size messages are already waiting, without blocking.
+
+        Args:
+            key (Hashable): the key ordering the messages, usually the name of their context
+            handler (Callable): the function handling the message
+            args (Any): the arguments of handler
+            on_available (Optional[Callable[[], None]]): the function called, once, when a message is taken by a
+            worker after the message was refused, to submit it again
+
+        Returns:
+            bool: True if the message was submitted, False if the queue is full
+        '''
+        with self._lock:
+            if not self._running:
+                raise RuntimeError(f"Dispatcher {self._name} is stopped")
+            if self._queue_depth >= self._max_queue_size:
+                if on_available is not None:
+                    self._on_available.append(on_available)
+                return False
+            self._enqueue(key, handler, args)
+            return True
+
+    def _enqueue(self, key: Hashable, handler: Callable, args: Tuple):
+        '''Queue a message, starting the workers if needed. Must be called holding the lock.'''
+        if len(self._threads) < self._workers:
+            self._start_workers()
+        pending = self._pending.setdefault(key, deque())
+        pending.append((time.monotonic(), handler, args))
+        if len(pending) == 1 and key not in self._active:
+            self._ready.append(key)
+        self._queue_depth += 1
+        self._peak_queue_depth = max(self._peak_queue_depth, self._queue_depth)
+        self._not_empty.notify()
+
+    def _start_workers(self):
+        '''Start the worker threads. Must be called holding the lock.'''
+        for i in range(len(self._threads), self._workers):
+            thread = threading.Thread(target=self._work, name=f"WiseAgentDispatcher-{self._name}-{i}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        '''Handle the messages until the dispatcher is stopped.'''
+        while True:
+            with self._lock:
+                while not self._ready and self._running:
+                    self._not_empty.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                submitted_at, handler, args = self._pending[key].popleft()
+                self._active.add(key)
+                self._queue_depth -= 1
+                wait_time = time.monotonic() - submitted_at
+                self._handled_count += 1
+                self._total_wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+                self._not_full.notify()
+                on_available, self._on_available = self._on_available, []
+            for call_back in on_available:
+                try:
+                    call_back()
+                except Exception:
+                    logging.getLogger(__name__).exception(f"Error notifying the room in dispatcher {self._name}")
+            try:
+                handler(*args)
+            except Exception:
+                logging.getLogger(__name__).exception(f"Error handling a message of {key} in dispatcher {self._name}")
+            finally:
+                with self._lock:
+                    self._active.discard(key)
+                    if self._pending[key]:
+                        self._ready.append(key)
+                        self._not_empty.notify()
+                    else:
+                        del self._pending[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        '''
+        Get the metrics of the dispatcher.
+
+        Returns:
+            Dict[str, Any]: the number of workers, the number of messages being handled, the number of messages
+            waiting to be handled (queue_depth), its highest value and its maximum, the number of messages handled
+            and the average and maximum time, in seconds, the messages waited before being handled
+        '''
+        with self._lock:
+            return {"workers": self._workers,
+                    "busy_workers": len(self._active),
+                    "queue_depth": self._queue_depth,
+                    "peak_queue_depth": self._peak_queue_depth,
+                    "max_queue_size": self._max_queue_size,
+                    "handled_count": self._handled_count,
+                    "average_wait_time": self._total_wait_time / self._handled_count if self._handled_count else 0.0,
+                    "max_wait_time": self._max_wait_time}
+
+    def stop(self, timeout: float = None):
+        '''
+        Stop the dispatcher once the messages already submitted are handled.
+
+        Args:
+            timeout (float): the maximum number of seconds to wait for each worker to stop, None to wait until
+            they stop
+        '''
+        with self._lock:
+            self._running = False
+            self._not_empty.notify_all()
+            threads = list(self._threads)
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
@@ -0,0 +1,179 @@
+import logging
+from typing import Any, List, Optional
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from wiseagents.yaml import WiseAgentsYAMLObject
+
+
+class WiseAgentHistoryPolicy(WiseAgentsYAMLObject):
+    '''
+    A WiseAgentHistoryPolicy selects the part of a conversation history which is passed to an LLM, so that the
+    size of the prompts, and hence the latency and cost of the LLM calls, don't grow with the length of the chat.
+
+    The policy keeps the most recent messages of the history, optionally pinning the first system message and
+    the first user message, which usually carry the instructions and the original request. The most recent
+    messages are limited to max_messages and/or, together with the pinned messages, to max_tokens tokens.
+    Tokens are counted with tiktoken if it is installed, and estimated as 4 characters per token otherwise.
+    '''
+    yaml_tag = u'!wiseagents.WiseAgentHistoryPolicy'
+
+    CHARS_PER_TOKEN = 4
+    # The tokens used by the role and the separators of each message
+    TOKENS_PER_MESSAGE = 4
+
+    def __new__(cls, *args, **kwargs):
+        '''Create a new instance of the class, setting default values for the instance variables.'''
+        obj = super().__new__(cls)
+        obj._max_messages = None
+        obj._max_tokens = None
+        obj._pin_system_message = False
+        obj._pin_first_user_message = False
+        obj._encoding = "cl100k_base"
+        obj._tokenizer = None
+        return obj
+
+    def __init__(self, max_messages: Optional[int] = None, max_tokens: Optional[int] = None,
+                 pin_system_message: bool = False, pin_first_user_message: bool = False,
+                 encoding: str = "cl100k_base"):
+        '''
+        Initialize the policy.
+
+        Args:
+            max_messages (Optional[int]): the maximum number of recent messages to keep, not counting the pinned ones
+            max_tokens (Optional[int]): the maximum number of tokens of the selected history, including the pinned messages
+            pin_system_message (bool): whether to always keep the first system message
+            pin_first_user_message (bool): whether to always keep the first user message
+            encoding (str): the tiktoken encoding used to count the tokens, defaults to cl100k_base
+        '''
+        super().__init__()
+        self._max_messages = max_messages
+        self._max_tokens = max_tokens
+        self._pin_system_message = pin_system_message
+        self._pin_first_user_message = pin_first_user_message
+        self._encoding = encoding
+
+    def __repr__(self):
+        '''Return a string representation of the policy.'''
+        return (f"{self.__class__.__name__}(max_messages={self.max_messages}, max_tokens={self.max_tokens}, "
+                f"pin_system_message={self.pin_system_message}, pin_first_user_message={self.pin_first_user_message}, "
+                f"encoding={self.encoding})")
+
+    def __eq__(self, value: object) -> bool:
+        return isinstance(value, WiseAgentHistoryPolicy) and self.__repr__() == value.__repr__()
+
+    def __getstate__(self) -> object:
+        '''Return the state of the policy. Removing the instance variable tokenizer to avoid it is serialized.'''
+        state = super().__getstate__()
+        if 'tokenizer' in state.keys():
+            del state['tokenizer']
+        return state
+
+    @property
+    def max_messages(self) -> Optional[int]:
+        '''Get the maximum number of recent messages to keep.'''
+        return self._max_messages
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        '''Get the maximum number of tokens of the selected history.'''
+        return self._max_tokens
+
+    @property
+    def pin_system_message(self) -> bool:
+        '''Get whether the first system message is always kept.'''
+        return self._pin_system_message
+
+    @property
+    def pin_first_user_message(self) -> bool:
+        '''Get whether the first user message is always kept.'''
+        return self._pin_first_user_message
+
+    @property
+    def encoding(self) -> str:
+        '''Get the tiktoken encoding used to count the tokens.'''
+        return self._encoding
+
+    def apply(self, messages: List[ChatCompletionMessageParam]) -> List[ChatCompletionMessageParam]:
+        '''
+        Select the messages of the given history to pass to the LLM.
+
+        Args:
+            messages (List[ChatCompletionMessageParam]): the whole conversation history, oldest message first
+
+        Returns:
+            List[ChatCompletionMessageParam]: a new list with the pinned messages followed by the most recent
+            messages allowed by the policy, in their original order
+        '''
+        pinned_indexes = self._pinned_indexes(messages)
+        pinned = [messages[i] for i in sorted(pinned_indexes)]
+        recent = [message for i, message in enumerate(messages) if i not in pinned_indexes]
+        if self.max_messages is not None:
+            recent = recent[-self.max_messages:] if self.max_messages > 0 else []
+        if self.max_tokens is not None:
+            budget = self.max_tokens - sum(self.count_tokens(message) for message in pinned)
+            start = len(recent)
+            while start > 0:
+                budget -= self.count_tokens(recent[start - 1])
+                if budget < 0:
+                    break
+                start -= 1
+            recent = recent[start:]
+        # a tool message can't be sent without the assistant message requesting the tool call
+        while recent and _get(recent[0], "role") == "tool":
+            recent = recent[1:]
+        if len(pinned) + len(recent) < len(messages):
+            logging.debug(f"History policy {self} kept {len(pinned) + len(recent)} of {len(messages)} messages")
+        return pinned + recent
+
+    def count_tokens(self, message: ChatCompletionMessageParam) -> int:
+        '''
+        Count the tokens of the given message.
+
+        Args:
+            message (ChatCompletionMessageParam): the message
+
+        Returns:
+            int: the number of tokens of the content and the tool calls of the message
+        '''
+        text = _get(message, "content") or ""
+        if not isinstance(text, str):
+            # content parts
+            text = " ".join(str(_get(part, "text") or "") for part in text)
+        for tool_call in _get(message, "tool_calls") or []:
+            function = _get(tool_call, "function")
+            text += f"{_get(function, 'name')}{_get(function, 'arguments')}"
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return self.TOKENS_PER_MESSAGE + len(text) // self.CHARS_PER_TOKEN
+        return self.TOKENS_PER_MESSAGE + len(tokenizer.encode(text, disallowed_special=()))
+
+    def _get_tokenizer(self):
+        '''Get the tiktoken encoding, or None if tiktoken isn't installed.'''
+        if getattr(self, "_tokenizer", None) is None:
+            try:
+                import tiktoken
+                self._tokenizer = tiktoken.get_encoding(self.encoding)
+            except ImportError:
+                self._tokenizer = False
+            except Exception as e:
+                logging.warning(f"Unable to load the tiktoken encoding {self.encoding}, estimating the tokens: {e}")
+                self._tokenizer = False
+        return self._tokenizer or None
+
+    def _pinned_indexes(self, messages: List[ChatCompletionMessageParam]) -> set:
+        '''Get the indexes of the pinned messages of the given history.'''
+        pinned = set()
+        for role, pin in (("system", self.pin_system_message), ("user", self.pin_first_user_message)):
+            if pin:
+                index = next((i for i, message in enumerate(messages) if _get(message, "role") == role), None)
+                if index is not None:
+                    pinned.add(index)
+        return pinned
+
+
+def _get(value: Any, key: str) -> Any:
+    '''Get the given key from a message, which is either a dict or a pydantic model returned by the LLM.'''
+    if isinstance(value, dict):
+        return value.get(key)
+    return getattr(value, key, None)
@@ -1,12 +1,14 @@
 import logging
+import threading
 from abc import *
 from enum import StrEnum
-from typing import Callable, Optional
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 import yaml
 from yaml import YAMLObject
 from wiseagents.yaml import WiseAgentsYAMLObject
 from wiseagents import enforce_no_abstract_class_instances
+from wiseagents.wise_agent_dispatcher import WiseAgentDispatcher
 from yaml.resolver import BaseResolver
 
 
@@ -31,6 +33,10 @@ def wiseAgentMessageType_representer(dumper, data):
 class WiseAgentMessage(YAMLObject):
     ''' A message that can be sent between agents. '''
     yaml_tag = u'!wiseagents.WiseAgentMessage'
+    # Loads the message contents on first access, for the messages whose contents were left in a claim check
+    # store by the transport which received them
+    _message_loader : Optional[Callable[[], str]] = None
+
     def __init__(self, message: str, context_name: str, sender: Optional[str] = None, message_type: Optional[WiseAgentMessageType] = None, 
                  tool_id : Optional[str] = None,
                  route_response_to: Optional[str] = None):
@@ -52,6 +58,13 @@ class WiseAgentMessage(YAMLObject):
         self._context_name = context_name
         self.__class__.yaml_dumper.add_representer(WiseAgentMessageType, wiseAgentMessageType_representer)
         
+    def __getstate__(self):
+        '''Return the state of the message, loading its contents if needed.'''
+        state = self.__dict__.copy()
+        state["_message"] = self.message
+        state.pop("_message_loader", None)
+        return state
+
     def __setstate__(self, state):
         self._message = state["_message"]
         self._sender =  state["_sender"]
@@ -76,8 +89,19 @@ class WiseAgentMessage(YAMLObject):
     @property
     def message(self) -> str:
         """Get the message contents (a natural language string)."""
+        if self._message_loader is not None:
+            self._message = self._message_loader()
+            self._message_loader = None
         return self._message
 
+    def set_message_loader(self, loader: Callable[[], str]):
+        '''Set the function loading the message contents the first time they are accessed.
+
+        Args:
+            loader (Callable[[], str]): the function returning the message contents
+        '''
+        self._message_loader = loader
+
     @property
     def sender(self) -> str:
         """Get the sender of the message (or None if the sender was not specified)."""
@@ -107,6 +131,13 @@ class WiseAgentMessage(YAMLObject):
         return self._route_response_to
 
 class WiseAgentTransport(WiseAgentsYAMLObject):
+
+    # The number of messages handled at the same time and the maximum number of messages waiting to be handled
+    # by the dispatcher of the transport, see WiseAgentDispatcher
+    _workers : int = WiseAgentDispatcher.DEFAULT_WORKERS
+    _max_queue_size : int = WiseAgentDispatcher.DEFAULT_MAX_QUEUE_SIZE
+    _dispatcher : Optional[WiseAgentDispatcher] = None
+    _dispatcher_lock = threading.Lock()
     
     def __init__(self):
         enforce_no_abstract_class_instances(self.__class__, WiseAgentTransport)
@@ -136,8 +167,69 @@ class WiseAgentTransport(WiseAgentsYAMLObject):
         del state['response_receiver']
         del state['event_receiver']
         del state['error_receiver']
+        state.pop('dispatcher', None)
         return state
 
+    def dispatch(self, receiver: Callable[[WiseAgentMessage], Any], message: WiseAgentMessage):
+        '''Hand a message received by the transport to the given call back, through the dispatcher of the transport.
+        The messages of the same context are handled in order, those of different contexts in parallel by up to
+        workers threads.
+
+        Args:
+            receiver (Callable[[WiseAgentMessage], Any]): the call back
+            message (WiseAgentMessage): the message received'''
+        self._get_dispatcher().submit(message.context_name, receiver, message)
+
+    def try_dispatch(self, receiver: Callable[[WiseAgentMessage], Any], message: WiseAgentMessage,
+                     on_available: Optional[Callable[[], None]] = None) -> bool:
+        '''Hand a message received by the transport to the given call back, like dispatch, without blocking when
+        max_queue_size messages are already waiting to be handled.
+
+        Args:
+            receiver (Callable[[WiseAgentMessage], Any]): the call back
+            message (WiseAgentMessage): the message received
+            on_available (Optional[Callable[[], None]]): the function called, once, when there is room for the
+            message after it was refused, see WiseAgentDispatcher.try_submit
+
+        Returns:
+            bool: True if the message was handed to the dispatcher, False if its queue is full'''
+        return self._get_dispatcher().try_submit(message.context_name, receiver, message, on_available=on_available)
+
+    def _get_dispatcher(self) -> WiseAgentDispatcher:
+        '''Get the dispatcher of the transport, creating it on the first message received.'''
+        dispatcher = self._dispatcher
+        if dispatcher is None:
+            with self._dispatcher_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = WiseAgentDispatcher(self.__class__.__name__ if getattr(self, '_agent_name', None) is None
+                                                           else self._agent_name, self.workers, self.max_queue_size)
+                dispatcher = self._dispatcher
+        return dispatcher
+
+    def stop_dispatcher(self):
+        '''Stop the dispatcher of the transport once the messages already received are handled.'''
+        with self._dispatcher_lock:
+            dispatcher = self._dispatcher
+            self._dispatcher = None
+        if dispatcher is not None:
+            dispatcher.stop()
+
+    def get_dispatcher_stats(self) -> Dict[str, Any]:
+        '''Get the metrics of the dispatcher of the transport, see WiseAgentDispatcher.get_stats, or an empty dict
+        if no message was received yet.'''
+        dispatcher = self._dispatcher
+        return dispatcher.get_stats() if dispatcher is not None else {}
+
+    @property
+    def workers(self) -> int:
+        """Get the number of messages handled at the same time."""
+        return self._workers
+
+    @property
+    def max_queue_size(self) -> int:
+        """Get the maximum number of messages waiting to be handled."""
+        return self._max_queue_size
+
        
     @abstractmethod
     def start(self):
@@ -197,3 +289,89 @@ class WiseAgentTransport(WiseAgentsYAMLObject):
     
     
     
+class AsyncWiseAgentTransport(WiseAgentsYAMLObject):
+    ''' A transport for sending messages between agents from an asyncio event loop. The call backs are coroutine
+    functions, awaited on the event loop of the transport. '''
+
+    def __init__(self):
+        enforce_no_abstract_class_instances(self.__class__, AsyncWiseAgentTransport)
+
+    def set_call_backs(self, request_receiver: Optional[Callable[[WiseAgentMessage], Awaitable]] = None,
+                 event_receiver: Optional[Callable[[WiseAgentEvent], Awaitable]] = None,
+                 error_receiver: Optional[Callable[[Any], Awaitable]] = None,
+                 response_receiver: Optional[Callable[[WiseAgentMessage], Awaitable]] = None):
+        '''Set the call back coroutine functions for the transport.
+
+        Args:
+            request_receiver Optional(Callable[[WiseAgentMessage], Awaitable]): the call back for receiving requests
+            event_receiver Optional(Callable[[WiseAgentEvent], Awaitable]): the call back for receiving events
+            error_receiver Optional(Callable[[Any], Awaitable]): the call back for receiving errors
+            response_receiver Optional(Callable[[WiseAgentMessage], Awaitable]): the call back for receiving responses
+        '''
+        self._request_receiver = request_receiver
+        self._event_receiver = event_receiver
+        self._error_receiver = error_receiver
+        self._response_receiver = response_receiver
+
+    def __getstate__(self) -> object:
+        '''Return the state of the transport. Removing the call backs to avoid they are serialized/deserialized by pyyaml.'''
+        state = super().__getstate__()
+        for key in ('request_receiver', 'response_receiver', 'event_receiver', 'error_receiver'):
+            state.pop(key, None)
+        return state
+
+    @abstractmethod
+    async def start(self):
+        """
+        Start the transport.
+        """
+        pass
+
+    @abstractmethod
+    async def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        """
+        Send a request message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name
+        """
+        pass
+
+    @abstractmethod
+    async def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+        """
+        Send a response message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name
+        """
+        pass
+
+    @abstractmethod
+    async def stop(self):
+        """
+        Stop the transport.
+        """
+        pass
+
+    @property
+    def request_receiver(self) -> Optional[Callable[[WiseAgentMessage], Awaitable]]:
+        """Get the request receiver call back."""
+        return self._request_receiver
+
+    @property
+    def event_receiver(self) -> Optional[Callable[[WiseAgentEvent], Awaitable]]:
+        """Get the event receiver call back."""
+        return self._event_receiver
+
+    @property
+    def error_receiver(self) -> Optional[Callable[[Any], Awaitable]]:
+        """Get the error receiver call back."""
+        return self._error_receiver
+
+    @property
+    def response_receiver(self) -> Optional[Callable[[WiseAgentMessage], Awaitable]]:
+        """Get the response receiver call back."""
+        return self._response_receiver
@@ -0,0 +1,134 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import redis
+
+
+class WiseAgentRedisConnectionPool(redis.BlockingConnectionPool):
+    ''' A blocking redis connection pool keeping track of how saturated it is. '''
+
+    def __init__(self, **kwargs):
+        ''' Initialize the pool, see redis.BlockingConnectionPool for the accepted arguments. '''
+        super().__init__(**kwargs)
+        self._stats_lock = threading.Lock()
+        self._in_use_count = 0
+        self._peak_in_use_count = 0
+        self._saturated_count = 0
+
+    def get_connection(self, *args, **kwargs):
+        '''Get a connection from the pool, waiting for one to be released if the pool is saturated.'''
+        with self._stats_lock:
+            if self._in_use_count >= self.max_connections:
+                self._saturated_count += 1
+        connection = super().get_connection(*args, **kwargs)
+        with self._stats_lock:
+            self._in_use_count += 1
+            self._peak_in_use_count = max(self._peak_in_use_count, self._in_use_count)
+        return connection
+
+    def release(self, connection):
+        '''Release the given connection back to the pool.'''
+        super().release(connection)
+        with self._stats_lock:
+            self._in_use_count = max(self._in_use_count - 1, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        '''
+        Get the usage statistics of the pool.
+
+        Returns:
+            Dict[str, Any]: the maximum number of connections, the number of connections currently in use,
+            the highest number of connections in use at the same time, how many times a caller had to wait
+            for a connection because all of them were in use and the ratio of connections currently in use
+        '''
+        with self._stats_lock:
+            return {"max_connections": self.max_connections,
+                    "in_use_connections": self._in_use_count,
+                    "peak_in_use_connections": self._peak_in_use_count,
+                    "saturated_count": self._saturated_count,
+                    "saturation": self._in_use_count / self.max_connections}
+
+
+class WiseAgentRedisConnectionManager:
+    """
+    Process wide manager of the redis connection pool shared by the registry and all the contexts.
+    The pool is configured from the registry configuration with the following keys:
+
+        redis_max_connections: the maximum number of connections in the pool, defaults to 50
+        redis_pool_timeout: the number of seconds to wait for a connection when the pool is saturated, defaults to 20
+        redis_socket_keepalive: whether to enable TCP keepalive on the connections, defaults to True
+        redis_health_check_interval: the number of seconds after which an idle connection is checked
+        before being used, defaults to 30
+        redis_ssl: whether to use SSL, in which case redis_username, redis_password, redis_ssl_certfile,
+        redis_ssl_keyfile and redis_ssl_ca_certs are used as well
+    """
+    pool : Optional[WiseAgentRedisConnectionPool] = None
+    redis_db : Optional[redis.Redis] = None
+    lock : threading.Lock = threading.Lock()
+
+    DEFAULT_MAX_CONNECTIONS = 50
+    DEFAULT_POOL_TIMEOUT = 20
+    DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+    @classmethod
+    def get_redis(cls, config: Dict[str, Any]) -> redis.Redis:
+        """
+        Get the redis client backed by the shared connection pool, creating the pool on first use.
+
+        Args:
+            config (Dict[str, Any]): the registry configuration
+
+        Returns:
+            redis.Redis: the shared redis client
+        """
+        if cls.redis_db is None:
+            with cls.lock:
+                if cls.redis_db is None:
+                    cls.pool = WiseAgentRedisConnectionPool(**cls._pool_kwargs(config))
+                    cls.redis_db = redis.Redis(connection_pool=cls.pool)
+                    logging.debug(f"Created redis connection pool for {config.get('redis_host')}:{config.get('redis_port')}")
+        return cls.redis_db
+
+    @classmethod
+    def _pool_kwargs(cls, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the arguments used to create the connection pool from the given configuration.
+        """
+        kwargs = {"host": config["redis_host"], "port": config["redis_port"],
+                  "max_connections": config.get("redis_max_connections", cls.DEFAULT_MAX_CONNECTIONS),
+                  "timeout": config.get("redis_pool_timeout", cls.DEFAULT_POOL_TIMEOUT),
+                  "socket_keepalive": config.get("redis_socket_keepalive", True),
+                  "health_check_interval": config.get("redis_health_check_interval", cls.DEFAULT_HEALTH_CHECK_INTERVAL)}
+        if (config.get("redis_ssl") is True):
+            kwargs.update(connection_class=redis.SSLConnection,
+                          username=config["redis_username"], # use your Redis user. More info https://redis.io/docs/latest/operate/oss_and_stack/management/security/acl/
+                          password=config["redis_password"], # use your Redis password
+                          ssl_certfile=config["redis_ssl_certfile"],
+                          ssl_keyfile=config["redis_ssl_keyfile"],
+                          ssl_ca_certs=config["redis_ssl_ca_certs"])
+        return kwargs
+
+    @classmethod
+    def get_pool_stats(cls) -> Dict[str, Any]:
+        """
+        Get the usage statistics of the shared connection pool.
+
+        Returns:
+            Dict[str, Any]: the statistics of the pool, see WiseAgentRedisConnectionPool.get_stats, or an
+            empty dict if the pool has not been created
+        """
+        if cls.pool is None:
+            return {}
+        return cls.pool.get_stats()
+
+    @classmethod
+    def close(cls):
+        """
+        Close all the connections of the shared pool. A new pool is created on the next call to get_redis.
+        """
+        with cls.lock:
+            if cls.pool is not None:
+                cls.pool.disconnect()
+            cls.pool = None
+            cls.redis_db = None
@@ -1,8 +1,12 @@
 import logging
+import threading
+import time
 
 import pytest
 
-from wiseagents import WiseAgent, WiseAgentContext, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport
+from wiseagents import WiseAgent, WiseAgentCollaborationType, WiseAgentContext, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport
+from wiseagents.context_stores import MemoryWiseAgentContextStore, RedisWiseAgentContextStore, SQLiteWiseAgentContextStore
+from wiseagents.context_stores.wise_agent_context_store import parse_trace_id
 from wiseagents.transports.stomp import StompWiseAgentTransport
 from tests.wiseagents import assert_standard_variables_set
 
@@ -10,7 +14,16 @@ from tests.wiseagents import assert_standard_variables_set
 def run_after_all_tests():
     assert_standard_variables_set()
     yield
-    
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def context_store(request, tmp_path):
+    '''A memory or SQLite context store, independent of the one of the registry.'''
+    store = MemoryWiseAgentContextStore({}) if request.param == "memory" else \
+        SQLiteWiseAgentContextStore({"sqlite_path": str(tmp_path / "context_store.db")})
+    yield store
+    store.close()
+
 
 class TestAgent(WiseAgent):
     def __init__(self, name, metadata, transport):
@@ -73,4 +86,387 @@ def test_get_or_create_context():
         context = WiseAgentContext(name="Context1")
         assert context == WiseAgentRegistry.get_context(context.name)
     finally:
-        WiseAgentRegistry.remove_context(context.name)  
\ No newline at end of file
+        WiseAgentRegistry.remove_context(context.name)  
+
+def test_chat_completion_reads_appended_messages():
+    try:
+        context = WiseAgentRegistry.create_context("ContextHistory")
+        context.append_chat_completion({"role": "user", "content": "first"})
+        assert [{"role": "user", "content": "first"}] == WiseAgentRegistry.get_context(context.name).llm_chat_completion
+        context.append_chat_completion({"role": "assistant", "content": "second"})
+        assert ([{"role": "user", "content": "first"}, {"role": "assistant", "content": "second"}]
+                == WiseAgentRegistry.get_context(context.name).llm_chat_completion)
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_cached_chat_completion_of_a_context_registered_again():
+    store = WiseAgentRegistry.get_context_store()
+    if not isinstance(store, RedisWiseAgentContextStore):
+        pytest.skip("Only the redis context store caches the lists of the contexts")
+    try:
+        context = WiseAgentRegistry.create_context("ContextRegisteredAgain")
+        context.append_chat_completion({"role": "user", "content": "first"})
+        assert [{"role": "user", "content": "first"}] == context.llm_chat_completion
+        # another process removes the context and registers it again with a longer chat, without this process
+        # being notified yet
+        redis_key = store._list_key(context.name, "llm_chat_completion")
+        store.redis_db.delete(redis_key)
+        store.redis_db.hset(store.CONTEXTS_GENERATIONS, context.name, "another generation")
+        store.redis_db.rpush(redis_key, *[store.codec.encode({"role": "user", "content": content})
+                                          for content in ("second", "third")])
+        assert ([{"role": "user", "content": "second"}, {"role": "user", "content": "third"}]
+                == context.llm_chat_completion)
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_context_batch():
+    try:
+        context = WiseAgentRegistry.create_context("ContextBatch")
+        with context.batch():
+            context.set_route_response_to("Agent1")
+            context.set_agent_phase_assignments([["Agent2", "Agent3"], ["Agent4"]])
+            context.set_current_phase(0)
+            context.add_query("What is the answer?")
+            assert "Agent1" == context.get_route_response_to()
+            assert ["Agent2", "Agent3"] == context.get_required_agents_for_current_phase()
+            assert "What is the answer?" == context.get_current_query()
+        context = WiseAgentRegistry.get_context(context.name)
+        assert "Agent1" == context.get_route_response_to()
+        assert 0 == context.get_current_phase()
+        assert ["Agent2", "Agent3"] == context.get_required_agents_for_current_phase()
+        assert ["What is the answer?"] == context.get_queries()
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_agents_directory_reflects_changes():
+    try:
+        agent1 = TestAgent(name="Agent1", metadata=WiseAgentMetaData(description="This is a test agent"), transport=DummyTransport())
+        assert ["Agent Name: Agent1 Agent Description: This is a test agent"] == WiseAgentRegistry.get_agent_names_and_descriptions()
+        agent2 = TestAgent(name="Agent2", metadata=WiseAgentMetaData(description="This is another test agent"), transport=DummyTransport())
+        assert 2 == len(WiseAgentRegistry.get_agent_names_and_descriptions())
+        agent2.stop_agent()
+        assert ["Agent Name: Agent1 Agent Description: This is a test agent"] == WiseAgentRegistry.get_agent_names_and_descriptions()
+        assert WiseAgentRegistry.get_agent_metadata("Agent2") is None
+    finally:
+        agent1.stop_agent()
+
+
+def test_agent_replicas():
+    metadata = WiseAgentMetaData(description="This is a replicated agent")
+    replicas = [TestAgent(name="ReplicatedAgent", metadata=metadata, transport=DummyTransport()) for _ in range(3)]
+    try:
+        assert 3 == len({replica.instance_id for replica in replicas})
+        assert set(WiseAgentRegistry.get_agent_instances("ReplicatedAgent")) == {replica.instance_id for replica in replicas}
+        assert 3 == WiseAgentRegistry.get_agent_replica_counts()["ReplicatedAgent"]
+        with pytest.raises(NameError):
+            TestAgent(name="ReplicatedAgent", metadata=WiseAgentMetaData(description="This is another agent"),
+                      transport=DummyTransport())
+
+        replicas.pop().stop_agent()
+        assert 2 == WiseAgentRegistry.get_agent_replica_counts()["ReplicatedAgent"]
+        assert metadata == WiseAgentRegistry.get_agent_metadata("ReplicatedAgent")
+
+        # an instance whose process died stops sending heartbeats and expires
+        crashed = replicas.pop()
+        WiseAgentRegistry.get_context_store().touch_agent_instances({("ReplicatedAgent", crashed.instance_id): metadata}, 0)
+        assert crashed.instance_id not in WiseAgentRegistry.get_agent_instances("ReplicatedAgent")
+        assert [("ReplicatedAgent", crashed.instance_id)] == WiseAgentRegistry.sweep_agent_instances()
+        assert 1 == len(WiseAgentRegistry.get_agent_instances("ReplicatedAgent", include_expired=True))
+        crashed.stop_agent()
+        assert metadata == WiseAgentRegistry.get_agent_metadata("ReplicatedAgent")
+
+        replicas.pop().stop_agent()
+        assert WiseAgentRegistry.get_agent_metadata("ReplicatedAgent") is None
+        assert "ReplicatedAgent" not in WiseAgentRegistry.get_agent_replica_counts()
+    finally:
+        for replica in replicas:
+            replica.stop_agent()
+
+
+def test_heartbeat_registers_again_expired_instances():
+    metadata = WiseAgentMetaData(description="This is a paused agent")
+    agent = TestAgent(name="PausedAgent", metadata=metadata, transport=DummyTransport())
+    try:
+        # the last instance of the agent was swept while its process was paused
+        WiseAgentRegistry.get_context_store().unregister_agent_instance("PausedAgent", agent.instance_id)
+        assert WiseAgentRegistry.get_agent_metadata("PausedAgent") is None
+        WiseAgentRegistry.get_context_store().touch_agent_instances(
+            {("PausedAgent", agent.instance_id): metadata}, time.time())
+        assert metadata == WiseAgentRegistry.get_agent_metadata("PausedAgent")
+        assert [agent.instance_id] == list(WiseAgentRegistry.get_agent_instances("PausedAgent"))
+        # an instance which sent a heartbeat since it was found expired is kept
+        assert not WiseAgentRegistry.get_context_store().expire_agent_instance("PausedAgent", agent.instance_id,
+                                                                               time.time() - 60)
+        assert [agent.instance_id] == list(WiseAgentRegistry.get_agent_instances("PausedAgent"))
+    finally:
+        agent.stop_agent()
+
+
+def test_concurrent_phase_barrier():
+    try:
+        agent_names = [f"Agent{i}" for i in range(12)]
+        context = WiseAgentRegistry.create_context("ContextBarrier")
+        context.set_agent_phase_assignments([agent_names])
+        context.set_current_phase(0)
+        remaining = []
+        threads = [threading.Thread(target=lambda name=name: remaining.append(context.remove_required_agent_for_current_phase(name)))
+                   for name in agent_names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert list(range(len(agent_names))) == sorted(remaining)
+        assert [] == context.get_required_agents_for_current_phase()
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_context_snapshot():
+    try:
+        context = WiseAgentRegistry.create_context("ContextSnapshot")
+        with context.batch():
+            context.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
+            context.set_agents_sequence(["Agent1", "Agent2"])
+            context.set_route_response_to("Client")
+            context.add_query("What is the answer?")
+        snapshot = context.snapshot()
+        context.set_route_response_to("AnotherClient")
+        assert WiseAgentCollaborationType.SEQUENTIAL == snapshot.collaboration_type
+        assert "Agent2" == snapshot.get_next_agent_in_sequence("Agent1")
+        assert snapshot.get_next_agent_in_sequence("Agent2") is None
+        assert "Client" == snapshot.get_route_response_to()
+        assert "What is the answer?" == snapshot.get_current_query()
+        assert not snapshot.get_restart_sequence()
+        with pytest.raises(AttributeError):
+            snapshot._fields = {}
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+def test_remove_context_merges_chat_to_parent():
+    try:
+        parent = WiseAgentRegistry.create_context("ContextMergeParent")
+        parent.append_chat_completion({"role": "user", "content": "parent"})
+        child = WiseAgentRegistry.create_sub_context(parent.name, "child")
+        child.append_chat_completion({"role": "user", "content": "first"})
+        child.append_chat_completion({"role": "assistant", "content": "second"})
+        merged = WiseAgentRegistry.remove_context(child.name, merge_chat_to_parent=True)
+        assert "ContextMergeParent" == merged.name
+        assert not WiseAgentRegistry.does_context_exist(child.name)
+        assert [{"role": "user", "content": "parent"}, {"role": "user", "content": "first"},
+                {"role": "assistant", "content": "second"}] == parent.llm_chat_completion
+        child = WiseAgentRegistry.create_sub_context(parent.name, "summarized")
+        child.append_chat_completion({"role": "user", "content": "third"})
+        WiseAgentRegistry.remove_context(child.name, merge_chat_to_parent=True,
+                                         chat_summarizer=lambda messages: [{"role": "assistant",
+                                                                            "content": f"{len(messages)} messages"}])
+        assert {"role": "assistant", "content": "1 messages"} == parent.llm_chat_completion[-1]
+    finally:
+        WiseAgentRegistry.remove_context(parent.name)
+
+def test_sqlite_context_store_survives_restart(tmp_path):
+    config = {"sqlite_path": str(tmp_path / "context_store.db")}
+    store = SQLiteWiseAgentContextStore(config)
+    try:
+        store.append_to_list("ContextSQLite", "llm_chat_completion", {"role": "user", "content": "first"})
+        store.set_field("ContextSQLite", "current_phase", 0)
+        store.replace_list("ContextSQLite", "required_agents_for_current_phase", ["Agent1", "Agent2"])
+        assert 1 == store.remove_from_list("ContextSQLite", "required_agents_for_current_phase", "Agent1")
+    finally:
+        store.close()
+    store = SQLiteWiseAgentContextStore(config)
+    try:
+        assert [{"role": "user", "content": "first"}] == store.get_list("ContextSQLite", "llm_chat_completion")
+        assert 0 == store.get_field("ContextSQLite", "current_phase")
+        assert ["Agent2"] == store.get_list("ContextSQLite", "required_agents_for_current_phase")
+    finally:
+        store.close()
+
+
+def _traced(messages):
+    '''The string representations of traced messages, as kept by the SQLite store.'''
+    return [message if isinstance(message, str) else repr(message) for message in messages]
+
+
+def test_message_trace_keeps_the_most_recent_messages(context_store):
+    messages = [WiseAgentMessage(f"message {i}", sender="Agent1", context_name="ContextTrace") for i in range(5)]
+    for message in messages:
+        context_store.trace("ContextTrace", message, 3)
+    expected = [repr(message) for message in messages[2:]]
+    assert expected == _traced(context_store.get_trace_tail("ContextTrace", 10))
+    assert expected[1:] == _traced(context_store.get_trace_tail("ContextTrace", 2))
+    entries = context_store.get_trace_range("ContextTrace")
+    assert expected == _traced(message for _, message in entries)
+    ids = [parse_trace_id(entry_id, None)[0] for entry_id, _ in entries]
+    assert sorted(set(ids)) == ids
+    assert expected[2:] == _traced(message for _, message in
+                                   context_store.get_trace_range("ContextTrace", f"({entries[1][0]}"))
+    assert expected[1:2] == _traced(message for _, message in
+                                    context_store.get_trace_range("ContextTrace", entries[1][0], entries[1][0]))
+    assert expected[:2] == _traced(message for _, message in context_store.get_trace_range("ContextTrace", count=2))
+
+
+def test_message_trace_tail():
+    try:
+        context = WiseAgentContext(name="ContextTraceTail", config={"trace_enabled": True, "trace_max_length": 3})
+        messages = [WiseAgentMessage(f"message {i}", sender="Agent1", context_name=context.name) for i in range(2)]
+        for message in messages:
+            context.trace(message)
+        assert [] == context.get_message_trace_tail(0)
+        assert [repr(messages[1])] == _traced(context.get_message_trace_tail(1))
+        assert [repr(message) for message in messages] == _traced(context.message_trace)
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+class _StoredContext():
+    '''A context registered directly in a context store, without the registry.'''
+    def __init__(self, name, version=0):
+        self.name = name
+        self.version = version
+
+
+def test_expired_context_names(context_store):
+    for name in ("ContextExpiry", "ContextExpiry_old", "ContextExpiry_idle", "ContextExpiry_recent"):
+        context_store.register_context(_StoredContext(name), 0 if name.endswith("old") or "_" not in name else 50)
+    context_store.touch_context("ContextExpiry_recent", 95)
+    context_store.touch_context("ContextExpiry", 95)
+    assert ["ContextExpiry_old"] == context_store.get_expired_context_names(100, None, 100)
+    assert ["ContextExpiry_idle", "ContextExpiry_old"] == sorted(context_store.get_expired_context_names(None, 30, 100))
+    assert ["ContextExpiry_idle", "ContextExpiry_old"] == sorted(context_store.get_expired_context_names(100, 30, 100))
+    assert ["ContextExpiry_idle", "ContextExpiry_old", "ContextExpiry_recent"] == \
+        sorted(context_store.get_expired_context_names(None, 30, 200))
+    assert [] == context_store.get_expired_context_names(None, None, 200)
+
+
+def test_sweep_contexts(monkeypatch):
+    WiseAgentRegistry.get_context_store()
+    monkeypatch.setitem(WiseAgentRegistry.config, "context_ttl", 120)
+    monkeypatch.setitem(WiseAgentRegistry.config, "context_idle_timeout", 30)
+    try:
+        now = time.time()
+        root = WiseAgentRegistry.create_context("ContextSweep")
+        old = WiseAgentRegistry.create_sub_context(root.name, "old")
+        recent = WiseAgentRegistry.create_sub_context(root.name, "recent")
+        WiseAgentRegistry.get_context_store().touch_context(recent.name, now + 50)
+        assert [old.name] == WiseAgentRegistry.sweep_contexts(now + 60)
+        assert not WiseAgentRegistry.does_context_exist(old.name)
+        assert WiseAgentRegistry.does_context_exist(recent.name)
+        # the sub contexts expire once older than context_ttl, even if recently accessed
+        assert [recent.name] == WiseAgentRegistry.sweep_contexts(now + 125)
+        assert [] == WiseAgentRegistry.sweep_contexts(now + 1000)
+        assert WiseAgentRegistry.does_context_exist(root.name)
+    finally:
+        for name in ("ContextSweep_old", "ContextSweep_recent", "ContextSweep"):
+            if WiseAgentRegistry.does_context_exist(name):
+                WiseAgentRegistry.remove_context(name)
+
+
+def test_context_sweeper(monkeypatch):
+    WiseAgentRegistry.get_context_store()
+    monkeypatch.setattr(WiseAgentRegistry, "context_sweeper_thread", None)
+    WiseAgentRegistry._start_context_sweeper()
+    # nothing to sweep without context_ttl and context_idle_timeout
+    assert WiseAgentRegistry.context_sweeper_thread is None
+    monkeypatch.setitem(WiseAgentRegistry.config, "context_ttl", 0.2)
+    monkeypatch.setitem(WiseAgentRegistry.config, "context_sweep_interval", 0.05)
+    try:
+        root = WiseAgentRegistry.create_context("ContextSweeper")
+        sub_context = WiseAgentRegistry.create_sub_context(root.name, "expiring")
+        WiseAgentRegistry._start_context_sweeper()
+        assert WiseAgentRegistry.context_sweeper_thread.is_alive()
+        for _ in range(500):
+            if not WiseAgentRegistry.does_context_exist(sub_context.name):
+                break
+            time.sleep(0.01)
+        assert not WiseAgentRegistry.does_context_exist(sub_context.name)
+        assert WiseAgentRegistry.does_context_exist(root.name)
+    finally:
+        for name in ("ContextSweeper_expiring", "ContextSweeper"):
+            if WiseAgentRegistry.does_context_exist(name):
+                WiseAgentRegistry.remove_context(name)
+
+
+def test_concurrent_remove_from_list(context_store):
+    agent_names = [f"Agent{i}" for i in range(12)]
+    context_store.replace_list("ContextBarrier", "required_agents_for_current_phase", agent_names)
+    start = threading.Barrier(len(agent_names))
+    remaining = []
+
+    def remove(name):
+        start.wait()
+        remaining.append(context_store.remove_from_list("ContextBarrier", "required_agents_for_current_phase", name))
+
+    threads = [threading.Thread(target=remove, args=(name,)) for name in agent_names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # exactly one of the agents sees the barrier of the phase open
+    assert 1 == remaining.count(0)
+    assert list(range(len(agent_names))) == sorted(remaining)
+    assert [] == context_store.get_list("ContextBarrier", "required_agents_for_current_phase")
+
+
+class _InvalidatedDuringRead():
+    '''A redis client calling invalidate after reading a context, before the context is cached.'''
+    def __init__(self, redis_db, invalidate):
+        self._redis_db = redis_db
+        self._invalidate = invalidate
+
+    def hget(self, *args, **kwargs):
+        value = self._redis_db.hget(*args, **kwargs)
+        self._invalidate()
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._redis_db, name)
+
+
+def test_cached_context_changed_by_another_store(monkeypatch):
+    store = WiseAgentRegistry.get_context_store()
+    if not isinstance(store, RedisWiseAgentContextStore):
+        pytest.skip("Only the redis context store caches the contexts")
+    # another process, with its own cache
+    other_store = RedisWiseAgentContextStore(WiseAgentRegistry.config)
+    name = "ContextCachedElsewhere"
+
+    def wait_until_evicted():
+        for _ in range(500):
+            if name not in store._context_cache:
+                return
+            time.sleep(0.01)
+        assert name not in store._context_cache
+
+    try:
+        other_store.register_context(_StoredContext(name, 1), time.time())
+        assert 1 == store.get_context(name).version
+        assert name in store._context_cache
+        other_store.remove_context(name)
+        wait_until_evicted()
+        assert store.get_context(name) is None
+        other_store.register_context(_StoredContext(name, 2), time.time())
+        assert 2 == store.get_context(name).version
+        other_store.remove_context(name)
+        other_store.register_context(_StoredContext(name, 3), time.time())
+        wait_until_evicted()
+        assert 3 == store.get_context(name).version
+
+        # the context is registered again while being read from redis, after being evicted
+        def register_again():
+            other_store.remove_context(name)
+            other_store.register_context(_StoredContext(name, 4), time.time())
+            store._on_context_changed({"data": name.encode("utf-8")})
+
+        store._context_cache.pop(name, None)
+        with monkeypatch.context() as patch:
+            patch.setattr(store, "redis_db", _InvalidatedDuringRead(store.redis_db, register_again))
+            assert 3 == store.get_context(name).version
+        assert name not in store._context_cache
+        assert 4 == store.get_context(name).version
+    finally:
+        if other_store.context_exists(name):
+            other_store.remove_context(name)
+        other_store.close()
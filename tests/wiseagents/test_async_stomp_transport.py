@@ -0,0 +1,268 @@
+import asyncio
+import threading
+from typing import List, Optional
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from wiseagents import AsyncWiseAgent, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry
+from wiseagents.transports import AsyncStompWiseAgentTransport
+from wiseagents.transports import claim_check
+from wiseagents.transports.async_stomp import AsyncWiseAgentStompConnection, encode_frame, read_frame
+
+
+class FakeStompBroker():
+    '''A STOMP broker delivering each message to all the subscriptions of its destination.'''
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.subscription_headers = []
+        self.acks = []
+        self.connections = 0
+        self.messages = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                command, headers, body = await read_frame(reader)
+                if command == "CONNECT":
+                    writer.write(encode_frame("CONNECTED", {"version": "1.2", "heart-beat": "0,0"}))
+                elif command == "SUBSCRIBE":
+                    self.subscriptions[(writer, headers["id"])] = headers["destination"]
+                    self.subscription_headers.append(headers)
+                elif command in ("ACK", "NACK"):
+                    self.acks.append((command, headers["id"]))
+                elif command == "UNSUBSCRIBE":
+                    self.subscriptions.pop((writer, headers["id"]), None)
+                elif command == "SEND":
+                    for (subscriber, subscription_id), destination in list(self.subscriptions.items()):
+                        if destination == headers["destination"]:
+                            self.messages += 1
+                            message_headers = {key: value for key, value in headers.items() if key != "content-length"}
+                            message_headers["subscription"] = subscription_id
+                            message_headers["message-id"] = message_headers["ack"] = str(self.messages)
+                            if body == b"malformed":
+                                subscriber.write(b"MESSAGE\ncontent-length:malformed\n\n\x00")
+                                continue
+                            subscriber.write(encode_frame("MESSAGE", message_headers, body))
+                elif command == "DISCONNECT":
+                    break
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+class EchoAsyncAgent(AsyncWiseAgent):
+
+    def __init__(self, name: str, port: int, **transport_options):
+        self.response_received : Optional[WiseAgentMessage] = None
+        self.response_event = asyncio.Event()
+        super().__init__(name, WiseAgentMetaData(description=name),
+                         AsyncStompWiseAgentTransport(host="127.0.0.1", port=port, agent_name=name,
+                                                      **{"compression_threshold": 1024, **transport_options}))
+
+    async def process_request(self, request: WiseAgentMessage,
+                              conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
+        await asyncio.sleep(0)
+        return f"echo {request.message}"
+
+    async def process_response(self, message: WiseAgentMessage) -> bool:
+        self.response_received = message
+        self.response_event.set()
+        return True
+
+    async def process_event(self, event) -> bool:
+        return True
+
+    async def process_error(self, error) -> bool:
+        return True
+
+
+def test_async_agents_exchange_messages():
+    async def exchange():
+        broker = FakeStompBroker()
+        server = await asyncio.start_server(broker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        agents = [EchoAsyncAgent("AsyncAgent1", port), EchoAsyncAgent("AsyncAgent2", port)]
+        context = WiseAgentRegistry.create_context("AsyncContext")
+        try:
+            for agent in agents:
+                await agent.start_agent()
+            # the agents of the event loop share a single connection
+            assert 1 == broker.connections
+            await agents[0].send_request(WiseAgentMessage("hello", context_name=context.name), "AsyncAgent2")
+            await asyncio.wait_for(agents[0].response_event.wait(), 5)
+            assert "echo hello" == agents[0].response_received.message
+            assert "AsyncAgent2" == agents[0].response_received.sender
+            # the messages above the compression threshold are compressed and decompressed transparently
+            agents[0].response_event.clear()
+            await agents[0].send_request(WiseAgentMessage("hello " * 1000, context_name=context.name), "AsyncAgent2")
+            await asyncio.wait_for(agents[0].response_event.wait(), 5)
+            assert "echo " + "hello " * 1000 == agents[0].response_received.message
+        finally:
+            for agent in agents:
+                await agent.stop_agent()
+            WiseAgentRegistry.remove_context(context.name)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(exchange())
+
+
+def test_async_agents_are_not_blocked_by_the_context_store(monkeypatch):
+    release = threading.Event()
+    get_context = WiseAgentRegistry.get_context
+
+    def slow_get_context(context_name):
+        # a store round trip which takes until the test releases it
+        if context_name == "AsyncBlockedContext":
+            release.wait(5)
+        return get_context(context_name)
+
+    monkeypatch.setattr(WiseAgentRegistry, "get_context", slow_get_context)
+
+    async def exchange():
+        broker = FakeStompBroker()
+        server = await asyncio.start_server(broker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        agents = [EchoAsyncAgent(f"AsyncAgent{i}", port) for i in range(1, 4)]
+        contexts = [WiseAgentRegistry.create_context("AsyncBlockedContext"),
+                    WiseAgentRegistry.create_context("AsyncFreeContext")]
+        try:
+            for agent in agents:
+                await agent.start_agent()
+            await agents[0].transport.send_request(WiseAgentMessage("blocked", context_name="AsyncBlockedContext",
+                                                                    sender="AsyncAgent1"), "AsyncAgent2")
+            await agents[0].send_request(WiseAgentMessage("free", context_name="AsyncFreeContext"), "AsyncAgent3")
+            # AsyncAgent3 handles its request while AsyncAgent2 is waiting for the store
+            await asyncio.wait_for(agents[0].response_event.wait(), 2)
+            assert "echo free" == agents[0].response_received.message
+            assert not release.is_set()
+            agents[0].response_event.clear()
+            release.set()
+            await asyncio.wait_for(agents[0].response_event.wait(), 5)
+            assert "echo blocked" == agents[0].response_received.message
+        finally:
+            release.set()
+            for agent in agents:
+                await agent.stop_agent()
+            for context in contexts:
+                WiseAgentRegistry.remove_context(context.name)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(exchange())
+
+
+def test_async_messages_are_acknowledged_once_handled():
+    async def exchange():
+        broker = FakeStompBroker()
+        server = await asyncio.start_server(broker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = AsyncWiseAgentStompConnection("127.0.0.1", port)
+        handled = []
+
+        async def handler(headers, body):
+            handled.append(body)
+            if body == b"bad":
+                raise ValueError("failed")
+
+        try:
+            await connection.subscribe("/queue/acks", handler, "client-individual", {"activemq.prefetchSize": "2"})
+            await connection.send("/queue/acks", "good")
+            await connection.send("/queue/acks", "bad")
+            for _ in range(500):
+                if len(broker.acks) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert "client-individual" == broker.subscription_headers[-1]["ack"]
+            assert "2" == broker.subscription_headers[-1]["activemq.prefetchSize"]
+            assert [b"good", b"bad"] == handled
+            # the message whose handler raised an exception is rejected, to be delivered again
+            assert [("ACK", "1"), ("NACK", "2")] == broker.acks
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(exchange())
+
+
+def test_async_connection_reconnects_after_a_malformed_frame():
+    async def exchange():
+        broker = FakeStompBroker()
+        server = await asyncio.start_server(broker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = AsyncWiseAgentStompConnection("127.0.0.1", port)
+        handled = []
+
+        async def handler(headers, body):
+            handled.append(body)
+
+        try:
+            await connection.subscribe("/queue/malformed", handler)
+            await connection.send("/queue/malformed", "malformed")
+            for _ in range(500):
+                if broker.connections == 2 and connection._connected.is_set():
+                    break
+                await asyncio.sleep(0.01)
+            assert 2 == broker.connections
+            # the subscription is renewed on the new connection
+            await connection.send("/queue/malformed", "good")
+            for _ in range(500):
+                if handled:
+                    break
+                await asyncio.sleep(0.01)
+            assert [b"good"] == handled
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(exchange())
+
+
+def test_async_claim_checks_run_off_the_event_loop(monkeypatch, tmp_path):
+    store_threads = []
+    put = claim_check.FileWiseAgentClaimCheckStore.put
+    get = claim_check.FileWiseAgentClaimCheckStore.get
+
+    def recording_put(self, data):
+        store_threads.append(threading.current_thread())
+        return put(self, data)
+
+    def recording_get(self, key):
+        store_threads.append(threading.current_thread())
+        return get(self, key)
+
+    monkeypatch.setattr(claim_check.FileWiseAgentClaimCheckStore, "put", recording_put)
+    monkeypatch.setattr(claim_check.FileWiseAgentClaimCheckStore, "get", recording_get)
+
+    async def exchange():
+        broker = FakeStompBroker()
+        server = await asyncio.start_server(broker.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        options = {"claim_check_threshold": 1024, "claim_check_store": "file", "claim_check_directory": str(tmp_path)}
+        agents = [EchoAsyncAgent("AsyncClaimAgent1", port, **options),
+                  EchoAsyncAgent("AsyncClaimAgent2", port, **options)]
+        context = WiseAgentRegistry.create_context("AsyncClaimContext")
+        try:
+            for agent in agents:
+                await agent.start_agent()
+            document = "The weather in Rome is sunny. " * 1000
+            await agents[0].send_request(WiseAgentMessage(document, context_name=context.name), "AsyncClaimAgent2")
+            await asyncio.wait_for(agents[0].response_event.wait(), 5)
+            assert "echo " + document == agents[0].response_received.message
+        finally:
+            for agent in agents:
+                await agent.stop_agent()
+            WiseAgentRegistry.remove_context(context.name)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(exchange())
+    # the request and the response are both stored and loaded, never by the thread of the event loop
+    assert 4 == len(store_threads)
+    assert threading.main_thread() not in store_threads
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from wiseagents import WiseAgentMessage, WiseAgentRegistry
+from wiseagents.transports import RedisStreamsWiseAgentTransport
+
+
+@pytest.fixture
+def redis_registry():
+    if WiseAgentRegistry.get_config().get("redis_host") is None:
+        pytest.skip("The Redis streams transport requires the registry to be configured with a redis server")
+    yield
+
+
+def test_replicas_consume_the_stream_of_their_agent(redis_registry):
+    received = {}
+    lock = threading.Lock()
+    delivered = threading.Event()
+    replicas = [RedisStreamsWiseAgentTransport(agent_name="StreamsAgent", block_timeout=0.1) for _ in range(2)]
+    sender = RedisStreamsWiseAgentTransport(agent_name="StreamsClient", block_timeout=0.1)
+    responses = []
+    for replica in replicas:
+        def request_receiver(message, replica=replica):
+            with lock:
+                received.setdefault(replica.consumer_name, []).append(message.message)
+                if sum(len(messages) for messages in received.values()) == 20:
+                    delivered.set()
+            replica.send_response(WiseAgentMessage(f"done {message.message}", context_name=message.context_name),
+                                  message.sender)
+        replica.set_call_backs(request_receiver=request_receiver)
+        replica.start()
+    sender.set_call_backs(response_receiver=lambda message: responses.append(message.message))
+    sender.start()
+    try:
+        for i in range(20):
+            sender.send_request(WiseAgentMessage(f"request {i}", context_name=f"Context{i}", sender="StreamsClient"),
+                                "StreamsAgent")
+        assert delivered.wait(5)
+        # each request is handled by exactly one of the replicas
+        assert sorted(f"request {i}" for i in range(20)) == sorted(sum(received.values(), []))
+        for _ in range(500):
+            if len(responses) == 20 and replicas[0].get_pending_counts()[replicas[0].request_stream] == 0:
+                break
+            time.sleep(0.01)
+        assert 20 == len(responses)
+        assert 0 == replicas[0].get_pending_counts()[replicas[0].request_stream]
+    finally:
+        for transport in replicas + [sender]:
+            transport.stop()
+
+
+def test_failed_messages_are_claimed_again_then_dead_lettered(redis_registry):
+    attempts = []
+    transport = RedisStreamsWiseAgentTransport(agent_name="FailingStreamsAgent", block_timeout=0.05,
+                                               claim_idle_time=0.1, max_deliveries=3)
+
+    def request_receiver(message):
+        attempts.append(message.message)
+        raise ValueError("failed")
+
+    transport.set_call_backs(request_receiver=request_receiver)
+    transport.start()
+    try:
+        transport.send_request(WiseAgentMessage("poison", context_name="default"), "FailingStreamsAgent")
+        dead_stream = transport.request_stream + ":dead"
+        for _ in range(500):
+            if transport._redis().xlen(dead_stream) == 1:
+                break
+            time.sleep(0.01)
+        assert 1 == transport._redis().xlen(dead_stream)
+        assert ["poison"] * 3 == attempts
+        assert 0 == transport.get_pending_counts()[transport.request_stream]
+    finally:
+        transport.stop()
+
+
+def test_messages_in_flight_are_not_claimed(redis_registry):
+    handled = []
+    transport = RedisStreamsWiseAgentTransport(agent_name="SlowStreamsAgent", block_timeout=0.05, workers=1,
+                                               claim_idle_time=0.1, max_deliveries=2)
+    other_replica = RedisStreamsWiseAgentTransport(agent_name="SlowStreamsAgent", block_timeout=0.05,
+                                                   claim_idle_time=0.1, max_deliveries=2)
+
+    def request_receiver(message):
+        handled.append(message.message)
+        # much longer than claim_idle_time, while the other messages wait for the single worker
+        time.sleep(0.3)
+
+    transport.set_call_backs(request_receiver=request_receiver)
+    transport.start()
+    try:
+        for i in range(3):
+            transport.send_request(WiseAgentMessage(f"request {i}", context_name=f"Context{i}"), "SlowStreamsAgent")
+        time.sleep(0.1)
+        other_replica.set_call_backs(request_receiver=request_receiver)
+        other_replica.start()
+        for _ in range(500):
+            if transport.get_pending_counts()[transport.request_stream] == 0:
+                break
+            time.sleep(0.01)
+        assert sorted(f"request {i}" for i in range(3)) == sorted(handled)
+        assert 0 == transport._redis().xlen(transport.request_stream + ":dead")
+    finally:
+        for replica in (transport, other_replica):
+            replica.stop()
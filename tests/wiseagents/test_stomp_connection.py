@@ -0,0 +1,289 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import stomp.utils
+
+from wiseagents import WiseAgentMessage
+from wiseagents.transports import StompWiseAgentTransport, WiseAgentStompConnectionManager
+from wiseagents.transports import claim_check, stomp_connection
+
+
+class FakeStompConnection():
+    '''A stomp.Connection looping the messages sent back to the subscriptions, without any broker.'''
+
+    instances = []
+
+    def __init__(self, host_and_ports, heartbeats, auto_decode):
+        self.connected = False
+        self.subscriptions = {}
+        self.listener = None
+        self.acks = []
+        self.message_count = 0
+        self.sent_bodies = []
+        FakeStompConnection.instances.append(self)
+
+    def set_listener(self, name, listener):
+        self.listener = listener
+
+    def connect(self, username, password, wait):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def subscribe(self, destination, id, ack, headers):
+        self.subscriptions[id] = destination
+
+    def ack(self, id, subscription):
+        self.acks.append(("ack", id))
+
+    def nack(self, id, subscription):
+        self.acks.append(("nack", id))
+
+    def unsubscribe(self, id):
+        del self.subscriptions[id]
+
+    def send(self, body, destination, content_type, headers):
+        self.sent_bodies.append(body)
+        for subscription_id, subscribed_destination in list(self.subscriptions.items()):
+            if subscribed_destination == destination:
+                self.message_count += 1
+                # the bodies are received as bytes, since the connection doesn't decode them
+                self.listener.on_message(stomp.utils.Frame("MESSAGE", {"subscription": subscription_id,
+                                                                       "message-id": str(self.message_count),
+                                                                       "destination": destination,
+                                                                       "content-type": content_type,
+                                                                       **(headers or {})},
+                                                           body.encode("utf-8") if isinstance(body, str) else body))
+
+
+def test_transports_share_one_connection(monkeypatch):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    FakeStompConnection.instances = []
+    received = {}
+    delivered = threading.Event()
+    transports = [StompWiseAgentTransport(host="localhost", port=61616, agent_name=f"SharedAgent{i}") for i in range(3)]
+    for transport in transports:
+        def request_receiver(message, agent_name=transport.agent_name):
+            received[agent_name] = message
+            if len(received) == 2:
+                delivered.set()
+        transport.set_call_backs(request_receiver=request_receiver)
+        transport.start()
+    try:
+        assert 1 == len(FakeStompConnection.instances)
+        assert 6 == len(FakeStompConnection.instances[0].subscriptions)
+        transports[0].send_request(WiseAgentMessage("first", context_name="default", sender="SharedAgent0"), "SharedAgent1")
+        transports[0].send_request(WiseAgentMessage("second", context_name="default", sender="SharedAgent0"), "SharedAgent2")
+        assert delivered.wait(5)
+        assert "first" == received["SharedAgent1"].message
+        assert "second" == received["SharedAgent2"].message
+        # the connection is renewed with all its subscriptions after being lost
+        FakeStompConnection.instances[0].subscriptions.clear()
+        FakeStompConnection.instances[0].connected = False
+        transports[1].send_request(WiseAgentMessage("third", context_name="default", sender="SharedAgent1"), "SharedAgent0")
+        assert 6 == len(FakeStompConnection.instances[0].subscriptions)
+    finally:
+        for transport in transports:
+            transport.stop()
+    assert not FakeStompConnection.instances[0].is_connected()
+    assert {} == WiseAgentStompConnectionManager.connections
+
+
+def test_messages_are_acknowledged_once_handled(monkeypatch):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    FakeStompConnection.instances = []
+    handled = threading.Event()
+    release = threading.Event()
+
+    def request_receiver(message):
+        release.wait(5)
+        if message.message == "fail":
+            raise ValueError("failed")
+        handled.set()
+
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="AckAgent")
+    transport.set_call_backs(request_receiver=request_receiver)
+    transport.start()
+    try:
+        connection = FakeStompConnection.instances[0]
+        transport.send_request(WiseAgentMessage("work", context_name="default"), "AckAgent")
+        # the message is acknowledged only once handled
+        assert [] == connection.acks
+        release.set()
+        assert handled.wait(5)
+        transport.send_request(WiseAgentMessage("fail", context_name="default"), "AckAgent")
+        for _ in range(500):
+            if len(connection.acks) == 2:
+                break
+            threading.Event().wait(0.01)
+        assert [("ack", "1"), ("nack", "2")] == connection.acks
+    finally:
+        transport.stop()
+
+
+def test_agents_waiting_for_acknowledgements_do_not_hold_delivery_threads(monkeypatch):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(WiseAgentStompConnectionManager, "executor", executor)
+    FakeStompConnection.instances = []
+    release = threading.Event()
+    handled = []
+    idle_handled = threading.Event()
+
+    def blocked_receiver(message):
+        release.wait(5)
+        handled.append(message.message)
+
+    blocked = [StompWiseAgentTransport(host="localhost", port=61616, agent_name=f"BlockedAgent{i}", max_in_flight=1)
+               for i in range(2)]
+    idle = StompWiseAgentTransport(host="localhost", port=61616, agent_name="IdleAgent")
+    for transport in blocked:
+        transport.set_call_backs(request_receiver=blocked_receiver)
+    idle.set_call_backs(request_receiver=lambda message: idle_handled.set())
+    for transport in blocked + [idle]:
+        transport.start()
+    try:
+        # each blocked agent has a message being handled and another waiting for it to be acknowledged
+        for transport in blocked:
+            for i in range(2):
+                idle.send_request(WiseAgentMessage(f"{transport.agent_name}-{i}", context_name="default"),
+                                  transport.agent_name)
+        idle.send_request(WiseAgentMessage("idle", context_name="default"), "IdleAgent")
+        assert idle_handled.wait(5)
+        release.set()
+        for _ in range(500):
+            if len(handled) == 4:
+                break
+            threading.Event().wait(0.01)
+        assert ["BlockedAgent0-0", "BlockedAgent0-1", "BlockedAgent1-0", "BlockedAgent1-1"] == sorted(handled)
+        for _ in range(500):
+            if len(FakeStompConnection.instances[0].acks) == 5:
+                break
+            threading.Event().wait(0.01)
+        assert 5 == len([ack for ack in FakeStompConnection.instances[0].acks if ack[0] == "ack"])
+    finally:
+        release.set()
+        for transport in blocked + [idle]:
+            transport.stop()
+        executor.shutdown()
+
+
+def test_agents_with_a_full_queue_do_not_hold_delivery_threads(monkeypatch):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(WiseAgentStompConnectionManager, "executor", executor)
+    FakeStompConnection.instances = []
+    release = threading.Event()
+    handled = []
+    idle_handled = threading.Event()
+
+    def blocked_receiver(message):
+        release.wait(5)
+        handled.append(message.message)
+
+    blocked = [StompWiseAgentTransport(host="localhost", port=61616, agent_name=f"FullAgent{i}", ack_mode="auto",
+                                       max_queue_size=1) for i in range(2)]
+    idle = StompWiseAgentTransport(host="localhost", port=61616, agent_name="IdleAgent", ack_mode="auto")
+    for transport in blocked:
+        transport.set_call_backs(request_receiver=blocked_receiver)
+    idle.set_call_backs(request_receiver=lambda message: idle_handled.set())
+    for transport in blocked + [idle]:
+        transport.start()
+    try:
+        # each blocked agent has a message being handled, another one filling its queue and a third one refused
+        for transport in blocked:
+            for i in range(3):
+                idle.send_request(WiseAgentMessage(f"{transport.agent_name}-{i}", context_name="default"),
+                                  transport.agent_name)
+        idle.send_request(WiseAgentMessage("idle", context_name="default"), "IdleAgent")
+        assert idle_handled.wait(5)
+        release.set()
+        for _ in range(500):
+            if len(handled) == 6:
+                break
+            threading.Event().wait(0.01)
+        assert [f"FullAgent{i}-{j}" for i in range(2) for j in range(3)] == sorted(handled)
+    finally:
+        release.set()
+        for transport in blocked + [idle]:
+            transport.stop()
+        executor.shutdown()
+
+
+def test_large_messages_are_compressed(monkeypatch):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    FakeStompConnection.instances = []
+    received = []
+    delivered = threading.Event()
+
+    def request_receiver(message):
+        received.append(message)
+        if len(received) == 2:
+            delivered.set()
+
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="CompressingAgent",
+                                        compression_threshold=1024)
+    transport.set_call_backs(request_receiver=request_receiver)
+    transport.start()
+    try:
+        sources = "\n".join(f"Source {i}: the weather in Rome is sunny, with a light breeze from the sea." for i in range(100))
+        transport.send_request(WiseAgentMessage("small", context_name="default"), "CompressingAgent")
+        transport.send_request(WiseAgentMessage(sources, context_name="default"), "CompressingAgent")
+        assert delivered.wait(5)
+        assert ["small", sources] == [message.message for message in received]
+        small_body, large_body = FakeStompConnection.instances[0].sent_bodies
+        assert isinstance(small_body, str)
+        assert isinstance(large_body, bytes) and len(large_body) < len(sources) / 5
+    finally:
+        transport.stop()
+
+
+def test_large_message_contents_are_claimed_lazily(monkeypatch, tmp_path):
+    monkeypatch.setattr(stomp_connection.stomp, "Connection", FakeStompConnection)
+    FakeStompConnection.instances = []
+    received = []
+    delivered = threading.Event()
+
+    def request_receiver(message):
+        received.append(message)
+        delivered.set()
+
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="ClaimCheckAgent",
+                                        claim_check_threshold=1024, claim_check_store="file",
+                                        claim_check_directory=str(tmp_path))
+    transport.set_call_backs(request_receiver=request_receiver)
+    transport.start()
+    try:
+        document = "The weather in Rome is sunny. " * 1000
+        message = WiseAgentMessage(document, context_name="default")
+        transport.send_request(message, "ClaimCheckAgent")
+        assert delivered.wait(5)
+        # only the reference to the contents goes through the broker
+        assert "sunny" not in FakeStompConnection.instances[0].sent_bodies[0]
+        assert document == message.message
+        assert 1 == len(list(tmp_path.iterdir()))
+        assert received[0]._message is None
+        assert document == received[0].message
+    finally:
+        transport.stop()
+
+
+def test_claim_check_references_are_checked(tmp_path):
+    (tmp_path / "secret").write_text("secret")
+    store = claim_check.get_claim_check_store("file", str(tmp_path / "claim_checks"))
+    key = store.put(b"contents")
+    assert b"contents" == store.get(key)
+    message = claim_check.claim(WiseAgentMessage(None, context_name="default"), f"file:{key}",
+                                str(tmp_path / "claim_checks"))
+    assert "contents" == message.message
+    for reference in ("file:../secret", f"file:{tmp_path / 'secret'}", "redis:*", f"file:{key}/.."):
+        with pytest.raises(ValueError):
+            claim_check.claim(WiseAgentMessage(None, context_name="default"), reference, str(tmp_path / "claim_checks"))
+    with pytest.raises(KeyError):
+        store.get("../secret")
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+import yaml
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+from wiseagents.transports.wire_format import (JSON_CONTENT_TYPE, YAML_WIRE_FORMAT, ZLIB_COMPRESSION, compress_body,
+                                               decode_message, decompress_body, encode_message)
+
+
+def test_json_wire_format_round_trip():
+    message = WiseAgentMessage(message="What is the weather like?", context_name="Weather", sender="Agent1",
+                               message_type=WiseAgentMessageType.QUERY, route_response_to="Client")
+    body, content_type = encode_message(message)
+    assert JSON_CONTENT_TYPE == content_type
+    decoded = decode_message(body, content_type)
+    assert "What is the weather like?" == decoded.message
+    assert "Weather" == decoded.context_name
+    assert "Agent1" == decoded.sender
+    assert WiseAgentMessageType.QUERY == decoded.message_type
+    assert decoded.tool_id is None
+    assert "Client" == decoded.route_response_to
+
+
+def test_legacy_yaml_messages_are_decoded_safely():
+    message = WiseAgentMessage(message="Hello", context_name="Weather", sender="Agent1",
+                               message_type=WiseAgentMessageType.ACK)
+    # the messages sent by the agents predating the JSON wire format have no content type
+    decoded = decode_message(yaml.dump(message))
+    assert "Hello" == decoded.message
+    assert WiseAgentMessageType.ACK == decoded.message_type
+    assert "Agent1" == decode_message(*encode_message(message, YAML_WIRE_FORMAT)).sender
+    with pytest.raises(yaml.constructor.ConstructorError):
+        decode_message("!!python/object/apply:os.system ['echo unsafe']")
+
+
+def test_bodies_above_the_threshold_are_compressed():
+    message = WiseAgentMessage(message="The weather in Rome is sunny. " * 1000, context_name="Weather")
+    body, content_type = encode_message(message)
+    assert (body, None) == compress_body(body, threshold=len(body.encode()))
+    assert (body, None) == compress_body(body, threshold=None)
+    compressed, content_encoding = compress_body(body, threshold=1024)
+    assert ZLIB_COMPRESSION == content_encoding
+    assert len(compressed) < len(body) / 10
+    assert message.message == decode_message(decompress_body(compressed, content_encoding), content_type).message
+    # bodies which don't shrink are sent as they are
+    random_body = os.urandom(2048)
+    assert (random_body, None) == compress_body(random_body, threshold=1024)
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from wiseagents.wise_agent_dispatcher import WiseAgentDispatcher
+
+
+def test_dispatcher_orders_messages_of_a_context_and_runs_contexts_in_parallel():
+    dispatcher = WiseAgentDispatcher("TestDispatcher", workers=4, max_queue_size=100)
+    handled = {"Context1": [], "Context2": []}
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def handle(context_name, i):
+        with lock:
+            assert context_name not in running
+            running.add(context_name)
+            if len(running) > 1:
+                overlapped.set()
+        time.sleep(0.005)
+        with lock:
+            running.discard(context_name)
+            handled[context_name].append(i)
+
+    try:
+        for i in range(20):
+            dispatcher.submit("Context1", handle, "Context1", i)
+            dispatcher.submit("Context2", handle, "Context2", i)
+    finally:
+        dispatcher.stop()
+    assert list(range(20)) == handled["Context1"]
+    assert list(range(20)) == handled["Context2"]
+    assert overlapped.is_set()
+    stats = dispatcher.get_stats()
+    assert 40 == stats["handled_count"]
+    assert 0 == stats["queue_depth"]
+    assert stats["max_wait_time"] >= stats["average_wait_time"] > 0
+
+
+def test_dispatcher_queue_is_bounded():
+    dispatcher = WiseAgentDispatcher("BoundedDispatcher", workers=1, max_queue_size=1)
+    release = threading.Event()
+    dispatcher.submit("Context1", release.wait)
+    # wait for the worker to take the first message, the second one then fills the queue
+    while dispatcher.get_stats()["busy_workers"] == 0:
+        time.sleep(0.001)
+    dispatcher.submit("Context2", lambda: None)
+    submitted = threading.Event()
+    threading.Thread(target=lambda: (dispatcher.submit("Context3", lambda: None), submitted.set())).start()
+    assert not submitted.wait(0.1)
+    release.set()
+    assert submitted.wait(5)
+    dispatcher.stop()
+    assert 3 == dispatcher.get_stats()["handled_count"]
+    with pytest.raises(RuntimeError):
+        dispatcher.submit("Context1", lambda: None)
+
+
+def test_dispatcher_try_submit_does_not_block():
+    dispatcher = WiseAgentDispatcher("NonBlockingDispatcher", workers=1, max_queue_size=1)
+    release = threading.Event()
+    available = threading.Event()
+    dispatcher.submit("Context1", release.wait)
+    while dispatcher.get_stats()["busy_workers"] == 0:
+        time.sleep(0.001)
+    assert dispatcher.try_submit("Context2", lambda: None)
+    assert not dispatcher.try_submit("Context3", lambda: None, on_available=available.set)
+    assert not available.is_set()
+    release.set()
+    assert available.wait(5)
+    assert dispatcher.try_submit("Context3", lambda: None)
+    dispatcher.stop()
+    assert 3 == dispatcher.get_stats()["handled_count"]
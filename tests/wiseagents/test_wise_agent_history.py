@@ -0,0 +1,54 @@
+import yaml
+
+from wiseagents import WiseAgentHistoryPolicy
+from wiseagents.yaml import WiseAgentsLoader
+
+
+def chat_history(turns: int):
+    messages = [{"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": "What is the weather like in Rome?"}]
+    for i in range(turns):
+        messages.append({"role": "assistant", "content": f"Answer {i}"})
+        messages.append({"role": "user", "content": f"Question {i}"})
+    return messages
+
+
+def test_no_limits_keeps_whole_history():
+    messages = chat_history(5)
+    assert WiseAgentHistoryPolicy().apply(messages) == messages
+
+
+def test_last_messages():
+    messages = chat_history(5)
+    assert WiseAgentHistoryPolicy(max_messages=3).apply(messages) == messages[-3:]
+
+
+def test_pinned_messages():
+    messages = chat_history(5)
+    policy = WiseAgentHistoryPolicy(max_messages=2, pin_system_message=True, pin_first_user_message=True)
+    assert policy.apply(messages) == messages[:2] + messages[-2:]
+
+
+def test_token_budget():
+    messages = chat_history(50)
+    policy = WiseAgentHistoryPolicy(max_tokens=100, pin_system_message=True)
+    history = policy.apply(messages)
+    assert history[0] == messages[0]
+    assert history[-1] == messages[-1]
+    assert len(history) < len(messages)
+    assert sum(policy.count_tokens(message) for message in history) <= 100
+
+
+def test_tool_messages_are_not_left_without_tool_call():
+    messages = [{"role": "user", "content": "What is the weather like in Rome?"},
+                {"role": "assistant", "content": None,
+                 "tool_calls": [{"id": "1", "type": "function", "function": {"name": "weather", "arguments": "{}"}}]},
+                {"role": "tool", "tool_call_id": "1", "content": "Sunny"},
+                {"role": "assistant", "content": "It is sunny"}]
+    assert WiseAgentHistoryPolicy(max_messages=2).apply(messages) == messages[-1:]
+
+
+def test_yaml_round_trip():
+    policy = WiseAgentHistoryPolicy(max_tokens=2000, pin_system_message=True)
+    policy.count_tokens({"role": "user", "content": "Hello"})
+    assert yaml.load(yaml.dump(policy), Loader=WiseAgentsLoader) == policy
@@ -2,9 +2,11 @@ import logging
 from time import sleep
 
 import pytest
+import yaml
 
-from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry
-from wiseagents.transports import StompWiseAgentTransport
+from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport
+from wiseagents.transports import InProcessWiseAgentTransport, StompWiseAgentTransport
+from wiseagents.yaml import WiseAgentsLoader
 from tests.wiseagents import assert_standard_variables_set
 
 
@@ -20,10 +22,11 @@ class WiseAgentDoingNothing(WiseAgent):
     request_received : WiseAgentMessage = None
     response_received : WiseAgentMessage = None
     
-    def __init__(self, name: str, description: str):
+    def __init__(self, name: str, description: str, transport: WiseAgentTransport = None):
         self._name = name
         self._description = description
-        transport = StompWiseAgentTransport(host='localhost', port=61616, agent_name=self.name)
+        if transport is None:
+            transport = StompWiseAgentTransport(host='localhost', port=61616, agent_name=self.name)
         super().__init__(name, WiseAgentMetaData(description), transport, None, None, None)
         
         
@@ -34,7 +37,7 @@ class WiseAgentDoingNothing(WiseAgent):
         return True
     def handle_request(self, request: WiseAgentMessage):
         self.request_received = request
-        self.send_response(WiseAgentMessage('I am doing nothing', self.name), request.sender )
+        self.send_response(WiseAgentMessage('I am doing nothing', sender=self.name, context_name=request.context_name), request.sender)
         return True
     def process_response(self, response : WiseAgentMessage):
         self.response_received = response
@@ -78,4 +81,27 @@ def test_send_message_to_agent_and_get_response():
     agent2.stop()
 
     
-    
\ No newline at end of file
+    
+
+
+def test_send_message_to_agent_in_process_and_get_response():
+    transport = yaml.load("!wiseagents.transports.InProcessWiseAgentTransport\nagent_name: InProcessAgent2\n",
+                          Loader=WiseAgentsLoader)
+    assert "InProcessAgent2" == transport.agent_name
+    agent1 = WiseAgentDoingNothing('InProcessAgent1', 'InProcessAgent1',
+                                   InProcessWiseAgentTransport(agent_name='InProcessAgent1'))
+    agent2 = WiseAgentDoingNothing('InProcessAgent2', 'InProcessAgent2', transport)
+    try:
+        request = WiseAgentMessage(message='Do Nothing', sender='InProcessAgent1', context_name='default')
+        agent1.send_request(request, dest_agent_name='InProcessAgent2')
+        for _ in range(100):
+            if agent1.response_received is not None:
+                break
+            sleep(0.01)
+        # the message is delivered as it is, without being serialized
+        assert agent2.request_received is request
+        assert agent1.response_received.message == 'I am doing nothing'
+        assert agent1.response_received.sender == 'InProcessAgent2'
+    finally:
+        agent1.stop_agent()
+        agent2.stop_agent()